@@ -15,34 +15,64 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-import configparser
-import hashlib
-import json
 import logging
 import os
 import os.path
 import platform
-import re
-import shutil
 import subprocess
 import sys
-import tempfile
-import urllib.parse
+import tarfile
+import time
 import webbrowser
 from datetime import datetime
 from pathlib import Path
-from shutil import copytree
 
 import qdarkstyle
 import requests
-from packaging.utils import Version
+from packaging.utils import InvalidVersion, Version
 
 # Import PySide6 modules before qdarkstyle to guide qtpy's binding detection
 from PySide6 import QtCore, QtGui, QtWidgets
 from PySide6.QtCore import QRunnable, QThreadPool, Slot
-from PySide6.QtWidgets import QScrollArea, QVBoxLayout, QWidget
+from PySide6.QtWidgets import QListView
 
 import mainwindow
+from buildindex import (
+    BLENDER_DOWNLOAD_URL,
+    BUILD_FILENAME_REGEX,
+    BUILD_INDEX_FILE_NAME,
+    BuildIndex,
+    BuildIndexCache,
+    host_platform,
+    latest_builds,
+)
+from configstore import ConfigStore
+from downloader import (
+    DEFAULT_CONNECTIONS,
+    DownloadCancelled,
+    default_cache_dir,
+    make_session,
+)
+from installer import INSTALL_MODE_MANAGED, INSTALL_MODE_SWAP
+from managed import CURRENT_LINK_NAME, ManagedInstalls, PrunePolicy
+from mirrors import (
+    MIRROR_RANKING_FILE_NAME,
+    MirrorSet,
+    fetch_mirrored_build_index,
+    parse_mirrors,
+)
+from pipeline import (
+    PHASE_CLEANUP,
+    PHASE_EXTRACT,
+    PHASE_INSTALL,
+    PHASE_VERIFY,
+    InstallPipeline,
+    clean_up,
+    hbytes,
+    prepare_download_path,
+    roll_back,
+    rollback_target,
+)
 
 os.environ["QT_AUTO_SCREEN_SCALE_FACTOR"] = "1"
 
@@ -56,10 +86,26 @@ CONFIG_KEY_LAST_DL_DESC = "lastdl_desc"
 CONFIG_KEY_LAST_DL_FILENAME = "lastdl_filename"
 CONFIG_KEY_INSTALLED_FILENAME = "installed_filename"
 CONFIG_KEY_OS_FILTER = "os_filter"
+CONFIG_KEY_LATEST_ONLY = "latest_only"
+CONFIG_KEY_SEARCH = "search"
+CONFIG_KEY_DOWNLOAD_CONNECTIONS = "download_connections"
+CONFIG_KEY_DOWNLOAD_CACHE = "download_cache"
+CONFIG_KEY_PIPELINED_EXTRACTION = "pipelined_extraction"
+CONFIG_KEY_EXTRACT_THREADS = "extract_threads"
+CONFIG_KEY_INSTALL_MODE = "install_mode"
+CONFIG_KEY_CONTENT_STORE = "content_store"
+CONFIG_KEY_APP_UPDATE_TTL = "app_update_ttl_hours"
+CONFIG_KEY_APP_UPDATE_VERSION = "app_update_version"
+CONFIG_KEY_APP_UPDATE_ETAG = "app_update_etag"
+CONFIG_KEY_APP_UPDATE_CHECKED = "app_update_checked"
+CONFIG_KEY_DOWNLOAD_URL = "download_url"
+CONFIG_KEY_MIRRORS = "mirrors"
+CONFIG_KEY_KEEP_BUILDS = "keep_builds"
+CONFIG_KEY_KEEP_DAYS = "keep_days"
+CONFIG_KEY_MAX_INSTALLED_GB = "max_installed_gb"
 CONFIG_FILE_NAME = "config.ini"
 
 # URLs
-BLENDER_DOWNLOAD_URL = "https://builder.blender.org/download/daily/"
 GITHUB_CHECK_URL = "https://www.github.com"
 GITHUB_RELEASES_API_URL = (
     "https://api.github.com/repos/overmindstudios/BlenderUpdater/releases/latest"
@@ -69,14 +115,25 @@ GITHUB_RELEASES_URL = (
 )
 
 # Timeouts and sizes
-DOWNLOAD_CHUNK_SIZE = 8192
 CONNECTIVITY_TIMEOUT = 5
+DEFAULT_APP_UPDATE_TTL_HOURS = 24
+SEARCH_DEBOUNCE_MS = 120
+CONFIG_SAVE_DELAY_MS = 1000
 BUILD_CHECK_TIMEOUT = 15
-DOWNLOAD_TIMEOUT = 10
 
 # Sentinel value used to distinguish user cancellation from errors
 CANCEL_MESSAGE = "__cancelled__"
 
+# Default parent of the list models' methods, the invalid (root) index
+ROOT_INDEX = QtCore.QModelIndex()
+
+# Background and text colour of builds matching the host platform
+HIGHLIGHT_COLORS = {
+    "windows": ("#0078D4", "white"),
+    "macos": ("#A2A2A2", "black"),
+    "linux": ("#E95420", "white"),
+}
+
 OS_DESCRIPTIONS = {
     "darwin": "macOS",
     "windows": "Windows",
@@ -92,84 +149,171 @@ logging.basicConfig(
 logger = logging.getLogger()
 
 
-def _hbytes(num: float) -> str:
-    if not isinstance(num, (int, float)):
-        return "0 bytes"
-    for unit in [" bytes", " KB", " MB", " GB"]:
-        if num < 1024.0:
-            return f"{num:3.1f}{unit}"
-        num /= 1024.0
-    return f"{num:3.1f} TB"
-
-
-def _sha256_file(path: str) -> str:
-    h = hashlib.sha256()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
-            h.update(chunk)
-    return h.hexdigest()
+def _hduration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
 
 
 class CheckWorker(QRunnable):
     """Worker for checking for new builds."""
 
     class WorkerSignals(QtCore.QObject):
-        finished = QtCore.Signal(list, object)  # list of builds, error message or None
+        finished = QtCore.Signal(object, object)  # BuildIndex, error message or None
 
-    def __init__(self, url, filename_regex, session):
+    def __init__(self, mirrors, filename_regex, session, cache=None):
         super().__init__()
-        self.url = url
+        self.mirrors = mirrors
         self.filename_regex = filename_regex
         self.session = session
+        self.cache = cache
         self.signals = self.WorkerSignals()
 
     @Slot()
     def run(self):
         try:
-            req = self.session.get(self.url, timeout=BUILD_CHECK_TIMEOUT)
-            req.raise_for_status()
-
-            filenames = self.filename_regex.findall(req.text)
-            finallist = sorted(list(set(filenames)), reverse=True)
-            self.signals.finished.emit(finallist, None)
+            builds, _, _ = fetch_mirrored_build_index(
+                self.session,
+                self.mirrors,
+                self.filename_regex,
+                cache=self.cache,
+                timeout=BUILD_CHECK_TIMEOUT,
+            )
+            self.signals.finished.emit(BuildIndex(builds), None)
 
         except requests.exceptions.RequestException as e:
             error_message = f"Error reaching server: {e}"
             logger.error(f"No connection to Blender nightly builds server: {e}")
-            self.signals.finished.emit([], error_message)
+            self.signals.finished.emit(None, error_message)
         except Exception as e:
             error_message = f"An unexpected error occurred: {e}"
             logger.error(error_message, exc_info=True)
-            self.signals.finished.emit([], error_message)
+            self.signals.finished.emit(None, error_message)
+
+
+class ConnectivityWorker(QRunnable):
+    """Worker for checking that GitHub can be reached."""
+
+    class WorkerSignals(QtCore.QObject):
+        finished = QtCore.Signal(bool)
+
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+        self.signals = self.WorkerSignals()
+
+    @Slot()
+    def run(self):
+        try:
+            self.session.get(GITHUB_CHECK_URL, timeout=CONNECTIVITY_TIMEOUT)
+            self.signals.finished.emit(True)
+        except requests.exceptions.RequestException:
+            self.signals.finished.emit(False)
+
+
+class AppUpdateWorker(QRunnable):
+    """Worker for looking up the latest BlenderUpdater release on GitHub.
+
+    With the version and ETag of an earlier lookup the request is made
+    conditional, so an unchanged release costs a 304 without a body.
+    """
+
+    class WorkerSignals(QtCore.QObject):
+        # latest version string and its ETag, both None if the lookup failed
+        finished = QtCore.Signal(object, object)
+
+    def __init__(self, session, cached_version="", cached_etag=""):
+        super().__init__()
+        self.session = session
+        self.cached_version = cached_version
+        self.cached_etag = cached_etag
+        self.signals = self.WorkerSignals()
+
+    @Slot()
+    def run(self):
+        latest_version = None
+        etag = None
+        headers = {}
+        if self.cached_version and self.cached_etag:
+            headers["If-None-Match"] = self.cached_etag
+        try:
+            response = self.session.get(
+                GITHUB_RELEASES_API_URL, headers=headers, timeout=CONNECTIVITY_TIMEOUT
+            )
+            if response.status_code == 304:
+                latest_version = self.cached_version
+                etag = self.cached_etag
+                logger.info(f"Latest release unchanged: {latest_version}")
+            else:
+                response.raise_for_status()
+                latest_version = response.json()["tag_name"]
+                etag = response.headers.get("ETag", "")
+                logger.info(f"Version found online: {latest_version}")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Unable to get update information from GitHub: {e}")
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"Error parsing update information from GitHub: {e}")
+        self.signals.finished.emit(latest_version, etag)
 
 
 class DownloadManager(QtCore.QObject):
     """Manages download and extraction process in the background."""
 
     progress = QtCore.Signal(int)
+    transfer_rate = QtCore.Signal(float, float)
     finished = QtCore.Signal(bool, str)
     status_update = QtCore.Signal(str)
 
-    def __init__(self, url, install_path, session, parent=None):
+    def __init__(
+        self,
+        url,
+        install_path,
+        session,
+        connections=DEFAULT_CONNECTIONS,
+        cache_dir=None,
+        pipelined=True,
+        extract_workers=1,
+        install_mode=INSTALL_MODE_SWAP,
+        store_path=None,
+        mirrors=None,
+        prune_policy=None,
+        parent=None,
+    ):
         super().__init__(parent)
         self.url = url
         self.install_path = install_path
         self.session = session
+        self.connections = connections
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.pipelined = pipelined
+        self.extract_workers = extract_workers
+        self.install_mode = install_mode
+        self.store_path = store_path
+        self.mirrors = mirrors
+        self.prune_policy = prune_policy
         self.threadpool = QThreadPool.globalInstance()
-        self.temp_dir = None
+        self.download_path = None
         self._worker = None
 
     def start(self):
         try:
-            self.temp_dir = tempfile.mkdtemp(prefix="blenderupdater-")
-            logger.info(f"Created temporary directory: {self.temp_dir}")
-            filename = os.path.basename(urllib.parse.urlparse(self.url).path)
-            download_path = os.path.join(self.temp_dir, filename)
-
+            self.download_path = prepare_download_path(self.url, self.cache_dir)
             self._worker = DownloadWorker(
-                self.url, download_path, self.install_path, self.temp_dir, self.session
+                self.url,
+                self.download_path,
+                self.install_path,
+                self.session,
+                connections=self.connections,
+                pipelined=self.pipelined,
+                extract_workers=self.extract_workers,
+                install_mode=self.install_mode,
+                store_path=self.store_path,
+                mirrors=self.mirrors,
+                prune_policy=self.prune_policy,
             )
             self._worker.signals.progress.connect(self.progress.emit)
+            self._worker.signals.transfer_rate.connect(self.transfer_rate.emit)
             self._worker.signals.finished.connect(self.on_worker_finished)
             self._worker.signals.status_update.connect(self.status_update.emit)
             self._worker.signals.extraction_started.connect(self.parent().extraction)
@@ -188,17 +332,7 @@ class DownloadManager(QtCore.QObject):
             self._worker.cancel()
 
     def on_worker_finished(self, success, message):
-        if self.temp_dir and os.path.exists(self.temp_dir):
-            try:
-                shutil.rmtree(self.temp_dir)
-                logger.info(
-                    f"Successfully cleaned up temporary directory: {self.temp_dir}"
-                )
-            except OSError as e:
-                logger.error(
-                    f"Failed to clean up temporary directory {self.temp_dir}: {e}",
-                    exc_info=True,
-                )
+        clean_up(self.download_path, self.install_path, success)
         self.finished.emit(success, message)
 
 
@@ -207,6 +341,8 @@ class DownloadWorker(QRunnable):
 
     class WorkerSignals(QtCore.QObject):
         progress = QtCore.Signal(int)
+        # Bytes per second and seconds left, -1 while unknown
+        transfer_rate = QtCore.Signal(float, float)
         finished = QtCore.Signal(bool, str)
         status_update = QtCore.Signal(str)
         extraction_started = QtCore.Signal()
@@ -214,96 +350,64 @@ class DownloadWorker(QRunnable):
         copying_started = QtCore.Signal()
         cleanup_started = QtCore.Signal()
 
-    def __init__(self, url, download_path, install_path, temp_dir, session):
+    def __init__(
+        self,
+        url,
+        download_path,
+        install_path,
+        session,
+        connections=DEFAULT_CONNECTIONS,
+        pipelined=True,
+        extract_workers=1,
+        install_mode=INSTALL_MODE_SWAP,
+        store_path=None,
+        mirrors=None,
+        prune_policy=None,
+    ):
         super().__init__()
-        self.url = url
-        self.download_path = download_path
-        self.install_path = install_path
-        self.temp_dir = temp_dir
-        self.session = session
-        self._cancelled = False
         self.signals = self.WorkerSignals()
+        self.pipeline = InstallPipeline(
+            url,
+            download_path,
+            install_path,
+            session,
+            connections=connections,
+            pipelined=pipelined,
+            extract_workers=extract_workers,
+            install_mode=install_mode,
+            store_path=store_path,
+            on_status=self.signals.status_update.emit,
+            on_phase=self._on_phase,
+            on_progress=self._on_download_progress,
+            mirrors=mirrors,
+            prune_policy=prune_policy,
+        )
 
     def cancel(self):
-        self._cancelled = True
+        self.pipeline.cancel()
+
+    def _on_phase(self, phase):
+        {
+            PHASE_VERIFY: self.signals.verification_started,
+            PHASE_EXTRACT: self.signals.extraction_started,
+            PHASE_INSTALL: self.signals.copying_started,
+            PHASE_CLEANUP: self.signals.cleanup_started,
+        }[phase].emit()
+
+    def _on_download_progress(self, percent, rate, eta):
+        # Called a few times per second by the ProgressReporter, not per chunk,
+        # so the UI thread's event queue is not flooded with signals.
+        self.signals.progress.emit(percent)
+        self.signals.transfer_rate.emit(rate, -1.0 if eta is None else eta)
 
     @Slot()
     def run(self):
         try:
-            # Check available disk space before starting the download
-            try:
-                head_response = self.session.head(self.url, timeout=DOWNLOAD_TIMEOUT)
-                content_length = int(head_response.headers.get("content-length", 0))
-            except requests.exceptions.RequestException:
-                content_length = 0
-
-            if content_length > 0:
-                free_space = shutil.disk_usage(
-                    os.path.dirname(self.download_path)
-                ).free
-                if content_length > free_space:
-                    raise OSError(
-                        f"Insufficient disk space: {_hbytes(content_length)} needed, "
-                        f"{_hbytes(free_space)} available"
-                    )
-
-            # Download
-            response = self.session.get(self.url, stream=True, timeout=DOWNLOAD_TIMEOUT)
-            response.raise_for_status()
-            total_size = int(response.headers.get("content-length", 0))
-            self.signals.status_update.emit(f"Downloading {_hbytes(total_size)}")
-
-            with open(self.download_path, "wb") as f:
-                downloaded_size = 0
-                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
-                    if self._cancelled:
-                        self.signals.finished.emit(False, CANCEL_MESSAGE)
-                        return
-                    f.write(chunk)
-                    downloaded_size += len(chunk)
-                    if total_size > 0:
-                        self.signals.progress.emit(
-                            int(downloaded_size * 100 / total_size)
-                        )
-
-            # SHA256 verification
-            self.signals.verification_started.emit()
-            self.signals.status_update.emit("Verifying download integrity...")
-            sha256_url = self.url + ".sha256"
-            try:
-                sha256_response = self.session.get(sha256_url, timeout=DOWNLOAD_TIMEOUT)
-                sha256_response.raise_for_status()
-                expected_hash = sha256_response.text.strip().split()[0]
-                actual_hash = _sha256_file(self.download_path)
-                if actual_hash != expected_hash:
-                    raise ValueError(
-                        f"SHA256 mismatch: expected {expected_hash}, got {actual_hash}"
-                    )
-                logger.info("SHA256 verification passed")
-            except requests.exceptions.RequestException as e:
-                logger.warning(f"SHA256 file unavailable, skipping verification: {e}")
-            except IndexError:
-                logger.warning("SHA256 file had unexpected format, skipping verification")
-
-            # Extraction
-            self.signals.extraction_started.emit()
-            self.signals.status_update.emit("Extracting to temporary folder...")
-            extract_dir = os.path.join(self.temp_dir, "extracted")
-            os.makedirs(extract_dir, exist_ok=True)
-            shutil.unpack_archive(self.download_path, extract_dir)
-            source_dir_name = next(os.walk(extract_dir))[1][0]
-            source_path = os.path.join(extract_dir, source_dir_name)
-
-            # Copying
-            self.signals.copying_started.emit()
-            copytree(source_path, self.install_path, dirs_exist_ok=True)
-
-            # Cleanup (signal only; DownloadManager does the actual removal)
-            self.signals.cleanup_started.emit()
-
+            self.pipeline.run()
             self.signals.finished.emit(True, "Download and extraction successful.")
-
-        except (OSError, ValueError) as e:
+        except DownloadCancelled:
+            self.signals.finished.emit(False, CANCEL_MESSAGE)
+        except (OSError, ValueError, tarfile.TarError) as e:
             logger.error(f"Error in download worker: {e}", exc_info=True)
             self.signals.finished.emit(False, str(e))
         except requests.exceptions.RequestException as e:
@@ -314,51 +418,187 @@ class DownloadWorker(QRunnable):
             self.signals.finished.emit(False, str(e))
 
 
+class BuildListModel(QtCore.QAbstractListModel):
+    """List model over the BuildInfo records of a BuildIndex."""
+
+    BuildRole = QtCore.Qt.UserRole + 1
+
+    def __init__(self, icons, host_os, host_arch, parent=None):
+        super().__init__(parent)
+        self.builds = []
+        self.icons = icons
+        self.host_os = host_os
+        self.host_arch = host_arch
+        self._highlight = {
+            os_name: (QtGui.QBrush(QtGui.QColor(bg)), QtGui.QBrush(QtGui.QColor(fg)))
+            for os_name, (bg, fg) in HIGHLIGHT_COLORS.items()
+        }
+
+    def set_builds(self, builds):
+        self.beginResetModel()
+        self.builds = list(builds)
+        self.endResetModel()
+
+    def rowCount(self, parent=ROOT_INDEX):
+        return 0 if parent.isValid() else len(self.builds)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        build = self.builds[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return build.filename
+        if role == QtCore.Qt.DecorationRole:
+            return self.icons.get(build.os)
+        if role == self.BuildRole:
+            return build
+        if (
+            role in (QtCore.Qt.BackgroundRole, QtCore.Qt.ForegroundRole)
+            and build.os in self._highlight
+            and build.matches_host(self.host_os, self.host_arch)
+        ):
+            background, foreground = self._highlight[build.os]
+            return background if role == QtCore.Qt.BackgroundRole else foreground
+        return None
+
+
+class BuildFilterProxyModel(QtCore.QAbstractProxyModel):
+    """Shows the builds of a BuildListModel matching the OS and latest filters.
+
+    The visible rows come straight from the BuildIndex buckets, so changing
+    the filter costs O(result) and the view only asks for the rows it paints.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.build_index = BuildIndex([])
+        self.os_filter = None
+        self.latest_only = False
+        self.query = ""
+        self._rows = []
+        self._proxy_rows = {}
+        self._source_rows = {}
+
+    def set_build_index(self, build_index):
+        self.build_index = build_index
+        self.sourceModel().set_builds(build_index.builds)
+        self._source_rows = {
+            id(build): row for row, build in enumerate(build_index.builds)
+        }
+        self._refilter()
+
+    def set_filter(self, os_filter, latest_only, query=""):
+        self.os_filter = os_filter
+        self.latest_only = latest_only
+        self.query = query
+        self._refilter()
+
+    def _refilter(self):
+        builds = self.build_index.filter(os=self.os_filter, query=self.query)
+        if self.latest_only:
+            builds = latest_builds(builds)
+        self.beginResetModel()
+        self._rows = [self._source_rows[id(build)] for build in builds]
+        self._proxy_rows = {source: proxy for proxy, source in enumerate(self._rows)}
+        self.endResetModel()
+
+    def rowCount(self, parent=ROOT_INDEX):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=ROOT_INDEX):
+        return 0 if parent.isValid() else 1
+
+    def index(self, row, column, parent=ROOT_INDEX):
+        if parent.isValid() or column != 0 or not 0 <= row < len(self._rows):
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=ROOT_INDEX):
+        return QtCore.QModelIndex()
+
+    def mapToSource(self, proxy_index):
+        if not proxy_index.isValid():
+            return QtCore.QModelIndex()
+        return self.sourceModel().index(self._rows[proxy_index.row()], 0)
+
+    def mapFromSource(self, source_index):
+        if not source_index.isValid():
+            return QtCore.QModelIndex()
+        proxy_row = self._proxy_rows.get(source_index.row())
+        if proxy_row is None:
+            return QtCore.QModelIndex()
+        return self.createIndex(proxy_row, 0)
+
+
 class BlenderUpdater(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
     def __init__(self, parent=None):
         logger.info(f"Running version {appversion}")
         logger.debug("Constructing UI")
         super(BlenderUpdater, self).__init__(parent)
-        self.config = configparser.ConfigParser()
-        self.build_buttons = {}
-        self.setupUi(self)
-        self.session = requests.Session()
-        self.filename_regex = re.compile(
-            r'blender-\d+\.\d+[^"\s/]*\.(?:zip|tar\.xz|dmg|tar\.gz)'
+        self.config_save_timer = QtCore.QTimer(self)
+        self.config_save_timer.setSingleShot(True)
+        self.config_save_timer.setInterval(CONFIG_SAVE_DELAY_MS)
+        self.config = ConfigStore(
+            CONFIG_FILE_NAME, CONFIG_SECTION_MAIN, self.config_save_timer.start
         )
+        self.config_save_timer.timeout.connect(self.config.flush)
+        self.build_index = BuildIndex([])
+        self.showing_stale_builds = False
+        self.host_os, self.host_arch = host_platform()
+        logger.info(f"Operating system: {self.host_os}, architecture: {self.host_arch}")
+        self.setupUi(self)
+        self.filename_regex = BUILD_FILENAME_REGEX
         self.threadpool = QThreadPool()
         logger.info(
             f"Multithreading with maximum {self.threadpool.maxThreadCount()} threads"
         )
 
-        self.setStyleSheet("""
-            QPushButton[highlight="true"][os="windows"] {
-                background-color: #0078D4;
-                color: white;
-            }
-            QPushButton[highlight="true"][os="macos"] {
-                background-color: #A2A2A2;
-                color: black;
-            }
-            QPushButton[highlight="true"][os="linux"] {
-                background-color: #E95420;
-                color: white;
-            }
-        """)
-
-        self.scrollArea = QScrollArea(self.centralwidget)
-        self.scrollArea.setGeometry(QtCore.QRect(6, 50, 686, 625))
-        self.scrollArea.setWidgetResizable(True)
-        self.scrollArea.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
-        self.scrollArea.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAsNeeded)
-
-        self.scrollContent = QWidget()
-        self.scrollLayout = QVBoxLayout(self.scrollContent)
-        self.scrollLayout.setSpacing(2)
-        self.scrollLayout.setContentsMargins(0, 0, 0, 0)
-
-        self.scrollArea.setWidget(self.scrollContent)
-        self.scrollArea.hide()
+        # Only the visible rows are painted, so long build lists stay cheap
+        icons = {
+            "macos": QtGui.QIcon(":/newPrefix/images/Apple-icon.png"),
+            "windows": QtGui.QIcon(":/newPrefix/images/Windows-icon.png"),
+            "linux": QtGui.QIcon(":/newPrefix/images/Linux-icon.png"),
+        }
+        self.build_model = BuildListModel(icons, self.host_os, self.host_arch, self)
+        self.build_proxy = BuildFilterProxyModel(self)
+        self.build_proxy.setSourceModel(self.build_model)
+
+        self.buildList = QListView(self.centralwidget)
+        self.buildList.setGeometry(QtCore.QRect(6, 50, 686, 625))
+        self.buildList.setModel(self.build_proxy)
+        self.buildList.setUniformItemSizes(True)
+        self.buildList.setIconSize(QtCore.QSize(24, 24))
+        self.buildList.setSpacing(1)
+        self.buildList.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.buildList.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+        self.buildList.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAsNeeded)
+        self.buildList.setStyleSheet("QListView::item { padding: 4px; }")
+        self.buildList.clicked.connect(self._on_build_clicked)
+        self.buildList.hide()
+
+        self.chk_latest = QtWidgets.QCheckBox("Latest only", self.centralwidget)
+        self.chk_latest.setGeometry(QtCore.QRect(560, 25, 131, 20))
+        self.chk_latest.setToolTip(
+            "Only show the newest build of each branch and platform"
+        )
+
+        self.line_search = QtWidgets.QLineEdit(self.centralwidget)
+        self.line_search.setGeometry(QtCore.QRect(6, 24, 190, 22))
+        self.line_search.setPlaceholderText("Search version, branch, hash...")
+        self.line_search.setClearButtonEnabled(True)
+        # Typing only restarts the timer, the list is filtered once the user pauses
+        self.search_timer = QtCore.QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self._apply_search)
+        self.lbl_rate = QtWidgets.QLabel(self.statusbar)
+        self.statusbar.addPermanentWidget(self.lbl_rate)
+
+        self.btn_rollback = QtWidgets.QPushButton(self.centralwidget)
+        self.btn_rollback.setGeometry(QtCore.QRect(196, 330, 311, 35))
+        self.btn_rollback.setToolTip(
+            "Go back to the build installed before, without downloading it again"
+        )
 
         self.btn_oneclick.hide()
         self.lbl_quick.hide()
@@ -368,6 +608,9 @@ class BlenderUpdater(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
         self.lbl_caution.setStyleSheet("background: rgb(255, 155, 8);\ncolor: white")
 
         self._load_config()
+        self.session = make_session(self._get_download_connections())
+        self.chk_latest.setChecked(self._get_config_bool(CONFIG_KEY_LATEST_ONLY))
+        self.line_search.setText(self._get_config(CONFIG_KEY_SEARCH))
         self.install_path = self._get_config(CONFIG_KEY_PATH)
         self.line_path.setText(self.install_path)
 
@@ -382,9 +625,13 @@ class BlenderUpdater(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
         self.btngrp_filter.hide()
         self.btn_Check.setFocus()
         self.lbl_available.hide()
+        self.chk_latest.hide()
+        self.line_search.hide()
         self.progressBar.setValue(0)
         self.progressBar.hide()
         self.lbl_task.hide()
+        self.lbl_rate.hide()
+        self._update_rollback_button()
         self.statusbar.showMessage(
             f"Ready - Last check: {self._get_config(CONFIG_KEY_LAST_CHECK)}"
         )
@@ -393,89 +640,74 @@ class BlenderUpdater(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
         self.btn_about.clicked.connect(self.about)
         self.btn_path.clicked.connect(self.select_path)
         self.btn_cancel.clicked.connect(self.cancel_download)
+        self.btn_rollback.clicked.connect(self.roll_back_build)
 
         self.btn_osx.clicked.connect(lambda: self._set_os_filter("darwin"))
         self.btn_linux.clicked.connect(lambda: self._set_os_filter("linux"))
         self.btn_windows.clicked.connect(lambda: self._set_os_filter("windows"))
         self.btn_allos.clicked.connect(lambda: self._set_os_filter("all"))
+        self.chk_latest.toggled.connect(self._set_latest_only)
+        self.line_search.textChanged.connect(self._on_search_changed)
+        QtCore.QCoreApplication.instance().aboutToQuit.connect(self.config.flush)
 
-        try:
-            self.session.get(GITHUB_CHECK_URL, timeout=CONNECTIVITY_TIMEOUT)
-        except requests.exceptions.RequestException:
+        # Network checks run in the background so the window shows up
+        # immediately, even when GitHub is slow or unreachable.
+        connectivity_worker = ConnectivityWorker(self.session)
+        connectivity_worker.signals.finished.connect(self.on_connectivity_checked)
+        self.threadpool.start(connectivity_worker)
+
+        self.start_app_update_check()
+
+    def on_connectivity_checked(self, connected):
+        if not connected:
+            logger.critical("No internet connection")
             QtWidgets.QMessageBox.critical(
                 self, "Error", "Please check your internet connection"
             )
-            logger.critical("No internet connection")
 
+    def start_app_update_check(self):
+        cached_version = self._get_config(CONFIG_KEY_APP_UPDATE_VERSION)
+        cached_etag = self._get_config(CONFIG_KEY_APP_UPDATE_ETAG)
         try:
-            response = self.session.get(GITHUB_RELEASES_API_URL)
-            response.raise_for_status()
-            update_data = response.json()
-            logger.info("Reading existing configuration file")
-            app_latest_version = update_data["tag_name"]
-            logger.info(f"Version found online: {app_latest_version}")
-            if Version(app_latest_version) > Version(appversion):
-                logger.info("Newer version found on Github")
-                self.btn_newVersion.clicked.connect(self.getAppUpdate)
-                self.btn_newVersion.setStyleSheet("background: rgb(73, 50, 20)")
-                self.btn_newVersion.show()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Unable to get update information from GitHub: {e}")
-        except (KeyError, TypeError, json.JSONDecodeError) as e:
-            logger.error(f"Error parsing update information from GitHub: {e}")
+            checked = float(self._get_config(CONFIG_KEY_APP_UPDATE_CHECKED) or 0)
+        except ValueError:
+            checked = 0
+        ttl_hours = self._get_config_int(
+            CONFIG_KEY_APP_UPDATE_TTL, DEFAULT_APP_UPDATE_TTL_HOURS
+        )
+        # Within the TTL the cached answer is used without asking GitHub,
+        # which also keeps us well below its unauthenticated rate limit.
+        if cached_version and 0 <= time.time() - checked < ttl_hours * 3600:
+            logger.info(f"Using cached release information: {cached_version}")
+            self.show_app_update(cached_version)
+            return
 
-    def _get_os_arch_details(self):
-        """Returns highlighting details for builds matching the user's OS and architecture."""
-        system = platform.system()
-        machine = platform.machine()
-        details = {"exact": None, "generic_os": None, "conflicting_arch_for_os": []}
-
-        os_map = {
-            "Windows": {
-                "generic_os": "windows",
-                "arch_map": {
-                    "AMD64": ("windows.amd64", ["x86", "win32", "arm64"]),
-                    "x86": ("windows.x86", ["amd64", "x64", "arm64"]),
-                    "ARM64": ("windows.arm64", ["amd64", "x64", "x86", "win32"]),
-                },
-            },
-            "Darwin": {
-                "generic_os": "macos",
-                "arch_map": {
-                    "x86_64": ("macos.x86_64", ["arm64"]),
-                    "arm64": ("macos.arm64", ["x86_64"]),
-                },
-            },
-            "Linux": {
-                "generic_os": "linux",
-                "arch_map": {
-                    "x86_64": ("linux.x86_64", ["aarch64"]),
-                    "aarch64": ("linux.aarch64", ["x86_64"]),
-                },
-            },
-        }
+        update_worker = AppUpdateWorker(self.session, cached_version, cached_etag)
+        update_worker.signals.finished.connect(self.on_app_update_checked)
+        self.threadpool.start(update_worker)
 
-        if system in os_map:
-            os_info = os_map[system]
-            details["generic_os"] = os_info["generic_os"]
-            if machine in os_info["arch_map"]:
-                exact, conflicts = os_info["arch_map"][machine]
-                details["exact"] = exact.lower()
-                details["conflicting_arch_for_os"] = [c.lower() for c in conflicts]
+    def on_app_update_checked(self, app_latest_version, etag):
+        if app_latest_version is None:
+            return
+        self._update_config(CONFIG_KEY_APP_UPDATE_VERSION, app_latest_version)
+        self._update_config(CONFIG_KEY_APP_UPDATE_ETAG, etag)
+        self._update_config(CONFIG_KEY_APP_UPDATE_CHECKED, int(time.time()))
+        self.show_app_update(app_latest_version)
 
-        logger.debug(f"OS/Arch details for highlighting: {details}")
-        return details
+    def show_app_update(self, app_latest_version):
+        try:
+            newer = Version(app_latest_version) > Version(appversion)
+        except InvalidVersion as e:
+            logger.error(f"Error parsing update information from GitHub: {e}")
+            return
+        # The build list hides the button, so it is only shown on the start page
+        if newer and not self.frm_start.isHidden():
+            logger.info("Newer version found on Github")
+            self.btn_newVersion.clicked.connect(self.getAppUpdate)
+            self.btn_newVersion.setStyleSheet("background: rgb(73, 50, 20)")
+            self.btn_newVersion.show()
 
     def _load_config(self):
-        if os.path.isfile(CONFIG_FILE_NAME):
-            logger.info("Reading existing configuration file")
-            self.config.read(CONFIG_FILE_NAME)
-            if not self.config.has_section(CONFIG_SECTION_MAIN):
-                self.config.add_section(CONFIG_SECTION_MAIN)
-        else:
-            logger.debug("No previous config found, creating default.")
-            self.config.add_section(CONFIG_SECTION_MAIN)
-
         defaults = {
             CONFIG_KEY_PATH: "",
             CONFIG_KEY_LAST_CHECK: "Never",
@@ -483,22 +715,106 @@ class BlenderUpdater(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
             CONFIG_KEY_LAST_DL_FILENAME: "",
             CONFIG_KEY_INSTALLED_FILENAME: "",
             CONFIG_KEY_OS_FILTER: "all",
+            CONFIG_KEY_LATEST_ONLY: "false",
+            CONFIG_KEY_SEARCH: "",
+            CONFIG_KEY_DOWNLOAD_CONNECTIONS: str(DEFAULT_CONNECTIONS),
+            CONFIG_KEY_DOWNLOAD_CACHE: "",
+            CONFIG_KEY_PIPELINED_EXTRACTION: "true",
+            CONFIG_KEY_EXTRACT_THREADS: "0",
+            CONFIG_KEY_INSTALL_MODE: INSTALL_MODE_SWAP,
+            CONFIG_KEY_CONTENT_STORE: "",
+            CONFIG_KEY_APP_UPDATE_TTL: str(DEFAULT_APP_UPDATE_TTL_HOURS),
+            CONFIG_KEY_APP_UPDATE_VERSION: "",
+            CONFIG_KEY_APP_UPDATE_ETAG: "",
+            CONFIG_KEY_APP_UPDATE_CHECKED: "0",
+            CONFIG_KEY_DOWNLOAD_URL: BLENDER_DOWNLOAD_URL,
+            CONFIG_KEY_MIRRORS: "",
+            CONFIG_KEY_KEEP_BUILDS: "5",
+            CONFIG_KEY_KEEP_DAYS: "0",
+            CONFIG_KEY_MAX_INSTALLED_GB: "0",
         }
-        for key, value in defaults.items():
-            if not self.config.has_option(CONFIG_SECTION_MAIN, key):
-                self.config.set(CONFIG_SECTION_MAIN, key, value)
-        self._save_config()
+        self.config.load(defaults)
+        self.config.flush()
 
     def _get_config(self, key, default=""):
-        return self.config.get(CONFIG_SECTION_MAIN, key, fallback=default)
+        return self.config.get(key, default)
 
-    def _update_config(self, key, value):
-        self.config.set(CONFIG_SECTION_MAIN, key, str(value))
-        self._save_config()
+    def _get_config_int(self, key, default=0):
+        try:
+            return self.config.getint(key, default)
+        except ValueError:
+            logger.warning(f"Invalid value for config key '{key}', using {default}")
+            return default
 
-    def _save_config(self):
-        with open(CONFIG_FILE_NAME, "w") as f:
-            self.config.write(f)
+    def _get_config_bool(self, key, default=False):
+        try:
+            return self.config.getboolean(key, default)
+        except ValueError:
+            logger.warning(f"Invalid value for config key '{key}', using {default}")
+            return default
+
+    def _get_download_connections(self):
+        return max(
+            1,
+            self._get_config_int(CONFIG_KEY_DOWNLOAD_CONNECTIONS, DEFAULT_CONNECTIONS),
+        )
+
+    def _load_mirrors(self):
+        # download_url comes first until the mirrors have been measured
+        urls = [self._get_config(CONFIG_KEY_DOWNLOAD_URL) or BLENDER_DOWNLOAD_URL]
+        urls += parse_mirrors(self._get_config(CONFIG_KEY_MIRRORS))
+        cache_dir = self._get_config(CONFIG_KEY_DOWNLOAD_CACHE) or default_cache_dir()
+        mirrors = MirrorSet(urls, os.path.join(cache_dir, MIRROR_RANKING_FILE_NAME))
+        mirrors.load()
+        return mirrors
+
+    def _get_install_mode(self):
+        return self._get_config(CONFIG_KEY_INSTALL_MODE, INSTALL_MODE_SWAP)
+
+    def _get_prune_policy(self):
+        return PrunePolicy(
+            keep=self._get_config_int(CONFIG_KEY_KEEP_BUILDS, 5),
+            max_age_days=self._get_config_int(CONFIG_KEY_KEEP_DAYS, 0),
+            max_size=self._get_config_int(CONFIG_KEY_MAX_INSTALLED_GB, 0) * 1024**3,
+        )
+
+    def _get_blender_dir(self):
+        # Managed installs run whichever build "current" points to
+        if self._get_install_mode() == INSTALL_MODE_MANAGED:
+            return Path(self.install_path) / CURRENT_LINK_NAME
+        return Path(self.install_path)
+
+    def _update_rollback_button(self):
+        target = None
+        if self.install_path and os.path.isdir(self.install_path):
+            target = rollback_target(self.install_path, self._get_install_mode())
+        if target is None:
+            self.btn_rollback.hide()
+            return
+        self.btn_rollback.setText(f"Roll back to {target or 'previous build'}")
+        self.btn_rollback.show()
+
+    def roll_back_build(self):
+        try:
+            filename = roll_back(self.install_path, self._get_install_mode())
+        except OSError as e:
+            logger.error(f"Rollback failed: {e}")
+            QtWidgets.QMessageBox.critical(
+                self, "Error", f"Could not roll back to the previous build: {e}"
+            )
+            return
+        self._update_config(CONFIG_KEY_INSTALLED_FILENAME, filename)
+        self._update_rollback_button()
+        self.statusbar.showMessage(f"Rolled back to {filename or 'previous build'}")
+
+    def _get_extract_threads(self):
+        # 0 means one writer per thread the Qt thread pool would use
+        threads = self._get_config_int(CONFIG_KEY_EXTRACT_THREADS, 0)
+        return threads if threads > 0 else self.threadpool.maxThreadCount()
+
+    def _update_config(self, key, value):
+        # Written by the config save timer or on quit, not on every change
+        self.config.set(key, value)
 
     def select_path(self):
         selected_dir = QtWidgets.QFileDialog.getExistingDirectory(
@@ -566,40 +882,83 @@ class BlenderUpdater(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
         self.progressBar.hide()
         self.lbl_task.hide()
         self.btn_execute.hide()
-        self.scrollArea.hide()
+        self.btn_rollback.hide()
+        self.buildList.hide()
         self.btngrp_filter.hide()
         self.lbl_available.hide()
+        self.chk_latest.hide()
+        self.line_search.hide()
         self.lbl_caution.hide()
 
-        self.statusbar.showMessage("Checking for new builds...")
         self.btn_Check.setDisabled(True)
 
-        worker = CheckWorker(BLENDER_DOWNLOAD_URL, self.filename_regex, self.session)
+        # The cached list is shown right away and marked stale until the
+        # conditional request in the worker confirms or replaces it.
+        cache = BuildIndexCache(self._get_build_index_path())
+        cache.load()
+        self.mirrors = self._load_mirrors()
+        cached_builds = cache.builds if cache.url in self.mirrors.urls else []
+        self.showing_stale_builds = False
+        if cached_builds:
+            self.show_builds(BuildIndex(cached_builds))
+            self.showing_stale_builds = True
+            self.statusbar.showMessage(
+                "Showing cached builds, checking for new ones..."
+            )
+        else:
+            self.statusbar.showMessage("Checking for new builds...")
+
+        worker = CheckWorker(
+            self.mirrors, self.filename_regex, self.session, cache=cache
+        )
         worker.signals.finished.connect(self.on_check_finished)
         self.threadpool.start(worker)
 
-    def on_check_finished(self, build_list, error):
-        self.btn_Check.setDisabled(False)
+    def _get_build_index_path(self):
+        cache_dir = self._get_config(CONFIG_KEY_DOWNLOAD_CACHE) or default_cache_dir()
+        return os.path.join(cache_dir, BUILD_INDEX_FILE_NAME)
+
+    def on_check_finished(self, build_index, error):
+        stale = self.showing_stale_builds
+        self.showing_stale_builds = False
+        # A build may have been picked from the cached list in the meantime
+        picked = stale and self.buildList.isHidden()
+        if self.btn_cancel.isHidden():
+            # A running download enables it again once finished
+            self.btn_Check.setDisabled(False)
         if error:
-            self.statusbar.showMessage(str(error))
-            self.frm_start.show()
+            if picked:
+                return
+            if stale:
+                self.statusbar.showMessage(f"Showing cached builds - {error}")
+            else:
+                self.statusbar.showMessage(str(error))
+                self.frm_start.show()
             return
 
-        self.finallist = build_list
+        if picked:
+            # Kept for when the list is shown again, without showing it now
+            self.build_index = build_index
+            self.build_proxy.set_build_index(build_index)
+        elif not (stale and build_index.filenames == self.build_index.filenames):
+            self.show_builds(build_index)
+
+        lastcheck = datetime.now().strftime("%a %b %d %H:%M:%S %Y")
+        if not picked:
+            self.statusbar.showMessage(f"Ready - Last check: {str(lastcheck)}")
+        self._update_config(CONFIG_KEY_LAST_CHECK, str(lastcheck))
 
-        self.appleicon = QtGui.QIcon(":/newPrefix/images/Apple-icon.png")
-        self.windowsicon = QtGui.QIcon(":/newPrefix/images/Windows-icon.png")
-        self.linuxicon = QtGui.QIcon(":/newPrefix/images/Linux-icon.png")
+    def show_builds(self, build_index):
+        self.build_index = build_index
 
-        self.scrollArea.show()
+        self.build_proxy.set_build_index(build_index)
+        self.buildList.show()
         self.lbl_available.show()
+        self.chk_latest.show()
+        self.line_search.show()
         self.lbl_caution.show()
         self.btngrp_filter.show()
 
-        lastcheck = datetime.now().strftime("%a %b %d %H:%M:%S %Y")
-        self.statusbar.showMessage(f"Ready - Last check: {str(lastcheck)}")
-        self._update_config(CONFIG_KEY_LAST_CHECK, str(lastcheck))
-
         saved_filter = self._get_config(CONFIG_KEY_OS_FILTER, "all")
         if saved_filter == "windows":
             self.btn_windows.setChecked(True)
@@ -612,10 +971,35 @@ class BlenderUpdater(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
         self._set_os_filter(saved_filter)
 
     def download(self, entry):
-        url = BLENDER_DOWNLOAD_URL + entry
+        url = self.mirrors.urls_for(entry)[0]
+        self.btn_rollback.hide()
         installed_filename = self._get_config(CONFIG_KEY_INSTALLED_FILENAME)
 
-        if entry == installed_filename:
+        if self._get_install_mode() == INSTALL_MODE_MANAGED:
+            installs = ManagedInstalls(self.install_path)
+            if entry in installs:
+                # Still installed side by side, switching is a link change
+                try:
+                    installs.activate(entry)
+                except OSError as e:
+                    logger.error(f"Failed to switch to {entry}: {e}")
+                    QtWidgets.QMessageBox.critical(
+                        self, "Error", f"Could not switch to {entry}: {e}"
+                    )
+                    return
+                self._update_config(CONFIG_KEY_PATH, self.install_path)
+                self._update_config(CONFIG_KEY_LAST_DL_FILENAME, entry)
+                self.buildList.hide()
+                self.lbl_available.hide()
+                self.chk_latest.hide()
+                self.line_search.hide()
+                self.lbl_caution.hide()
+                self.btngrp_filter.hide()
+                self.lbl_task.show()
+                self.done(installed_entry_filename=entry)
+                self.statusbar.showMessage(f"Switched to the installed {entry}")
+                return
+        elif entry == installed_filename:
             reply = QtWidgets.QMessageBox.question(
                 self,
                 "Warning",
@@ -626,14 +1010,16 @@ class BlenderUpdater(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
             logger.info("Duplicated version detected")
             if reply == QtWidgets.QMessageBox.No:
                 logger.debug("Skipping download of existing version")
-                self.scrollArea.show()
+                self.buildList.show()
                 return
 
         self._update_config(CONFIG_KEY_PATH, self.install_path)
         self._update_config(CONFIG_KEY_LAST_DL_FILENAME, entry)
 
-        self.scrollArea.hide()
+        self.buildList.hide()
         self.lbl_available.hide()
+        self.chk_latest.hide()
+        self.line_search.hide()
         self.lbl_caution.hide()
         self.progressBar.show()
         self.btngrp_filter.hide()
@@ -649,9 +1035,21 @@ class BlenderUpdater(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
         self.btn_cancel.show()
 
         self.download_manager = DownloadManager(
-            url, self.install_path, self.session, parent=self
+            url,
+            self.install_path,
+            self.session,
+            connections=self._get_download_connections(),
+            cache_dir=self._get_config(CONFIG_KEY_DOWNLOAD_CACHE) or None,
+            pipelined=self._get_config_bool(CONFIG_KEY_PIPELINED_EXTRACTION, True),
+            extract_workers=self._get_extract_threads(),
+            install_mode=self._get_install_mode(),
+            store_path=self._get_config(CONFIG_KEY_CONTENT_STORE) or None,
+            mirrors=self.mirrors,
+            prune_policy=self._get_prune_policy(),
+            parent=self,
         )
         self.download_manager.progress.connect(self.updatepb)
+        self.download_manager.transfer_rate.connect(self.update_transfer_rate)
         self.download_manager.status_update.connect(self.statusbar.showMessage)
         self.download_manager.finished.connect(
             lambda success, msg: self.on_download_finished(success, msg, entry)
@@ -667,6 +1065,7 @@ class BlenderUpdater(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
         self.btn_Check.setEnabled(True)
         self.btn_Quit.setEnabled(True)
         self.btn_cancel.hide()
+        self.lbl_rate.hide()
         if success:
             logger.info("Download and extraction successful.")
             self.done(installed_entry_filename=entry)
@@ -674,9 +1073,11 @@ class BlenderUpdater(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
             logger.info("Download cancelled by user.")
             self.statusbar.showMessage("Download cancelled.")
             self.frm_progress.hide()
-            self.scrollArea.show()
+            self.buildList.show()
             self.btngrp_filter.show()
             self.lbl_available.show()
+            self.chk_latest.show()
+            self.line_search.show()
             self.lbl_caution.show()
         else:
             logger.error(f"Download or extraction failed: {message}")
@@ -685,14 +1086,23 @@ class BlenderUpdater(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
             )
             self.statusbar.showMessage("Error during download/extraction.")
             self.frm_progress.hide()
-            self.scrollArea.show()
+            self.buildList.show()
             self.btngrp_filter.show()
             self.lbl_available.show()
+            self.chk_latest.show()
+            self.line_search.show()
             self.lbl_caution.show()
 
     def updatepb(self, percent):
         self.progressBar.setValue(percent)
 
+    def update_transfer_rate(self, rate, eta):
+        text = f"{hbytes(rate)}/s"
+        if eta >= 0:
+            text += f", {_hduration(eta)} left"
+        self.lbl_rate.setText(text)
+        self.lbl_rate.show()
+
     def verification(self):
         logger.info("Verifying download")
         donepixmap = QtGui.QPixmap(":/newPrefix/images/Check-icon.png")
@@ -700,35 +1110,36 @@ class BlenderUpdater(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
         self.lbl_download_pic.setPixmap(donepixmap)
         self.lbl_verify_pic.setPixmap(nowpixmap)
         self.lbl_verification.setText("<b>Verifying</b>")
+        self.lbl_rate.hide()
         self.lbl_task.setText("Verifying...")
         self.statusbar.showMessage("Verifying download integrity...")
         self.progressBar.setMinimum(0)
         self.progressBar.setMaximum(0)
 
     def extraction(self):
-        logger.info("Extracting to temp directory")
+        logger.info("Extracting to staging directory")
         donepixmap = QtGui.QPixmap(":/newPrefix/images/Check-icon.png")
         nowpixmap = QtGui.QPixmap(":/newPrefix/images/Actions-arrow-right-icon.png")
         self.lbl_verify_pic.setPixmap(donepixmap)
         self.lbl_extract_pic.setPixmap(nowpixmap)
         self.lbl_extraction.setText("<b>Extraction</b>")
         self.lbl_task.setText("Extracting...")
-        self.statusbar.showMessage("Extracting to temporary folder, please wait...")
+        self.statusbar.showMessage("Extracting to staging folder, please wait...")
 
     def finalcopy(self):
-        logger.info(f"Copying to {self.install_path}")
+        logger.info(f"Moving build into {self.install_path}")
         donepixmap = QtGui.QPixmap(":/newPrefix/images/Check-icon.png")
         nowpixmap = QtGui.QPixmap(":/newPrefix/images/Actions-arrow-right-icon.png")
         self.lbl_extract_pic.setPixmap(donepixmap)
         self.lbl_copy_pic.setPixmap(nowpixmap)
         self.lbl_copying.setText("<b>Copying</b>")
-        self.lbl_task.setText("Copying files...")
+        self.lbl_task.setText("Moving files...")
         self.statusbar.showMessage(
-            f"Copying files to {self.install_path}, please wait..."
+            f"Moving files into {self.install_path}, please wait..."
         )
 
     def cleanup(self):
-        logger.info("Cleaning up temp files")
+        logger.info("Cleaning up staging files")
         donepixmap = QtGui.QPixmap(":/newPrefix/images/Check-icon.png")
         nowpixmap = QtGui.QPixmap(":/newPrefix/images/Actions-arrow-right-icon.png")
         self.lbl_copy_pic.setPixmap(donepixmap)
@@ -751,6 +1162,7 @@ class BlenderUpdater(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
 
         if installed_entry_filename:
             self._update_config(CONFIG_KEY_INSTALLED_FILENAME, installed_entry_filename)
+        self._update_rollback_button()
 
         # Disconnect any previous handlers before connecting to avoid stacking
         try:
@@ -776,7 +1188,7 @@ class BlenderUpdater(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
             self.lbl_quick.hide()
 
     def exec_windows(self):
-        blender_exe = Path(self.install_path) / "blender.exe"
+        blender_exe = self._get_blender_dir() / "blender.exe"
         if blender_exe.exists():
             subprocess.Popen([str(blender_exe)])
             logger.info(f"Executing {blender_exe}")
@@ -788,7 +1200,7 @@ class BlenderUpdater(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
 
     def exec_osx(self):
         blender_executable = (
-            Path(self.install_path) / "blender.app" / "Contents" / "MacOS" / "blender"
+            self._get_blender_dir() / "blender.app" / "Contents" / "MacOS" / "blender"
         )
         if blender_executable.exists():
             try:
@@ -808,7 +1220,7 @@ class BlenderUpdater(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
             )
 
     def exec_linux(self):
-        blender_executable = Path(self.install_path) / "blender"
+        blender_executable = self._get_blender_dir() / "blender"
         if blender_executable.exists():
             try:
                 current_mode = os.stat(str(blender_executable)).st_mode
@@ -830,87 +1242,53 @@ class BlenderUpdater(QtWidgets.QMainWindow, mainwindow.Ui_MainWindow):
         self._update_config(CONFIG_KEY_OS_FILTER, os_name_key)
 
         filter_map = {
-            "all": [],
-            "darwin": ["darwin", "macos"],
-            "linux": ["linux"],
-            "windows": ["windows", "win64", "win32"],
+            "all": None,
+            "darwin": "macos",
+            "linux": "linux",
+            "windows": "windows",
         }
-        self.render_buttons(os_filter_keywords=filter_map.get(os_name_key.lower(), []))
+        self.render_buttons(os_filter=filter_map.get(os_name_key.lower()))
 
-    def render_buttons(self, os_filter_keywords=None):
-        if os_filter_keywords is None:
-            os_filter_keywords = []
+    def _set_latest_only(self, latest_only):
+        self._update_config(CONFIG_KEY_LATEST_ONLY, str(latest_only).lower())
+        self._set_os_filter(self._get_config(CONFIG_KEY_OS_FILTER, "all"))
 
-        opsys = platform.system()
-        logger.info(f"Operating system: {opsys}")
-
-        while self.scrollLayout.count():
-            child = self.scrollLayout.takeAt(0)
-            if child.widget():
-                child.widget().deleteLater()
-        self.build_buttons.clear()
-
-        os_arch_details = self._get_os_arch_details()
-
-        for index, entry_filename in enumerate(self.finallist):
-            if os_filter_keywords and not any(
-                keyword.lower() in entry_filename.lower()
-                for keyword in os_filter_keywords
-            ):
-                continue
-
-            self.build_buttons[index] = QtWidgets.QPushButton()
-
-            entry_lower = entry_filename.lower()
-            is_highlighted = False
-
-            if os_arch_details["exact"] and os_arch_details["exact"] in entry_lower:
-                is_highlighted = True
-            elif (
-                os_arch_details["generic_os"]
-                and os_arch_details["generic_os"] in entry_lower
-            ):
-                if not any(
-                    c in entry_lower
-                    for c in os_arch_details["conflicting_arch_for_os"]
-                ):
-                    is_highlighted = True
-
-            self.build_buttons[index].setProperty("highlight", is_highlighted)
-            if is_highlighted:
-                self.build_buttons[index].setProperty(
-                    "os", os_arch_details["generic_os"]
-                )
+    def _on_search_changed(self, text):
+        self.search_timer.start()
 
-            if "macos" in entry_lower or "darwin" in entry_lower:
-                self.build_buttons[index].setIcon(self.appleicon)
-            elif "linux" in entry_lower:
-                self.build_buttons[index].setIcon(self.linuxicon)
-            elif (
-                "windows" in entry_lower
-                or "win64" in entry_lower
-                or "win32" in entry_lower
-            ):
-                self.build_buttons[index].setIcon(self.windowsicon)
-
-            self.build_buttons[index].setIconSize(QtCore.QSize(24, 24))
-            self.build_buttons[index].setText(entry_filename)
-            self.build_buttons[index].setFixedWidth(670)
-            self.build_buttons[index].clicked.connect(
-                lambda checked=False, filename=entry_filename: self.download(filename)
-            )
+    def _apply_search(self):
+        self.build_proxy.set_filter(
+            self.build_proxy.os_filter,
+            self.chk_latest.isChecked(),
+            self.line_search.text(),
+        )
+        self._update_config(CONFIG_KEY_SEARCH, self.line_search.text())
 
-            self.scrollLayout.addWidget(self.build_buttons[index])
+    def render_buttons(self, os_filter=None):
+        self.build_proxy.set_filter(
+            os_filter, self.chk_latest.isChecked(), self.line_search.text()
+        )
 
-        self.scrollLayout.addStretch()
+    def _on_build_clicked(self, index):
+        build = index.data(BuildListModel.BuildRole)
+        if build is not None:
+            self.download(build.filename)
 
 
 def main():
+    startup_started = time.perf_counter()
     app = QtWidgets.QApplication(sys.argv)
     window = BlenderUpdater()
     window.setWindowTitle(f"Overmind Studios Blender Updater {appversion}")
     window.statusbar.setSizeGripEnabled(False)
     window.show()
+    # Logged once the event loop runs, i.e. when the window can first paint
+    QtCore.QTimer.singleShot(
+        0,
+        lambda: logger.info(
+            f"Startup took {(time.perf_counter() - startup_started) * 1000:.0f} ms"
+        ),
+    )
     app.exec()
 
 
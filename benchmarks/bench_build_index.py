@@ -0,0 +1,196 @@
+"""
+Copyright 2016-2019 Tobias Kummer/Overmind Studios.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# Compares build index parsers on a large page served from a local server.
+# The page mimics the markup of builder.blender.org/download/daily/ (one
+# list item per build with download, sha256 and details links), and the
+# JSON listing mimics its ?format=json&v=1 output.
+#
+#   python benchmarks/bench_build_index.py --builds 5000
+
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rangeserver
+
+from buildindex import (
+    INDEX_CHUNK_SIZE,
+    BuildInfo,
+    iter_html_builds,
+    iter_json_builds,
+)
+from downloader import make_session
+
+FILENAME_REGEX = re.compile(r'blender-\d+\.\d+[^"\s/]*\.(?:zip|tar\.xz|dmg|tar\.gz)')
+PLATFORMS = (
+    ("windows", "amd64", "zip"),
+    ("windows", "arm64", "zip"),
+    ("linux", "x86_64", "tar.xz"),
+    ("darwin", "x86_64", "dmg"),
+    ("darwin", "arm64", "dmg"),
+)
+ROW_TEMPLATE = """<li class="t-row build" data-platform="{platform}">
+  <div class="t-cell"><a class="b-version" href="{url}">
+    <span class="name">Blender {version}</span>
+    <span class="build-var">{risk}</span></a></div>
+  <div class="t-cell b-reference">{branch}
+    <a href="https://projects.blender.org/blender/blender/commit/{hash}">{hash}</a>
+  </div>
+  <div class="t-cell b-date" title="{mtime}">{mtime}</div>
+  <div class="t-cell b-arch">{arch}</div>
+  <div class="t-cell b-size">{size} MB</div>
+  <div class="t-cell b-down"><a href="{url}" title="Download {filename}">
+    <i class="i-download"></i>{filename}</a>
+    <a class="sha" href="{url}.sha256">SHA-256</a></div>
+</li>
+"""
+
+
+def build_fixtures(directory, count):
+    """Writes index.html and listing.json describing `count` builds."""
+    base_url = "https://builder.blender.org/download/daily/"
+    entries = []
+    for index in range(count):
+        platform, arch, extension = PLATFORMS[index % len(PLATFORMS)]
+        version = f"4.{index // 500 % 5}.{index // 50 % 10}"
+        build_hash = f"{index * 2654435761 % 2**48:012x}"
+        branch = "main" if index % 3 else f"v4{index % 5}"
+        filename = (
+            f"blender-{version}-alpha+{branch}.{build_hash}-"
+            f"{platform}.{arch}-release.{extension}"
+        )
+        entries.append(
+            {
+                "app": "Blender",
+                "url": base_url + filename,
+                "version": version,
+                "branch": branch,
+                "risk_id": "alpha",
+                "hash": build_hash,
+                "platform": platform,
+                "architecture": arch,
+                "file_mtime": 1700000000 + index,
+                "file_name": filename,
+                "file_size": 300000000 + index,
+                "file_extension": extension.rsplit(".", 1)[-1],
+            }
+        )
+    with open(os.path.join(directory, "index.html"), "w") as f:
+        f.write("<html><head><title>Blender Builds</title></head><body><ul>\n")
+        f.writelines(
+            ROW_TEMPLATE.format(
+                platform=entry["platform"],
+                url=entry["url"],
+                version=entry["version"],
+                risk=entry["risk_id"],
+                branch=entry["branch"],
+                hash=entry["hash"],
+                mtime=entry["file_mtime"],
+                arch=entry["architecture"],
+                size=entry["file_size"] // 1000000,
+                filename=entry["file_name"],
+            )
+            for entry in entries
+        )
+        f.write("</ul></body></html>\n")
+    with open(os.path.join(directory, "listing.json"), "w") as f:
+        json.dump(entries, f, indent=2)
+
+
+def regex_over_text(session, url):
+    """The previous approach: decode the whole page, findall, set and sort."""
+    text = session.get(url).text
+    names = sorted(set(FILENAME_REGEX.findall(text)), reverse=True)
+    return [BuildInfo.from_filename(name, url) for name in names]
+
+
+def streamed_html(session, url):
+    with session.get(url, stream=True) as response:
+        chunks = response.iter_content(INDEX_CHUNK_SIZE)
+        names = set(iter_html_builds(chunks, FILENAME_REGEX))
+    return [BuildInfo.from_filename(name, url) for name in sorted(names, reverse=True)]
+
+
+def streamed_json(session, url):
+    with session.get(url, stream=True) as response:
+        chunks = response.iter_content(INDEX_CHUNK_SIZE)
+        unique = {
+            build.filename: build
+            for build in iter_json_builds(chunks, FILENAME_REGEX, url)
+        }
+    return [unique[name] for name in sorted(unique, reverse=True)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare build index parsers")
+    parser.add_argument("--builds", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-index-") as tmp:
+        build_fixtures(tmp, args.builds)
+        html_size = os.path.getsize(os.path.join(tmp, "index.html"))
+        json_size = os.path.getsize(os.path.join(tmp, "listing.json"))
+        print(
+            f"{args.builds} builds, page {html_size / 1024 / 1024:.1f} MB, "
+            f"JSON listing {json_size / 1024 / 1024:.1f} MB"
+        )
+
+        server = rangeserver.serve(tmp)
+        session = make_session()
+        base = rangeserver.base_url(server)
+        runs = [
+            ("regex over page text", regex_over_text, base + "index.html"),
+            ("streamed HTML", streamed_html, base + "index.html"),
+            ("streamed JSON", streamed_json, base + "listing.json"),
+        ]
+        try:
+            expected = None
+            for label, parse, url in runs:
+                best = None
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    builds = parse(session, url)
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                # Peak memory is measured separately, tracing slows parsing down
+                tracemalloc.start()
+                parse(session, url)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+                filenames = [build.filename for build in builds]
+                expected = expected or filenames
+                status = "ok" if filenames == expected else "MISMATCH"
+                print(
+                    f"{label:<22} {best * 1000:8.1f} ms   "
+                    f"peak {peak / 1024 / 1024:6.1f} MB   {len(builds)} builds {status}"
+                )
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
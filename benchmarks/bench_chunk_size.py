@@ -0,0 +1,107 @@
+"""
+Copyright 2016-2019 Tobias Kummer/Overmind Studios.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# Compares the CPU time the download loop needs per GB with fixed 8 KB
+# chunks (the previous loop), fixed 1 MB chunks and adaptive chunk sizes.
+# Only the client thread's CPU time is counted, the local server runs in
+# other threads. Hashing is left out since it costs the same in each loop.
+#
+#   python benchmarks/bench_chunk_size.py --size-mb 256 --rate-mb 0 50
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rangeserver
+
+from downloader import ChunkSizer, iter_body, make_session
+
+GB = 1024 * 1024 * 1024
+
+
+def fixed_chunks(chunk_size):
+    def read(response):
+        return response.iter_content(chunk_size=chunk_size)
+
+    return read
+
+
+def adaptive_chunks(response):
+    return iter_body(response, sizer=ChunkSizer())
+
+
+def run(session, url, target, read):
+    started = time.perf_counter()
+    cpu_started = time.thread_time()
+    iterations = 0
+    size = 0
+    with session.get(url, stream=True) as response, open(target, "wb") as f:
+        response.raise_for_status()
+        for chunk in read(response):
+            f.write(chunk)
+            iterations += 1
+            size += len(chunk)
+    return size, iterations, time.thread_time() - cpu_started, started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare download chunk sizes")
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument(
+        "--rate-mb",
+        type=float,
+        nargs="+",
+        default=[0, 50],
+        help="server rate caps to test in MB/s (0 = unlimited)",
+    )
+    args = parser.parse_args()
+
+    loops = [
+        ("8 KB chunks", fixed_chunks(8192)),
+        ("1 MB chunks", fixed_chunks(1024 * 1024)),
+        ("adaptive", adaptive_chunks),
+    ]
+    with tempfile.TemporaryDirectory(prefix="bench-chunks-") as tmp:
+        served = os.path.join(tmp, "served")
+        os.makedirs(served)
+        with open(os.path.join(served, "blender-test.tar.xz"), "wb") as f:
+            f.writelines(os.urandom(1024 * 1024) for _ in range(args.size_mb))
+        target = os.path.join(tmp, "download")
+
+        for rate_mb in args.rate_mb:
+            server = rangeserver.serve(served, rate_limit=int(rate_mb * 1024 * 1024))
+            url = rangeserver.base_url(server) + "blender-test.tar.xz"
+            session = make_session(1)
+            print(f"server rate: {'unlimited' if not rate_mb else f'{rate_mb} MB/s'}")
+            try:
+                for label, read in loops:
+                    size, iterations, cpu, started = run(session, url, target, read)
+                    elapsed = time.perf_counter() - started
+                    print(
+                        f"  {label:<12} {cpu * GB / size:6.2f} s CPU/GB  "
+                        f"{elapsed:6.2f}s wall  {iterations:>7} iterations"
+                    )
+            finally:
+                server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Copyright 2016-2019 Tobias Kummer/Overmind Studios.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# Compares single-stream and segmented downloads against a local server.
+#
+#   python benchmarks/bench_download.py --size-mb 64 --rate-mb 8 --connections 1 4 8
+
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rangeserver
+
+from downloader import SegmentedDownloader, make_session
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare single-stream and segmented downloads"
+    )
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument(
+        "--rate-mb",
+        type=float,
+        default=8,
+        help="per-connection rate cap of the server in MB/s (0 = unlimited)",
+    )
+    parser.add_argument("--connections", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument(
+        "--no-ranges", action="store_true", help="serve without Accept-Ranges"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-download-") as tmp:
+        served = os.path.join(tmp, "served")
+        os.makedirs(served)
+        source = os.path.join(served, "blender-test.tar.xz")
+        with open(source, "wb") as f:
+            f.writelines(os.urandom(1024 * 1024) for _ in range(args.size_mb))
+        expected = _sha256(source)
+
+        server = rangeserver.serve(
+            served,
+            accept_ranges=not args.no_ranges,
+            rate_limit=int(args.rate_mb * 1024 * 1024),
+        )
+        url = rangeserver.base_url(server) + "blender-test.tar.xz"
+        try:
+            for connections in args.connections:
+                target = os.path.join(tmp, f"download-{connections}")
+                downloader = SegmentedDownloader(
+                    make_session(connections), url, target, connections=connections
+                )
+                result = downloader.run()
+                ok = "ok" if _sha256(target) == expected else "CORRUPT"
+                print(
+                    f"connections={connections:<3} used={result.connections:<3} "
+                    f"{result.elapsed:6.2f}s "
+                    f"{result.throughput / 1024 / 1024:8.1f} MB/s  {ok}"
+                )
+                os.remove(target)
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
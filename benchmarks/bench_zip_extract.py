@@ -0,0 +1,109 @@
+"""
+Copyright 2016-2019 Tobias Kummer/Overmind Studios.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# Compares zip extraction strategies on a synthetic Blender-like archive.
+#
+#   python benchmarks/bench_zip_extract.py --files 20000 --threads 1 4 8
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extractor import ArchiveExtractor
+
+ROOT_NAME = "blender-4.2.0-windows-x64"
+
+
+def build_archive(path, file_count):
+    """Writes a zip with `file_count` small files spread over nested folders."""
+    rng = random.Random(0)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+        for index in range(file_count):
+            folder = f"4.2/python/lib/pkg{index % 200}/sub{index % 7}"
+            # Mostly tiny files with the occasional larger one, like the stdlib
+            size = rng.choice((200, 800, 2000, 6000, 40000))
+            payload = rng.randbytes(size // 4) * 4
+            archive.writestr(f"{ROOT_NAME}/{folder}/module{index}.py", payload)
+
+
+def old_path(archive_path, work_dir):
+    """unpack_archive into a temp folder, then copytree into the install folder."""
+    extract_dir = os.path.join(work_dir, "extracted")
+    install_dir = os.path.join(work_dir, "install")
+    shutil.unpack_archive(archive_path, extract_dir)
+    shutil.copytree(
+        os.path.join(extract_dir, ROOT_NAME), install_dir, dirs_exist_ok=True
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare zip extraction strategies")
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument(
+        "--threads", type=int, nargs="+", default=[1, 4, os.cpu_count() or 4]
+    )
+    parser.add_argument("--dir", help="scratch folder (defaults to the temp folder)")
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="rounds to run; strategies are interleaved and the best time is kept",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-zip-", dir=args.dir) as tmp:
+        archive_path = os.path.join(tmp, f"{ROOT_NAME}.zip")
+        build_archive(archive_path, args.files)
+        print(
+            f"archive: {args.files} files, "
+            f"{os.path.getsize(archive_path) / 1024 / 1024:.1f} MB"
+        )
+
+        runs = [("unpack_archive + copytree", lambda d: old_path(archive_path, d))]
+        for threads in args.threads:
+            runs.append(
+                (
+                    f"ArchiveExtractor workers={threads}",
+                    lambda d, t=threads: ArchiveExtractor(
+                        archive_path, d, workers=t
+                    ).run(),
+                )
+            )
+
+        best = {}
+        for _ in range(args.repeat):
+            for label, extract in runs:
+                work_dir = tempfile.mkdtemp(dir=tmp)
+                started = time.perf_counter()
+                extract(work_dir)
+                elapsed = time.perf_counter() - started
+                best[label] = min(elapsed, best.get(label, elapsed))
+                shutil.rmtree(work_dir)
+
+        for label, _ in runs:
+            print(f"{label:<32} {best[label]:7.2f}s")
+
+
+if __name__ == "__main__":
+    main()
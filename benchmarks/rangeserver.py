@@ -0,0 +1,122 @@
+"""
+Copyright 2016-2019 Tobias Kummer/Overmind Studios.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# Local stand-in for builder.blender.org used by the benchmarks. Serves files
+# from a directory with optional Range support and a per-connection rate cap,
+# which mimics a single TCP stream topping out below line rate.
+
+import os
+import re
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+RANGE_REGEX = re.compile(r"bytes=(\d*)-(\d*)")
+WRITE_BLOCK_SIZE = 64 * 1024
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Serves static files, honouring single `Range: bytes=a-b` requests."""
+
+    protocol_version = "HTTP/1.1"
+    accept_ranges = True
+    rate_limit = 0  # bytes per second per connection, 0 for unlimited
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._serve(head_only=True)
+
+    def do_GET(self):
+        self._serve(head_only=False)
+
+    def _serve(self, head_only):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        status = 200
+        match = RANGE_REGEX.fullmatch(self.headers.get("Range", ""))
+        if self.accept_ranges and match:
+            first, last = match.groups()
+            if first:
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+            elif last:
+                start = max(0, size - int(last))
+            if start > end:
+                self.send_error(416)
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start + 1))
+        if self.accept_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        stat = os.stat(path)
+        self.send_header("ETag", f'"{stat.st_size:x}-{int(stat.st_mtime):x}"')
+        self.send_header("Last-Modified", self.date_time_string(stat.st_mtime))
+        self.end_headers()
+        if head_only:
+            return
+
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            started = time.monotonic()
+            sent = 0
+            while remaining > 0:
+                block = f.read(min(WRITE_BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                try:
+                    self.wfile.write(block)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                remaining -= len(block)
+                sent += len(block)
+                if self.rate_limit:
+                    ahead = sent / self.rate_limit - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+
+def serve(directory, accept_ranges=True, rate_limit=0, port=0):
+    """Starts a server in a background thread and returns it; call shutdown() to stop."""
+    handler = type(
+        "ConfiguredRangeRequestHandler",
+        (RangeRequestHandler,),
+        {"accept_ranges": accept_ranges, "rate_limit": rate_limit},
+    )
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", port), partial(handler, directory=directory)
+    )
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def base_url(server):
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/"
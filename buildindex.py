@@ -0,0 +1,556 @@
+"""
+Copyright 2016-2019 Tobias Kummer/Overmind Studios.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import bisect
+import codecs
+import json
+import logging
+import os
+import platform
+import re
+import time
+
+import requests
+from packaging.version import InvalidVersion, Version
+
+BLENDER_DOWNLOAD_URL = "https://builder.blender.org/download/daily/"
+BUILD_INDEX_FILE_NAME = "build-index.json"
+BUILD_INDEX_TIMEOUT = 15
+INDEX_CHUNK_SIZE = 64 * 1024
+# Longest build filename a match may need to span two chunks
+MAX_FILENAME_LENGTH = 256
+# builder.blender.org serves the same listing as JSON with these parameters
+JSON_INDEX_QUERY = "?format=json&v=1"
+SOURCE_JSON = "json"
+SOURCE_HTML = "html"
+
+# Build archives linked from the download page
+BUILD_FILENAME_REGEX = re.compile(
+    r'blender-\d+\.\d+[^"\s/]*\.(?:zip|tar\.xz|dmg|tar\.gz)'
+)
+# e.g. blender-4.2.0-alpha+main.a1b2c3d4e5f6-linux.x86_64-release.tar.xz
+BUILD_NAME_REGEX = re.compile(
+    r"^blender-(?P<version>\d+\.\d+(?:\.\d+)?)"
+    r"(?:-(?P<risk>[a-z]+)\+(?P<branch>[^.]+)\.(?P<hash>[0-9a-f]+))?"
+    r"-(?P<platform>.+?)(?:-release)?"
+    r"\.(?P<archive>zip|tar\.xz|tar\.gz|tar\.bz2|dmg)$",
+    re.IGNORECASE,
+)
+ARCHIVE_TYPES = ("zip", "tar.xz", "tar.gz", "tar.bz2", "dmg")
+
+# Keywords in the platform part of a filename, older builds used e.g. "win64"
+OS_KEYWORDS = (
+    ("windows", "windows"),
+    ("win64", "windows"),
+    ("win32", "windows"),
+    ("macos", "macos"),
+    ("darwin", "macos"),
+    ("linux", "linux"),
+)
+ARCH_KEYWORDS = (
+    ("x86_64", "x86_64"),
+    ("amd64", "x86_64"),
+    ("x64", "x86_64"),
+    ("win64", "x86_64"),
+    ("linux64", "x86_64"),
+    ("arm64", "arm64"),
+    ("aarch64", "arm64"),
+    ("x86", "x86"),
+    ("win32", "x86"),
+    ("i686", "x86"),
+)
+HOST_OS_NAMES = {"Windows": "windows", "Darwin": "macos", "Linux": "linux"}
+# Release stages of the same version, later stages sort as newer
+RISK_ORDER = {"alpha": 0, "beta": 1, "rc": 2, "candidate": 2, "stable": 3}
+UNKNOWN_VERSION = Version("0")
+# Separators between the searchable parts of a build filename
+TOKEN_SPLIT_REGEX = re.compile(r"[-+\s]+")
+
+logger = logging.getLogger(__name__)
+
+
+def _match_keyword(text, keywords):
+    for keyword, value in keywords:
+        if keyword in text:
+            return value
+    return None
+
+
+def host_platform():
+    """Returns (os, arch) of this machine in the terms used by BuildInfo."""
+    machine = platform.machine().lower()
+    return (
+        HOST_OS_NAMES.get(platform.system()),
+        _match_keyword(machine, ARCH_KEYWORDS) or machine,
+    )
+
+
+class BuildInfo:
+    """A build offered on the download page, parsed once from its filename.
+
+    `os` is "windows", "macos" or "linux" and `arch` one of "x86_64",
+    "arm64" or "x86"; either is None if the filename does not tell. `date`
+    and `size` are only known when the index provides them.
+    """
+
+    FIELDS = (
+        "filename",
+        "version",
+        "risk",
+        "branch",
+        "build_hash",
+        "date",
+        "os",
+        "arch",
+        "archive_type",
+        "size",
+        "url",
+    )
+    __slots__ = (*FIELDS, "_sort_key")
+
+    def __init__(
+        self,
+        filename,
+        version=None,
+        risk=None,
+        branch=None,
+        build_hash=None,
+        date=None,
+        os=None,
+        arch=None,
+        archive_type=None,
+        size=None,
+        url=None,
+    ):
+        self.filename = filename
+        self.version = version
+        self.risk = risk
+        self.branch = branch
+        self.build_hash = build_hash
+        self.date = date
+        self.os = os
+        self.arch = arch
+        self.archive_type = archive_type
+        self.size = size
+        self.url = url
+        self._sort_key = None
+
+    def __repr__(self):
+        return f"BuildInfo({self.filename!r})"
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    @classmethod
+    def from_filename(cls, filename, base_url=""):
+        lower = filename.lower()
+        match = BUILD_NAME_REGEX.match(lower)
+        if match:
+            platform_part = match["platform"]
+            archive_type = match["archive"]
+        else:
+            platform_part = lower
+            archive_type = next(
+                (t for t in ARCHIVE_TYPES if lower.endswith("." + t)), None
+            )
+        return cls(
+            filename,
+            version=match["version"] if match else None,
+            risk=match["risk"] if match else None,
+            branch=match["branch"] if match else None,
+            build_hash=match["hash"] if match else None,
+            os=_match_keyword(platform_part, OS_KEYWORDS),
+            arch=_match_keyword(platform_part, ARCH_KEYWORDS),
+            archive_type=archive_type,
+            url=base_url + filename,
+        )
+
+    @property
+    def sort_key(self):
+        """Orders builds by version, release stage and date; larger is newer.
+
+        Computed on first use and kept, so sorting and re-sorting a list
+        parses every version only once.
+        """
+        if self._sort_key is None:
+            try:
+                version = Version(self.version) if self.version else UNKNOWN_VERSION
+            except InvalidVersion:
+                version = UNKNOWN_VERSION
+            self._sort_key = (
+                version,
+                RISK_ORDER.get(self.risk, -1),
+                self.date or 0,
+                self.filename,
+            )
+        return self._sort_key
+
+    def matches_host(self, host_os, host_arch):
+        """True if the build runs on the given platform, unknown arch included."""
+        return self.os == host_os and self.arch in (host_arch, None)
+
+
+def sort_builds(builds):
+    """Returns `builds` newest first, e.g. 4.10 before 4.9."""
+    return sorted(builds, key=lambda build: build.sort_key, reverse=True)
+
+
+def latest_builds(builds):
+    """Keeps the newest build of each branch and platform of a newest-first list."""
+    seen = set()
+    latest = []
+    for build in builds:
+        group = (build.branch, build.os, build.arch)
+        if group not in seen:
+            seen.add(group)
+            latest.append(build)
+    return latest
+
+
+def _build_tokens(build):
+    """Returns the lowercase words a search can match a build by."""
+    tokens = set(TOKEN_SPLIT_REGEX.split(build.filename.lower()))
+    for value in (
+        build.version,
+        build.risk,
+        build.branch,
+        build.build_hash,
+        build.os,
+        build.arch,
+        build.archive_type,
+    ):
+        if value:
+            tokens.add(value.lower())
+    tokens.discard("")
+    return tokens
+
+
+class BuildIndex:
+    """Builds in display order, indexed by OS, architecture and branch.
+
+    Filtering on one key is a dictionary lookup; with several keys only the
+    smallest matching bucket is scanned. A sorted token list with postings
+    answers search queries by prefix, e.g. "main 4.2 arm" or a hash prefix.
+    """
+
+    def __init__(self, builds):
+        self.builds = list(builds)
+        self.by_os = {}
+        self.by_arch = {}
+        self.by_branch = {}
+        self._positions = {}
+        postings = {}
+        for position, build in enumerate(self.builds):
+            self.by_os.setdefault(build.os, []).append(build)
+            self.by_arch.setdefault(build.arch, []).append(build)
+            self.by_branch.setdefault(build.branch, []).append(build)
+            self._positions[id(build)] = position
+            for token in _build_tokens(build):
+                postings.setdefault(token, []).append(position)
+        self._postings = postings
+        self._tokens = sorted(postings)
+
+    @classmethod
+    def from_filenames(cls, filenames, base_url=""):
+        return cls(BuildInfo.from_filename(name, base_url) for name in filenames)
+
+    def __len__(self):
+        return len(self.builds)
+
+    def __iter__(self):
+        return iter(self.builds)
+
+    @property
+    def filenames(self):
+        return [build.filename for build in self.builds]
+
+    def search(self, query):
+        """Returns the positions of builds with a token starting with every word."""
+        matched = None
+        for term in query.lower().split():
+            term_matches = set()
+            start = bisect.bisect_left(self._tokens, term)
+            for token in self._tokens[start:]:
+                if not token.startswith(term):
+                    break
+                term_matches.update(self._postings[token])
+            matched = term_matches if matched is None else matched & term_matches
+            if not matched:
+                return set()
+        return set(range(len(self.builds))) if matched is None else matched
+
+    def filter(self, os=None, arch=None, branch=None, query=""):
+        """Returns the builds matching every given key and query, in display order."""
+        wanted = [
+            (name, value, index)
+            for name, value, index in (
+                ("os", os, self.by_os),
+                ("arch", arch, self.by_arch),
+                ("branch", branch, self.by_branch),
+            )
+            if value is not None
+        ]
+        if query.strip():
+            matched = self.search(query)
+            # Walk whichever is shorter, the search hits or the bucket
+            smallest = min(
+                (index.get(value, []) for _, value, index in wanted),
+                key=len,
+                default=None,
+            )
+            if smallest is None or len(matched) < len(smallest):
+                candidates = [self.builds[position] for position in sorted(matched)]
+            else:
+                candidates = [
+                    build for build in smallest if self._positions[id(build)] in matched
+                ]
+            return [
+                build
+                for build in candidates
+                if all(getattr(build, name) == value for name, value, _ in wanted)
+            ]
+        if not wanted:
+            return self.builds
+        buckets = [(index.get(value, []), name, value) for name, value, index in wanted]
+        buckets.sort(key=lambda bucket: len(bucket[0]))
+        smallest, *rest = buckets
+        return [
+            build
+            for build in smallest[0]
+            if all(getattr(build, name) == value for _, name, value in rest)
+        ]
+
+
+def iter_html_builds(chunks, filename_regex):
+    """Yields build filenames found in an HTML page given as byte chunks.
+
+    Only a small tail of the previous chunk is carried over, so the page is
+    never held in memory as a whole.
+    """
+    text_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buffer = ""
+    for chunk in chunks:
+        buffer += text_decoder.decode(chunk)
+        # A match this close to the end may continue in the next chunk
+        safe_end = len(buffer) - MAX_FILENAME_LENGTH
+        keep_from = max(0, safe_end)
+        for match in filename_regex.finditer(buffer):
+            if match.end() > safe_end:
+                keep_from = min(keep_from, match.start())
+                break
+            yield match.group()
+            keep_from = max(keep_from, match.end())
+        buffer = buffer[keep_from:]
+    buffer += text_decoder.decode(b"", final=True)
+    for match in filename_regex.finditer(buffer):
+        yield match.group()
+
+
+def iter_json_array(chunks):
+    """Yields the objects of a JSON array given as byte chunks, one at a time."""
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    started = False
+    for chunk in chunks:
+        buffer += text_decoder.decode(chunk)
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != "[":
+                    raise ValueError("Build listing is not a JSON array")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                return
+            if buffer[position] != "{":
+                raise ValueError("Unexpected value in JSON build listing")
+            try:
+                entry, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                # Incomplete object, wait for the next chunk
+                break
+            yield entry
+        buffer = buffer[position:]
+    raise ValueError("Truncated JSON build listing")
+
+
+def iter_json_builds(chunks, filename_regex, base_url=""):
+    """Yields a BuildInfo for every archive in builder.blender.org's JSON listing."""
+    for entry in iter_json_array(chunks):
+        filename = entry.get("file_name")
+        if not isinstance(filename, str) or not filename_regex.fullmatch(filename):
+            continue
+        build = BuildInfo.from_filename(filename, base_url)
+        build.url = entry.get("url") or build.url
+        build.size = entry.get("file_size")
+        build.date = entry.get("file_mtime")
+        build.os = build.os or _match_keyword(
+            str(entry.get("platform", "")).lower(), OS_KEYWORDS
+        )
+        build.arch = build.arch or _match_keyword(
+            str(entry.get("architecture", "")).lower(), ARCH_KEYWORDS
+        )
+        yield build
+
+
+class BuildIndexCache:
+    """Parsed build list of the download page together with its validators.
+
+    The ETag and Last-Modified of the response the list was parsed from are
+    sent back as a conditional request, so an unchanged page costs a 304
+    round-trip instead of a full download and parse. `source` records
+    whether the list came from the JSON listing or the HTML page.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.url = None
+        self.source = None
+        self.etag = ""
+        self.last_modified = ""
+        self.fetched = 0
+        self.builds = []
+
+    def load(self):
+        """Reads the cache file, returns True if it held a build list."""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.url = data["url"]
+            self.source = data.get("source")
+            self.etag = data.get("etag", "")
+            self.last_modified = data.get("last_modified", "")
+            self.fetched = data.get("fetched", 0)
+            self.builds = sort_builds(
+                BuildInfo.from_dict(entry) for entry in data["builds"]
+            )
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable build index cache {self.path}: {e}")
+            return False
+        return bool(self.builds)
+
+    def save(self):
+        data = {
+            "url": self.url,
+            "source": self.source,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "fetched": self.fetched,
+            "builds": [build.to_dict() for build in self.builds],
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.path)
+
+    def builds_for(self, url):
+        """Returns the cached build list if it was fetched from `url`."""
+        return self.builds if self.url == url else []
+
+    def conditional_headers(self, url, source):
+        if self.url != url or self.source != source or not self.builds:
+            return {}
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+def fetch_build_index(
+    session, url, filename_regex, cache=None, timeout=BUILD_INDEX_TIMEOUT
+):
+    """Returns (builds, not_modified) for the download page at `url`.
+
+    The JSON listing of the page is preferred and the HTML page is parsed if
+    the server does not provide one. Both are parsed while they stream in.
+    With a cache the request is conditional; a 304 returns the cached list.
+    A changed listing is parsed and written back to the cache.
+    """
+    sources = [SOURCE_JSON, SOURCE_HTML]
+    if cache is not None and cache.url == url and cache.source == SOURCE_HTML:
+        # The server had no JSON listing last time, don't ask again first
+        sources.reverse()
+
+    for source in sources:
+        try:
+            return _fetch_source(session, url, source, filename_regex, cache, timeout)
+        except (requests.exceptions.HTTPError, ValueError) as e:
+            if source == sources[-1]:
+                raise
+            logger.info(f"No {source} build listing at {url}, trying next: {e}")
+
+
+def _fetch_source(session, url, source, filename_regex, cache, timeout):
+    headers = cache.conditional_headers(url, source) if cache is not None else {}
+    source_url = url + JSON_INDEX_QUERY if source == SOURCE_JSON else url
+    with session.get(
+        source_url, headers=headers, timeout=timeout, stream=True
+    ) as response:
+        if response.status_code == 304 and headers:
+            logger.info(f"Build index unchanged since last check: {source_url}")
+            cache.fetched = time.time()
+            _save_cache(cache)
+            return cache.builds, True
+
+        response.raise_for_status()
+        chunks = response.iter_content(INDEX_CHUNK_SIZE)
+        if source == SOURCE_JSON:
+            content_type = response.headers.get("Content-Type", "")
+            if "json" not in content_type:
+                raise ValueError(f"unexpected content type {content_type!r}")
+            unique = {
+                build.filename: build
+                for build in iter_json_builds(chunks, filename_regex, url)
+            }
+        else:
+            # The page links every build several times, parse each name once
+            names = set(iter_html_builds(chunks, filename_regex))
+            unique = {name: BuildInfo.from_filename(name, url) for name in names}
+
+    builds = sort_builds(unique.values())
+    if cache is not None:
+        cache.url = url
+        cache.source = source
+        cache.etag = response.headers.get("ETag", "")
+        cache.last_modified = response.headers.get("Last-Modified", "")
+        cache.fetched = time.time()
+        cache.builds = builds
+        _save_cache(cache)
+    return builds, False
+
+
+def _save_cache(cache):
+    # The cache only saves a request, failing to write it is not an error
+    try:
+        cache.save()
+    except OSError as e:
+        logger.warning(f"Failed to write build index cache {cache.path}: {e}")
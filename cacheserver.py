@@ -0,0 +1,529 @@
+"""
+Copyright 2016-2019 Tobias Kummer/Overmind Studios.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# Caching mirror of the build server for a local network. Each archive and
+# checksum is fetched from upstream once and served to every workstation
+# from disk, e.g.
+#
+#   python cacheserver.py --cache-dir /srv/blender-cache --port 8080
+#
+# and `download_url = http://cachehost:8080/` in each client's config.ini.
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from buildindex import BLENDER_DOWNLOAD_URL, BUILD_FILENAME_REGEX
+from downloader import DOWNLOAD_TIMEOUT, iter_body, make_session
+
+DEFAULT_PORT = 8080
+DEFAULT_MAX_SIZE_GB = 20
+# The listing changes a few times a day, fetching it once a minute is plenty
+LISTING_TTL = 60
+SERVE_BLOCK_SIZE = 256 * 1024
+# Written once a file is complete, a file without one is a partial download
+META_SUFFIX = ".meta.json"
+# Upstream downloads are written under this name until they are complete
+PARTIAL_SUFFIX = ".part"
+RANGE_REGEX = re.compile(r"bytes=(\d*)-(\d*)")
+
+logger = logging.getLogger(__name__)
+
+
+class _Fetch:
+    """An upstream download in progress, which clients can read as it grows."""
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path + PARTIAL_SUFFIX
+        self.final_path = path
+        self.size = None
+        self.meta = {}
+        self.written = 0
+        self.status = None
+        self.done = False
+        self.failed = False
+        self.condition = threading.Condition()
+
+    def set_headers(self, response):
+        length = response.headers.get("Content-Length")
+        with self.condition:
+            self.status = response.status_code
+            self.size = int(length) if length else None
+            self.meta = {
+                "etag": response.headers.get("ETag", ""),
+                "last_modified": response.headers.get("Last-Modified", ""),
+            }
+            self.condition.notify_all()
+
+    def wait_for_headers(self):
+        with self.condition:
+            while self.status is None and not self.failed:
+                self.condition.wait()
+        return self.status
+
+    def wait_for(self, position):
+        """Blocks until bytes beyond `position` exist, returns False at the end."""
+        with self.condition:
+            while self.written <= position and not self.done and not self.failed:
+                self.condition.wait()
+            if self.failed:
+                raise OSError(f"Upstream download of {self.name} failed")
+            return self.written > position
+
+    def open(self):
+        # The partial file is renamed once complete; a reader holding it
+        # open keeps reading the same file
+        with self.condition:
+            return open(self.final_path if self.done else self.path, "rb")
+
+
+class ArchiveCache:
+    """Files fetched from upstream, evicting the least recently used beyond a size.
+
+    Recency is kept in memory and mirrored to the files' mtimes, so the
+    order survives a restart. Concurrent requests for a file that is not
+    cached yet share a single upstream download. It is written to a
+    partial file that only replaces the cached name once complete, so a
+    failed fetch never touches a file that is already cached.
+    """
+
+    def __init__(self, directory, max_size, upstream, session):
+        self.directory = directory
+        self.max_size = max_size
+        self.upstream = upstream
+        self.session = session
+        self._entries = OrderedDict()
+        self._fetches = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        cached = []
+        names = set(os.listdir(directory))
+        for name in names:
+            if name.endswith(META_SUFFIX):
+                continue
+            path = os.path.join(directory, name)
+            # Anything but build files the server wrote is left alone
+            archive = name.removesuffix(PARTIAL_SUFFIX).removesuffix(".sha256")
+            if (
+                not BUILD_FILENAME_REGEX.fullmatch(archive)
+                or os.path.islink(path)
+                or not os.path.isfile(path)
+            ):
+                continue
+            if name + META_SUFFIX not in names:
+                logger.info(f"Removing partial download {name}")
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"Could not remove {path}: {e}")
+                continue
+            stat_result = os.stat(path)
+            cached.append((stat_result.st_mtime, name, stat_result.st_size))
+        for _, name, size in sorted(cached):
+            self._entries[name] = size
+
+    @property
+    def total_size(self):
+        return sum(self._entries.values())
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def load_meta(self, name):
+        try:
+            with open(self.path(name) + META_SUFFIX) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def lookup(self, name, start=True):
+        """Returns "cached" or a _Fetch of `name`, starting the fetch if needed.
+
+        With `start` False, None is returned instead of starting a fetch.
+        """
+        with self._lock:
+            if name in self._entries and os.path.exists(self.path(name)):
+                self._entries.move_to_end(name)
+                try:
+                    os.utime(self.path(name))
+                except OSError:
+                    pass
+                return "cached"
+            fetch = self._fetches.get(name)
+            if fetch is None and not start:
+                return None
+            if fetch is None:
+                fetch = _Fetch(name, self.path(name))
+                self._fetches[name] = fetch
+                threading.Thread(
+                    target=self._fetch, args=(fetch,), name=f"fetch-{name}", daemon=True
+                ).start()
+            return fetch
+
+    def _evict(self, needed):
+        # Called with the lock held. Files being served stay readable on
+        # POSIX; where they cannot be removed they are retried next time.
+        for name in list(self._entries):
+            if self.total_size + needed <= self.max_size:
+                break
+            try:
+                os.remove(self.path(name) + META_SUFFIX)
+                os.remove(self.path(name))
+            except OSError as e:
+                logger.warning(f"Could not evict {name}: {e}")
+                continue
+            logger.info(f"Evicted {name} ({self._entries[name]} bytes)")
+            del self._entries[name]
+
+    def _fetch(self, fetch):
+        url = self.upstream + fetch.name
+        try:
+            with self.session.get(
+                url, stream=True, timeout=DOWNLOAD_TIMEOUT
+            ) as response:
+                if response.status_code != 200:
+                    fetch.set_headers(response)
+                    raise OSError(f"Upstream answered {response.status_code}")
+                # The partial file exists before readers are told about it
+                with open(fetch.path, "wb") as f:
+                    fetch.set_headers(response)
+                    with self._lock:
+                        self._evict(fetch.size or 0)
+                    logger.info(f"Fetching {url}")
+                    for chunk in iter_body(response):
+                        f.write(chunk)
+                        f.flush()
+                        with fetch.condition:
+                            fetch.written += len(chunk)
+                            fetch.condition.notify_all()
+            if fetch.size is not None and fetch.written != fetch.size:
+                raise OSError(f"Got {fetch.written} of {fetch.size} bytes")
+            # Renamed before the meta file is written, so a crash in between
+            # leaves a file without one, which is removed as partial
+            with fetch.condition:
+                os.replace(fetch.path, fetch.final_path)
+                fetch.done = True
+            with open(fetch.final_path + META_SUFFIX, "w") as f:
+                json.dump(dict(fetch.meta, size=fetch.written), f)
+            with self._lock:
+                self._entries[fetch.name] = fetch.written
+                self._evict(0)
+            with fetch.condition:
+                fetch.condition.notify_all()
+            logger.info(f"Cached {fetch.name} ({fetch.written} bytes)")
+        except (OSError, requests.exceptions.RequestException) as e:
+            if fetch.status == 200:
+                logger.error(f"Failed to fetch {url}: {e}")
+            with fetch.condition:
+                fetch.failed = True
+                fetch.condition.notify_all()
+            if not fetch.done and os.path.exists(fetch.path):
+                os.remove(fetch.path)
+        finally:
+            with self._lock:
+                self._fetches.pop(fetch.name, None)
+
+
+class _Listing:
+    """The upstream listing, fetched at most once per LISTING_TTL per query."""
+
+    def __init__(self, upstream, session):
+        self.upstream = upstream
+        self.session = session
+        self._cached = {}
+        self._lock = threading.Lock()
+
+    def get(self, query, own_base_url):
+        with self._lock:
+            fetched, status, content_type, body = self._cached.get(
+                query, (0, None, "", b"")
+            )
+            if time.monotonic() - fetched > LISTING_TTL:
+                url = self.upstream + (f"?{query}" if query else "")
+                try:
+                    response = self.session.get(url, timeout=DOWNLOAD_TIMEOUT)
+                except requests.exceptions.RequestException:
+                    # A stale listing beats none while upstream is unreachable
+                    if status != 200:
+                        raise
+                    logger.warning(f"Upstream unreachable, serving stale {url}")
+                else:
+                    status = response.status_code
+                    content_type = response.headers.get("Content-Type", "text/html")
+                    body = response.content
+                    self._cached[query] = (time.monotonic(), status, content_type, body)
+        if status == 200 and "json" in content_type:
+            body = self._rewrite_urls(body, own_base_url)
+        return status, content_type, body
+
+    def _rewrite_urls(self, body, own_base_url):
+        # The JSON listing has absolute download URLs, which must point here
+        try:
+            entries = json.loads(body)
+        except ValueError:
+            return body
+        if not isinstance(entries, list):
+            return body
+        for entry in entries:
+            url = entry.get("url") if isinstance(entry, dict) else None
+            if isinstance(url, str) and url.startswith(self.upstream):
+                entry["url"] = own_base_url + url[len(self.upstream) :]
+        return json.dumps(entries).encode()
+
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    """Serves the listing and cached build files; anything else is a 404."""
+
+    protocol_version = "HTTP/1.1"
+    cache = None
+    listing = None
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def do_HEAD(self):
+        self._handle(head_only=True)
+
+    def do_GET(self):
+        self._handle(head_only=False)
+
+    def _handle(self, head_only):
+        parsed = urllib.parse.urlsplit(self.path)
+        name = urllib.parse.unquote(parsed.path.lstrip("/"))
+        try:
+            if not name:
+                self._send_listing(parsed.query, head_only)
+                return
+            archive = name.removesuffix(".sha256")
+            if (
+                os.path.basename(name) != name
+                or "\\" in name
+                or ".." in name
+                or not BUILD_FILENAME_REGEX.fullmatch(archive)
+            ):
+                self.send_error(404)
+                return
+            # HEAD only asks about a build, it does not start downloading it
+            entry = self.cache.lookup(name, start=not head_only)
+            if entry is None:
+                self._send_upstream_head(name)
+            elif entry == "cached":
+                self._send_cached(name, head_only)
+            else:
+                self._send_fetching(entry, head_only)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Upstream error for {self.path}: {e}")
+            self.send_error(502)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except OSError as e:
+            # Headers are out already, dropping the connection is all that's left
+            logger.error(f"Failed to serve {self.path}: {e}")
+            self.close_connection = True
+
+    def _send_listing(self, query, head_only):
+        host = self.headers.get("Host") or "{}:{}".format(*self.server.server_address)
+        status, content_type, body = self.listing.get(query, f"http://{host}/")
+        if status != 200:
+            self.send_error(status)
+            return
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(body)
+
+    def _send_validators(self, meta):
+        if meta.get("etag"):
+            self.send_header("ETag", meta["etag"])
+        if meta.get("last_modified"):
+            self.send_header("Last-Modified", meta["last_modified"])
+
+    def _send_upstream_head(self, name):
+        response = self.cache.session.head(
+            self.cache.upstream + name, allow_redirects=True, timeout=DOWNLOAD_TIMEOUT
+        )
+        if response.status_code != 200:
+            self.send_error(response.status_code)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        length = response.headers.get("Content-Length")
+        if length:
+            self.send_header("Content-Length", length)
+        self._send_validators(
+            {
+                "etag": response.headers.get("ETag", ""),
+                "last_modified": response.headers.get("Last-Modified", ""),
+            }
+        )
+        self.end_headers()
+
+    def _send_cached(self, name, head_only):
+        path = self.cache.path(name)
+        meta = self.cache.load_meta(name)
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            start, end = 0, size - 1
+            status = 200
+            match = RANGE_REGEX.fullmatch(self.headers.get("Range", ""))
+            if_range = self.headers.get("If-Range")
+            if match and (not if_range or if_range in meta.values()):
+                first, last = match.groups()
+                if first:
+                    start = int(first)
+                    end = min(int(last), size - 1) if last else size - 1
+                elif last:
+                    start = max(0, size - int(last))
+                if start > end:
+                    self.send_error(416)
+                    return
+                status = 206
+            self.send_response(status)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self._send_validators(meta)
+            self.end_headers()
+            if head_only:
+                return
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                block = f.read(min(SERVE_BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                self.wfile.write(block)
+                remaining -= len(block)
+
+    def _send_fetching(self, fetch, head_only):
+        # Ranges are not offered until the file is complete, so clients
+        # download it in one stream that follows the upstream fetch.
+        status = fetch.wait_for_headers()
+        if status != 200:
+            self.send_error(status or 502)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        if fetch.size is not None:
+            self.send_header("Content-Length", str(fetch.size))
+        else:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self._send_validators(fetch.meta)
+        self.end_headers()
+        if head_only:
+            return
+        position = 0
+        with fetch.open() as f:
+            while fetch.wait_for(position):
+                available = fetch.written - position
+                while available > 0:
+                    block = f.read(min(SERVE_BLOCK_SIZE, available))
+                    if not block:
+                        break
+                    self.wfile.write(block)
+                    position += len(block)
+                    available -= len(block)
+
+
+def serve(
+    cache_dir,
+    upstream=BLENDER_DOWNLOAD_URL,
+    max_size=DEFAULT_MAX_SIZE_GB * 1024**3,
+    host="0.0.0.0",
+    port=DEFAULT_PORT,
+):
+    """Starts the cache server in a background thread and returns it."""
+    session = make_session()
+    handler = type(
+        "ConfiguredCacheRequestHandler",
+        (CacheRequestHandler,),
+        {
+            "cache": ArchiveCache(cache_dir, max_size, upstream, session),
+            "listing": _Listing(upstream, session),
+        },
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve Blender builds to the local network from a shared cache"
+    )
+    parser.add_argument("--cache-dir", required=True)
+    parser.add_argument("--upstream", default=BLENDER_DOWNLOAD_URL)
+    parser.add_argument("--bind", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--max-size-gb",
+        type=float,
+        default=DEFAULT_MAX_SIZE_GB,
+        help="evict the least recently used builds beyond this size",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        format="%(levelname)s %(asctime)s - %(message)s",
+        level=logging.DEBUG if args.verbose else logging.INFO,
+    )
+
+    upstream = args.upstream if args.upstream.endswith("/") else args.upstream + "/"
+    server = serve(
+        args.cache_dir,
+        upstream=upstream,
+        max_size=int(args.max_size_gb * 1024**3),
+        host=args.bind,
+        port=args.port,
+    )
+    logger.info(f"Serving {upstream} from {args.cache_dir} on port {args.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,516 @@
+"""
+Copyright 2016-2019 Tobias Kummer/Overmind Studios.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# Headless command line for unattended updates, e.g. on render nodes:
+#
+#   python cli.py list --branch main --latest --json
+#   python cli.py install --install-path /opt/blender --branch main --json
+#
+# Only Qt-free modules are imported, so this runs without a display.
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import requests
+
+from buildindex import (
+    BLENDER_DOWNLOAD_URL,
+    BUILD_FILENAME_REGEX,
+    BUILD_INDEX_FILE_NAME,
+    BuildIndex,
+    BuildIndexCache,
+    host_platform,
+    latest_builds,
+)
+from diskplan import InsufficientSpace
+from downloader import (
+    DEFAULT_CONNECTIONS,
+    DownloadCancelled,
+    default_cache_dir,
+    make_session,
+)
+from extractor import TAR_SUFFIXES
+from installer import INSTALL_MODE_DELTA, INSTALL_MODE_MANAGED, INSTALL_MODE_SWAP
+from managed import ManagedInstalls, PrunePolicy
+from mirrors import MIRROR_RANKING_FILE_NAME, MirrorSet, fetch_mirrored_build_index
+from pipeline import (
+    InstallPipeline,
+    clean_up,
+    hbytes,
+    installed_build,
+    prepare_download_path,
+    roll_back,
+)
+
+# Exit codes, 2 is what argparse uses for invalid arguments
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+EXIT_NO_BUILD = 3
+EXIT_NETWORK = 4
+EXIT_DISK_SPACE = 5
+EXIT_CANCELLED = 130
+
+ANY = "all"
+INSTALLABLE_SUFFIXES = (".zip",) + TAR_SUFFIXES
+LOG_FORMAT = "%(levelname)s %(asctime)s - %(message)s"
+
+logger = logging.getLogger(__name__)
+
+
+class Reporter:
+    """Prints human-readable progress to stderr, or collects a JSON result."""
+
+    def __init__(self, as_json):
+        self.as_json = as_json
+        self.interactive = sys.stderr.isatty() and not as_json
+        self._progress_shown = False
+
+    def status(self, text):
+        if self.as_json:
+            return
+        if self._progress_shown:
+            sys.stderr.write("\n")
+            self._progress_shown = False
+        print(text, file=sys.stderr)
+
+    def progress(self, percent, rate, eta):
+        if not self.interactive:
+            return
+        line = f"\r{percent:3d}%  {hbytes(rate)}/s"
+        if eta is not None:
+            line += f"  {int(eta) // 60}:{int(eta) % 60:02d} left"
+        sys.stderr.write(line.ljust(40))
+        sys.stderr.flush()
+        self._progress_shown = True
+
+    def result(self, exit_code, data, text):
+        if self.as_json:
+            data = dict(data, exit_code=exit_code)
+            json.dump(data, sys.stdout, indent=2)
+            sys.stdout.write("\n")
+        elif text:
+            self.status(text)
+        return exit_code
+
+
+def _filter_value(value):
+    return None if value == ANY else value
+
+
+def _load_mirrors(args):
+    mirrors = MirrorSet(
+        [args.url] + args.mirror,
+        os.path.join(args.cache_dir, MIRROR_RANKING_FILE_NAME),
+    )
+    mirrors.load()
+    return mirrors
+
+
+def _find_builds(args, session, mirrors):
+    """Returns the builds matching the filters of `args`, newest first."""
+    cache = BuildIndexCache(os.path.join(args.cache_dir, BUILD_INDEX_FILE_NAME))
+    cache.load()
+    builds, _, _ = fetch_mirrored_build_index(
+        session, mirrors, BUILD_FILENAME_REGEX, cache=cache
+    )
+    arch = args.arch
+    if arch is None:
+        # Builds that do not name an arch count as this machine's, as in the GUI
+        host_arch = host_platform()[1]
+        arch = ANY
+    matching = BuildIndex(builds).filter(
+        os=_filter_value(args.os),
+        arch=_filter_value(arch),
+        branch=args.branch,
+        query=args.search,
+    )
+    if args.arch is None and host_arch:
+        matching = [build for build in matching if build.arch in (host_arch, None)]
+    if args.latest:
+        matching = latest_builds(matching)
+    return matching
+
+
+def command_list(args, reporter, session):
+    builds = _find_builds(args, session, _load_mirrors(args))
+    if not reporter.as_json:
+        for build in builds:
+            print(build.filename)
+    return reporter.result(
+        EXIT_OK if builds else EXIT_NO_BUILD,
+        {"builds": [build.to_dict() for build in builds]},
+        None if builds else "No matching builds",
+    )
+
+
+def command_install(args, reporter, session):
+    mirrors = _load_mirrors(args)
+    candidates = [
+        build
+        for build in _find_builds(args, session, mirrors)
+        if build.filename.lower().endswith(INSTALLABLE_SUFFIXES)
+    ]
+    if not candidates:
+        return reporter.result(
+            EXIT_NO_BUILD,
+            {"status": "no-build"},
+            "No matching build that can be installed here",
+        )
+    build = candidates[0]
+    result = {"build": build.to_dict(), "install_path": args.install_path}
+    installed = installed_build(args.install_path, args.mode)
+    if installed == build.filename and not args.force:
+        return reporter.result(
+            EXIT_OK,
+            dict(result, status="up-to-date"),
+            f"{build.filename} is already installed",
+        )
+    managed = args.mode == INSTALL_MODE_MANAGED
+    if managed and not args.force and not args.dry_run:
+        installs = ManagedInstalls(args.install_path)
+        if build.filename in installs:
+            installs.activate(build.filename)
+            return reporter.result(
+                EXIT_OK,
+                dict(result, status="activated"),
+                f"Switched to the installed {build.filename}",
+            )
+    if args.dry_run:
+        return reporter.result(
+            EXIT_OK, dict(result, status="dry-run"), f"Would install {build.filename}"
+        )
+
+    os.makedirs(args.install_path, exist_ok=True)
+    url = mirrors.urls_for(build.filename)[0]
+    download_path = prepare_download_path(url, args.cache_dir)
+    pipeline = InstallPipeline(
+        url,
+        download_path,
+        args.install_path,
+        session,
+        connections=args.connections,
+        pipelined=not args.no_pipeline,
+        extract_workers=args.jobs,
+        install_mode=args.mode,
+        store_path=args.store,
+        on_status=reporter.status,
+        on_progress=reporter.progress,
+        mirrors=mirrors,
+        prune_policy=_prune_policy(args) if managed else None,
+    )
+    reporter.status(f"Installing {build.filename} into {args.install_path}")
+    started = time.monotonic()
+    error = _run_pipeline(pipeline)
+    clean_up(download_path, args.install_path, error is None)
+    result["elapsed"] = round(time.monotonic() - started, 3)
+    if error is None:
+        if pipeline.result is not None:
+            result["downloaded_bytes"] = pipeline.result.size
+        return reporter.result(
+            EXIT_OK, dict(result, status="installed"), f"Installed {build.filename}"
+        )
+
+    if isinstance(error, (DownloadCancelled, KeyboardInterrupt)):
+        exit_code, message = EXIT_CANCELLED, "Cancelled"
+    elif isinstance(error, InsufficientSpace):
+        exit_code, message = EXIT_DISK_SPACE, str(error)
+    elif isinstance(error, requests.exceptions.RequestException):
+        exit_code, message = EXIT_NETWORK, f"Network error: {error}"
+    else:
+        exit_code, message = EXIT_ERROR, str(error)
+    return reporter.result(
+        exit_code, dict(result, status="error", error=message), f"Error: {message}"
+    )
+
+
+def _prune_policy(args):
+    return PrunePolicy(
+        keep=args.keep,
+        max_age_days=args.max_age_days,
+        max_size=int(args.max_size_gb * 1024**3),
+    )
+
+
+def _find_installed(installs, name):
+    """Returns the managed build `name` refers to, by filename or folder name."""
+    for filename, entry in installs.builds.items():
+        if name in (filename, entry["dir"]):
+            return filename
+    return None
+
+
+def command_installed(args, reporter, session):
+    installs = ManagedInstalls(args.install_path)
+    builds = [
+        dict(entry, filename=filename, current=filename == installs.current)
+        for filename, entry in sorted(
+            installs.builds.items(), key=lambda item: -item[1]["last_used"]
+        )
+    ]
+    if not reporter.as_json:
+        for build in builds:
+            marker = "*" if build["current"] else " "
+            print(f"{marker} {build['filename']}  {hbytes(build['size'])}")
+    return reporter.result(
+        EXIT_OK,
+        {"builds": builds, "total_size": installs.total_size},
+        f"{len(builds)} builds, {hbytes(installs.total_size)}",
+    )
+
+
+def command_use(args, reporter, session):
+    installs = ManagedInstalls(args.install_path)
+    filename = _find_installed(installs, args.build)
+    if filename is None or filename not in installs:
+        return reporter.result(
+            EXIT_NO_BUILD,
+            {"status": "no-build"},
+            f"{args.build} is not installed in {args.install_path}",
+        )
+    installs.activate(filename)
+    return reporter.result(
+        EXIT_OK, {"status": "activated", "build": filename}, f"Switched to {filename}"
+    )
+
+
+def command_prune(args, reporter, session):
+    installs = ManagedInstalls(args.install_path)
+    policy = _prune_policy(args)
+    if not policy:
+        return reporter.result(
+            EXIT_USAGE,
+            {"status": "error", "error": "No limit given"},
+            "Give at least one of --keep, --max-age-days and --max-size-gb",
+        )
+    removed = installs.prune(policy)
+    return reporter.result(
+        EXIT_OK,
+        {"removed": removed, "total_size": installs.total_size},
+        f"Removed {len(removed)} builds, {hbytes(installs.total_size)} left",
+    )
+
+
+def _run_pipeline(pipeline):
+    """Runs `pipeline` in a thread so Ctrl+C cancels it cleanly.
+
+    Returns None only if the pipeline finished, otherwise the error.
+    """
+    errors = []
+    finished = []
+
+    def target():
+        try:
+            pipeline.run()
+            finished.append(True)
+        except Exception as e:
+            # Whatever the archive or the extractor raises, e.g. a corrupt
+            # zip, must fail the install rather than end the thread silently
+            logger.error(f"Install failed: {e}", exc_info=True)
+            errors.append(e)
+
+    thread = threading.Thread(target=target, name="install")
+    thread.start()
+    try:
+        while thread.is_alive():
+            thread.join(0.2)
+    except KeyboardInterrupt:
+        pipeline.cancel()
+        thread.join()
+        return errors[0] if errors else DownloadCancelled()
+    if errors:
+        return errors[0]
+    return None if finished else RuntimeError("Install did not finish")
+
+
+def command_rollback(args, reporter, session):
+    try:
+        filename = roll_back(args.install_path, args.mode)
+    except FileNotFoundError:
+        return reporter.result(
+            EXIT_NO_BUILD,
+            {"status": "no-build"},
+            f"No previous build kept in {args.install_path}",
+        )
+    except OSError as e:
+        return reporter.result(EXIT_ERROR, {"status": "error", "error": str(e)}, str(e))
+    return reporter.result(
+        EXIT_OK,
+        {"status": "rolled-back", "build": filename},
+        f"Rolled back to {filename}",
+    )
+
+
+def build_parser():
+    host_os = host_platform()[0]
+    parser = argparse.ArgumentParser(
+        description="Download and install Blender builds without a GUI"
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="log progress details to stderr"
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="print a JSON result to stdout"
+    )
+    parser.add_argument("--url", default=BLENDER_DOWNLOAD_URL, help="build listing")
+    parser.add_argument(
+        "--mirror",
+        action="append",
+        default=[],
+        help="another server or file:// folder with the same builds, repeatable",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=default_cache_dir(),
+        help="keeps partial downloads and the build list between runs",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    filters = argparse.ArgumentParser(add_help=False)
+    filters.add_argument(
+        "--os",
+        default=host_os or ANY,
+        choices=("windows", "macos", "linux", ANY),
+        help="default: this machine's",
+    )
+    filters.add_argument(
+        "--arch",
+        help="x86_64, arm64, x86 or all, default: this machine's and unnamed",
+    )
+    filters.add_argument("--branch", help="e.g. main or v42")
+    filters.add_argument("--search", default="", help="words the build must contain")
+    filters.add_argument(
+        "--latest",
+        action="store_true",
+        help="only the newest build of each branch and platform",
+    )
+
+    # Limits on the builds kept by the managed install mode
+    limits = argparse.ArgumentParser(add_help=False)
+    limits.add_argument("--keep", type=int, default=0, help="number of builds")
+    limits.add_argument(
+        "--max-age-days", type=float, default=0, help="remove builds unused for longer"
+    )
+    limits.add_argument(
+        "--max-size-gb", type=float, default=0, help="total size of the builds"
+    )
+
+    subparsers.add_parser("list", parents=[filters], help="list matching builds")
+    install_parser = subparsers.add_parser(
+        "install",
+        parents=[filters, limits],
+        help="install the newest matching build",
+        epilog="--keep, --max-age-days and --max-size-gb apply to --mode managed",
+    )
+    install_parser.add_argument("--install-path", required=True)
+    install_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="extraction threads, default: one per CPU",
+    )
+    install_parser.add_argument(
+        "--connections",
+        type=int,
+        default=DEFAULT_CONNECTIONS,
+        help="parallel download connections",
+    )
+    install_parser.add_argument(
+        "--mode",
+        choices=(INSTALL_MODE_SWAP, INSTALL_MODE_DELTA, INSTALL_MODE_MANAGED),
+        default=INSTALL_MODE_SWAP,
+    )
+    install_parser.add_argument("--store", help="content store to hardlink files from")
+    install_parser.add_argument(
+        "--no-pipeline",
+        action="store_true",
+        help="extract after the download instead of while downloading",
+    )
+    install_parser.add_argument(
+        "--force", action="store_true", help="reinstall if already installed"
+    )
+    install_parser.add_argument(
+        "--dry-run", action="store_true", help="only report what would be installed"
+    )
+
+    installed_parser = subparsers.add_parser(
+        "installed", help="list the builds installed side by side"
+    )
+    installed_parser.add_argument("--install-path", required=True)
+    use_parser = subparsers.add_parser(
+        "use", help="make an installed build the current one"
+    )
+    use_parser.add_argument("--install-path", required=True)
+    use_parser.add_argument("build", help="filename or folder name of the build")
+    prune_parser = subparsers.add_parser(
+        "prune", parents=[limits], help="remove builds beyond the given limits"
+    )
+    prune_parser.add_argument("--install-path", required=True)
+    rollback_parser = subparsers.add_parser(
+        "rollback", help="go back to the build installed before the current one"
+    )
+    rollback_parser.add_argument("--install-path", required=True)
+    rollback_parser.add_argument(
+        "--mode",
+        choices=(INSTALL_MODE_SWAP, INSTALL_MODE_MANAGED),
+        default=INSTALL_MODE_SWAP,
+    )
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        format=LOG_FORMAT,
+        level=logging.INFO if args.verbose else logging.WARNING,
+        stream=sys.stderr,
+    )
+    reporter = Reporter(args.json)
+    session = make_session(getattr(args, "connections", DEFAULT_CONNECTIONS))
+    commands = {
+        "list": command_list,
+        "install": command_install,
+        "installed": command_installed,
+        "use": command_use,
+        "prune": command_prune,
+        "rollback": command_rollback,
+    }
+    try:
+        return commands[args.command](args, reporter, session)
+    except requests.exceptions.RequestException as e:
+        return reporter.result(
+            EXIT_NETWORK, {"status": "error", "error": str(e)}, f"Network error: {e}"
+        )
+    except KeyboardInterrupt:
+        return reporter.result(
+            EXIT_CANCELLED, {"status": "error", "error": "Cancelled"}, "Cancelled"
+        )
+    except (OSError, ValueError) as e:
+        # An unreadable build list, or a link that could not be switched
+        logger.debug("Command failed", exc_info=True)
+        return reporter.result(
+            EXIT_ERROR, {"status": "error", "error": str(e)}, f"Error: {e}"
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Copyright 2016-2019 Tobias Kummer/Overmind Studios.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import configparser
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigStore:
+    """One section of an ini file, kept in memory and written back in batches.
+
+    `set` only updates memory and marks the store dirty; `flush` writes the
+    file if anything changed. `on_change` is called after every change that
+    makes the store dirty, which the GUI uses to start a debounce timer.
+    Writes go to a temp file that is renamed over the config, so a crash
+    mid-write never leaves a truncated file behind.
+    """
+
+    def __init__(self, path, section, on_change=None):
+        self.path = path
+        self.section = section
+        self.on_change = on_change
+        # Values are stored verbatim, e.g. ETags may contain "%"
+        self.parser = configparser.ConfigParser(interpolation=None)
+        self.dirty = False
+
+    def load(self, defaults):
+        """Reads the file and fills in missing keys from `defaults`."""
+        if os.path.isfile(self.path):
+            logger.info("Reading existing configuration file")
+            try:
+                self.parser.read(self.path)
+            except configparser.Error as e:
+                logger.error(f"Ignoring unreadable configuration file: {e}")
+        else:
+            logger.debug("No previous config found, creating default.")
+        if not self.parser.has_section(self.section):
+            self.parser.add_section(self.section)
+            self.dirty = True
+        for key, value in defaults.items():
+            if not self.parser.has_option(self.section, key):
+                self.parser.set(self.section, key, value)
+                self.dirty = True
+
+    def get(self, key, default=""):
+        return self.parser.get(self.section, key, fallback=default)
+
+    def getint(self, key, default=0):
+        return self.parser.getint(self.section, key, fallback=default)
+
+    def getboolean(self, key, default=False):
+        return self.parser.getboolean(self.section, key, fallback=default)
+
+    def set(self, key, value):
+        value = str(value)
+        if self.parser.get(self.section, key, fallback=None) == value:
+            return
+        self.parser.set(self.section, key, value)
+        self.dirty = True
+        if self.on_change is not None:
+            self.on_change()
+
+    def flush(self):
+        """Writes the file if it changed since the last flush."""
+        if not self.dirty:
+            return
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w") as f:
+                self.parser.write(f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.error(f"Failed to write configuration file {self.path}: {e}")
+            return
+        self.dirty = False
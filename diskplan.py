@@ -0,0 +1,322 @@
+"""
+Copyright 2016-2019 Tobias Kummer/Overmind Studios.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import io
+import logging
+import os
+import shutil
+import zipfile
+
+import requests
+
+from downloader import DOWNLOAD_TIMEOUT
+from extractor import _strip_root
+from installer import INSTALL_MODE_DELTA
+
+# Files take up whole filesystem blocks, which matters for the tens of
+# thousands of small files in a build.
+BLOCK_SIZE = 4096
+# Kept free on every filesystem on top of the planned usage
+SPACE_MARGIN = 64 * 1024 * 1024
+XZ_FOOTER_SIZE = 12
+XZ_MAGIC_FOOTER = b"YZ"
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientSpace(OSError):
+    pass
+
+
+def _disk_size(size):
+    return -(-size // BLOCK_SIZE) * BLOCK_SIZE
+
+
+def _existing_parent(path):
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def allocated_size(path):
+    """Bytes already allocated to `path` on disk, 0 if it does not exist."""
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        return 0
+    blocks = getattr(stat_result, "st_blocks", None)
+    if blocks is None:
+        return stat_result.st_size
+    return blocks * 512
+
+
+class RangeFile(io.RawIOBase):
+    """Read-only, seekable view of a remote file that fetches only what is read.
+
+    Each read is one HTTP Range request, which is enough for zipfile to read
+    the central directory at the end of an archive without downloading it.
+    """
+
+    def __init__(self, session, url, size):
+        super().__init__()
+        self.session = session
+        self.url = url
+        self.size = size
+        self.position = 0
+        self.requests = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(0, offset)
+        return self.position
+
+    def readinto(self, buffer):
+        count = min(len(buffer), self.size - self.position)
+        if count <= 0:
+            return 0
+        data = self.read_range(self.position, count)
+        buffer[: len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def read_range(self, start, count):
+        headers = {"Range": f"bytes={start}-{start + count - 1}"}
+        response = self.session.get(self.url, headers=headers, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        self.requests += 1
+        if response.status_code != 206:
+            raise ValueError("Server ignored the Range request")
+        return response.content[:count]
+
+
+def _read_varint(data, position):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, position
+        shift += 7
+
+
+def xz_uncompressed_size(remote_file):
+    """Sums the uncompressed sizes in the indexes of an xz file.
+
+    Every xz stream ends with an index of its blocks and a footer giving the
+    index size, so the total is found by walking the streams back to front.
+    """
+    total = 0
+    end = remote_file.size
+    while end > 0:
+        footer = remote_file.read_range(end - XZ_FOOTER_SIZE, XZ_FOOTER_SIZE)
+        if footer[-4:] == b"\0\0\0\0":
+            # Stream padding between concatenated streams
+            end -= 4
+            continue
+        if footer[10:12] != XZ_MAGIC_FOOTER:
+            raise ValueError("Not an xz stream footer")
+        backward_size = (int.from_bytes(footer[4:8], "little") + 1) * 4
+        index_start = end - XZ_FOOTER_SIZE - backward_size
+        index = remote_file.read_range(index_start, backward_size)
+        if index[0] != 0:
+            raise ValueError("Not an xz index")
+        count, position = _read_varint(index, 1)
+        blocks_size = 0
+        for _ in range(count):
+            unpadded_size, position = _read_varint(index, position)
+            uncompressed_size, position = _read_varint(index, position)
+            blocks_size += (unpadded_size + 3) & ~3
+            total += uncompressed_size
+        # Stream header, blocks, index and footer
+        end = index_start - blocks_size - XZ_FOOTER_SIZE
+    return total
+
+
+class ArchiveIndex:
+    """Sizes of a remote archive's contents, read without downloading it.
+
+    `members` maps paths relative to the install folder to (size, crc32) and
+    is only known for zip archives, whose central directory lists them.
+    """
+
+    __slots__ = ("disk_size", "members", "uncompressed")
+
+    def __init__(self, uncompressed, disk_size, members=None):
+        self.uncompressed = uncompressed
+        self.disk_size = disk_size
+        self.members = members
+
+    @classmethod
+    def read(cls, session, remote):
+        """Reads the index of `remote`, returns None if it cannot be determined."""
+        if not remote.accept_ranges or remote.size <= 0:
+            return None
+        remote_file = RangeFile(session, remote.url, remote.size)
+        name = remote.url.lower()
+        try:
+            if name.endswith(".zip"):
+                index = cls._read_zip(remote_file)
+            elif name.endswith(".tar.xz"):
+                size = xz_uncompressed_size(remote_file)
+                index = cls(size, size)
+            elif name.endswith(".tar.gz"):
+                # The gzip trailer stores the size modulo 4 GiB, more than
+                # any build extracts to
+                trailer = remote_file.read_range(remote.size - 4, 4)
+                size = int.from_bytes(trailer, "little")
+                index = cls(size, size)
+            else:
+                return None
+        except (
+            requests.exceptions.RequestException,
+            zipfile.BadZipFile,
+            ValueError,
+            IndexError,
+        ) as e:
+            logger.warning(f"Could not read the archive index of {remote.url}: {e}")
+            return None
+        logger.info(
+            f"Archive expands to {index.uncompressed} bytes, read with "
+            f"{remote_file.requests} range requests"
+        )
+        return index
+
+    @classmethod
+    def _read_zip(cls, remote_file):
+        members = {}
+        with zipfile.ZipFile(remote_file) as archive:
+            for info in archive.infolist():
+                relative_path = _strip_root(info.filename)
+                if relative_path is not None and not info.is_dir():
+                    members[relative_path] = (info.file_size, info.CRC)
+        uncompressed = sum(size for size, _ in members.values())
+        disk_size = sum(_disk_size(size) for size, _ in members.values())
+        return cls(uncompressed, disk_size, members)
+
+    def delta_size(self, manifest):
+        """Bytes a delta install over `manifest` writes before old files are freed."""
+        if self.members is None:
+            # Tar members are only known once decompressed; count net growth
+            installed = sum(entry[0] for entry in manifest.old_files.values())
+            return max(0, self.disk_size - installed)
+        return sum(
+            _disk_size(size)
+            for relative_path, (size, crc) in self.members.items()
+            if not manifest.is_current(relative_path, size, crc)
+        )
+
+
+class DiskPlan:
+    """Space each phase of an install needs, summed per filesystem.
+
+    The archive, the extracted build and the content store may live on
+    different filesystems, so needs are grouped by device and each group is
+    compared against the free space of that filesystem.
+    """
+
+    def __init__(self):
+        self.needs = {}
+
+    def add(self, path, size, label):
+        if size <= 0:
+            return
+        existing = _existing_parent(path)
+        device = os.stat(existing).st_dev
+        need = self.needs.setdefault(device, [existing, 0, []])
+        need[1] += size
+        need[2].append(f"{label} {size / 1024 / 1024:.0f} MB")
+
+    def same_filesystem(self, first, second):
+        first_stat = os.stat(_existing_parent(first))
+        return first_stat.st_dev == os.stat(_existing_parent(second)).st_dev
+
+    def check(self, margin=SPACE_MARGIN):
+        """Raises InsufficientSpace naming every filesystem that is too full."""
+        problems = []
+        for path, needed, labels in self.needs.values():
+            free = shutil.disk_usage(path).free
+            logger.info(
+                f"Planned {needed} bytes on the filesystem of {path} "
+                f"({', '.join(labels)}), {free} bytes free"
+            )
+            if needed + margin > free:
+                problems.append(
+                    f"{path}: {needed / 1024 / 1024:.0f} MB needed "
+                    f"({', '.join(labels)}), {free / 1024 / 1024:.0f} MB available"
+                )
+        if problems:
+            raise InsufficientSpace("Insufficient disk space on " + "; ".join(problems))
+
+
+def plan_install(
+    session,
+    remote,
+    download_path,
+    install_path,
+    install_mode,
+    store_path=None,
+    manifest=None,
+):
+    """Estimates the peak disk usage of downloading and installing `remote`.
+
+    The downloaded archive is only removed once the build is in place, so
+    it counts alongside the extracted files. Swap installs extract the whole
+    build next to the previous one, which is then renamed away without using
+    more space; delta installs only write the files that changed.
+    """
+    plan = DiskPlan()
+    # A resumed download already has part of its space
+    plan.add(
+        os.path.dirname(download_path),
+        remote.size - allocated_size(download_path),
+        "download",
+    )
+    archive = ArchiveIndex.read(session, remote)
+    if archive is None:
+        logger.warning("Extracted size unknown, only checking space for the download")
+        return plan
+
+    if install_mode == INSTALL_MODE_DELTA and manifest is not None:
+        extracted = archive.delta_size(manifest)
+    else:
+        extracted = archive.disk_size
+    if store_path:
+        plan.add(store_path, extracted, "content store")
+        # Hardlinks into the store need no space, copies from another disk do
+        if not plan.same_filesystem(store_path, install_path):
+            plan.add(install_path, extracted, "copies from the content store")
+    else:
+        plan.add(install_path, extracted, "extracted build")
+    return plan
@@ -0,0 +1,891 @@
+"""
+Copyright 2016-2019 Tobias Kummer/Overmind Studios.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import email.utils
+import errno
+import hashlib
+import html
+import io
+import json
+import logging
+import math
+import os
+import re
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import deque
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+import requests
+import urllib3
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# Timeouts and sizes
+# Reads start small and grow toward MAX_CHUNK_SIZE while each read takes
+# less than CHUNK_TARGET_TIME, so a fast connection needs few iterations
+# and a slow one still gets regular progress and cancellation checks.
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+CHUNK_TARGET_TIME = 0.1
+DOWNLOAD_TIMEOUT = 10
+DEFAULT_CONNECTIONS = 4
+MAX_CONNECTIONS = 16
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+MAX_SEGMENT_RETRIES = 3
+HASH_READ_SIZE = 1024 * 1024
+JOURNAL_SUFFIX = ".journal.json"
+JOURNAL_SAVE_INTERVAL = 1.0
+CACHE_MAX_AGE_DAYS = 14
+# Progress is reported at most every PROGRESS_MIN_INTERVAL seconds, and only
+# then if the percentage moved; the rate is refreshed at least every
+# PROGRESS_MAX_INTERVAL seconds even when it did not.
+PROGRESS_MIN_INTERVAL = 0.1
+PROGRESS_MAX_INTERVAL = 1.0
+RATE_WINDOW = 5.0
+LOCAL_RANGE_REGEX = re.compile(r"bytes=(\d+)-(\d*)")
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadCancelled(Exception):
+    """Raised inside the download engine when the user cancels."""
+
+
+class RangeNotSupported(Exception):
+    """Raised when a server answers a Range request with the full body."""
+
+
+class DownloadStalled(OSError):
+    """Raised when a segment makes no progress after MAX_SEGMENT_RETRIES."""
+
+
+# Errors after which a download continues from another mirror
+FAILOVER_ERRORS = (requests.exceptions.RequestException, DownloadStalled)
+
+
+class RemoteFile:
+    """Metadata of a remote file as reported by a HEAD request."""
+
+    __slots__ = ("accept_ranges", "etag", "last_modified", "size", "url")
+
+    def __init__(self, url, size=0, accept_ranges=False, etag="", last_modified=""):
+        self.url = url
+        self.size = size
+        self.accept_ranges = accept_ranges
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+class DownloadResult:
+    """Summary of a finished download."""
+
+    __slots__ = (
+        "connections",
+        "elapsed",
+        "hash_time",
+        "resumed_from",
+        "sha256",
+        "size",
+    )
+
+    def __init__(
+        self, size, elapsed, connections, resumed_from=0, sha256=None, hash_time=0.0
+    ):
+        self.size = size
+        self.elapsed = elapsed
+        self.connections = connections
+        self.resumed_from = resumed_from
+        self.sha256 = sha256
+        self.hash_time = hash_time
+
+    @property
+    def throughput(self):
+        """Aggregate throughput in bytes per second."""
+        return self.size / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class Segment:
+    """Inclusive byte range of a remote file, with the next offset to fetch."""
+
+    __slots__ = ("end", "offset", "start")
+
+    def __init__(self, start, end, offset=None):
+        self.start = start
+        self.end = end
+        self.offset = start if offset is None else offset
+
+    @property
+    def remaining(self):
+        return self.end + 1 - self.offset
+
+
+class StreamingHasher:
+    """Computes the SHA-256 of a file while it is being downloaded.
+
+    Bytes written at the current hash position are hashed straight from the
+    network buffer. Segments that complete ahead of the position are hashed
+    from the file as soon as the position reaches them, while they are still
+    in the page cache, so no separate verification pass is needed. Every
+    hashed block is also passed to `sink`, giving it the file in order.
+    """
+
+    def __init__(self, path, segments=None, sink=None):
+        self.path = path
+        self.segments = segments or []
+        self.sink = sink
+        self.position = 0
+        self.hash_time = 0.0
+        self._hash = hashlib.sha256()
+        self._lock = threading.Lock()
+
+    def update(self, offset, data):
+        with self._lock:
+            if offset == self.position:
+                self._consume(data)
+            if self.segments:
+                self._catch_up()
+
+    def finish(self, size):
+        """Hashes whatever is still outstanding and returns the hex digest."""
+        with self._lock:
+            self._catch_up()
+        if self.position != size:
+            raise OSError(f"Hashed {self.position} of {size} bytes")
+        return self._hash.hexdigest()
+
+    def _consume(self, data):
+        started = time.perf_counter()
+        self._hash.update(data)
+        self.hash_time += time.perf_counter() - started
+        self.position += len(data)
+        if self.sink is not None:
+            self.sink(data)
+
+    def _catch_up(self):
+        while True:
+            segment = next(
+                (s for s in self.segments if s.start <= self.position < s.offset),
+                None,
+            )
+            if segment is None:
+                return
+            end = segment.offset
+            with open(self.path, "rb") as f:
+                f.seek(self.position)
+                while self.position < end:
+                    block = f.read(min(HASH_READ_SIZE, end - self.position))
+                    if not block:
+                        raise OSError(f"Unexpected end of file in {self.path}")
+                    self._consume(block)
+
+
+class ProgressReporter:
+    """Turns per-chunk progress callbacks into a few reports per second.
+
+    `update` may be called from several download threads for every chunk;
+    `on_report(percent, rate, eta)` is only called when the percentage moved
+    and PROGRESS_MIN_INTERVAL passed, every PROGRESS_MAX_INTERVAL otherwise,
+    and once more when the download completes. The rate in bytes per second
+    is averaged over the last RATE_WINDOW seconds, `eta` is in seconds and
+    None while the size or rate is unknown.
+    """
+
+    def __init__(
+        self,
+        on_report,
+        min_interval=PROGRESS_MIN_INTERVAL,
+        max_interval=PROGRESS_MAX_INTERVAL,
+        window=RATE_WINDOW,
+    ):
+        self.on_report = on_report
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.window = window
+        self._samples = deque()
+        self._last_report = None
+        self._last_percent = -1
+        self._lock = threading.Lock()
+
+    def update(self, downloaded, total):
+        now = time.monotonic()
+        with self._lock:
+            samples = self._samples
+            samples.append((now, downloaded))
+            # Keeps one sample older than the window as the rate's baseline
+            while len(samples) > 2 and now - samples[1][0] >= self.window:
+                samples.popleft()
+            percent = int(downloaded * 100 / total) if total > 0 else 0
+            if self._last_report is not None and downloaded != total:
+                since = now - self._last_report
+                if since < self.min_interval:
+                    return
+                if percent == self._last_percent and since < self.max_interval:
+                    return
+            self._last_report = now
+            self._last_percent = percent
+            rate = self._rate()
+            eta = None
+            if total > 0 and rate > 0:
+                eta = max(0, total - downloaded) / rate
+            # Reported under the lock so reports from different threads
+            # arrive in order
+            self.on_report(percent, rate, eta)
+
+    def _rate(self):
+        (first_time, first_bytes), (last_time, last_bytes) = (
+            self._samples[0],
+            self._samples[-1],
+        )
+        elapsed = last_time - first_time
+        return (last_bytes - first_bytes) / elapsed if elapsed > 0 else 0.0
+
+
+class ChunkSizer:
+    """Adapts the read size of a download to its measured throughput."""
+
+    def __init__(
+        self, minimum=MIN_CHUNK_SIZE, maximum=MAX_CHUNK_SIZE, target=CHUNK_TARGET_TIME
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target = target
+        self.size = minimum
+
+    def update(self, count, elapsed):
+        if count < self.size:
+            # A short read is the end of the body, not a measure of speed
+            return
+        if elapsed < self.target / 2:
+            self.size = min(self.size * 2, self.maximum)
+        elif elapsed > self.target * 2:
+            self.size = max(self.size // 2, self.minimum)
+
+
+def iter_body(response, limit=None, sizer=None):
+    """Yields the body of a streamed response in adaptively sized chunks.
+
+    Reads straight from urllib3 instead of `iter_content`, whose chunk size
+    is fixed per call, and raises the same requests exceptions it would.
+    At most `limit` bytes are read. Chunks are fresh bytes objects rather
+    than views of one reused buffer because the hasher's sink keeps them.
+    """
+    sizer = sizer or ChunkSizer()
+    raw = response.raw
+    while limit is None or limit > 0:
+        size = sizer.size if limit is None else min(sizer.size, limit)
+        started = time.perf_counter()
+        try:
+            chunk = raw.read(size, decode_content=True)
+        except urllib3.exceptions.ProtocolError as e:
+            raise requests.exceptions.ChunkedEncodingError(e) from e
+        except urllib3.exceptions.DecodeError as e:
+            raise requests.exceptions.ContentDecodingError(e) from e
+        except urllib3.exceptions.ReadTimeoutError as e:
+            raise requests.exceptions.ConnectionError(e) from e
+        if not chunk:
+            return
+        sizer.update(len(chunk), time.perf_counter() - started)
+        if limit is not None:
+            limit -= len(chunk)
+        yield chunk
+
+
+def write_all(f, data):
+    """Writes all of `data` to the unbuffered file `f`.
+
+    A raw file may write less than it was given, e.g. when interrupted by
+    a signal; the rest is written before the bytes count as done.
+    """
+    view = memoryview(data)
+    while view:
+        view = view[f.write(view) :]
+
+
+def preallocate(f, size):
+    """Reserves `size` bytes of disk for `f` so parallel segments do not fragment it.
+
+    Fails with ENOSPC right away instead of when a segment hits the end of
+    the disk. Where posix_fallocate is unavailable the file is only extended.
+    """
+    f.truncate(size)
+    if not hasattr(os, "posix_fallocate"):
+        return
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            raise
+        # Not supported by some filesystems, e.g. network shares
+        logger.debug(f"Could not preallocate {size} bytes: {e}")
+
+
+def fetch_sha256(session, url):
+    """Returns the checksum published in the `.sha256` file next to `url`, or None."""
+    try:
+        response = session.get(url + ".sha256", timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        return response.text.strip().split()[0].lower()
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"SHA256 file unavailable, skipping verification: {e}")
+    except IndexError:
+        logger.warning("SHA256 file had unexpected format, skipping verification")
+    return None
+
+
+class DownloadJournal:
+    """On-disk record of a partial download, used to resume it with Range requests.
+
+    The journal lives next to the partial file and stores the validators of
+    the remote file together with the progress of every segment.
+    """
+
+    def __init__(self, download_path):
+        self.path = download_path + JOURNAL_SUFFIX
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable download journal {self.path}: {e}")
+            return None
+
+    def save(self, remote, segments):
+        data = {
+            "url": remote.url,
+            "size": remote.size,
+            "etag": remote.etag,
+            "last_modified": remote.last_modified,
+            "segments": [[s.start, s.end, s.offset] for s in segments],
+        }
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.path)
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def resume_segments(self, remote, download_path):
+        """Returns the saved segments if the remote file is unchanged, else None."""
+        data = self.load()
+        if not data or data.get("url") != remote.url or data.get("size") != remote.size:
+            return None
+        if remote.etag and data.get("etag"):
+            unchanged = remote.etag == data["etag"]
+        elif remote.last_modified and data.get("last_modified"):
+            unchanged = remote.last_modified == data["last_modified"]
+        else:
+            unchanged = False
+        if not unchanged:
+            logger.info(f"Remote file changed since last attempt: {remote.url}")
+            return None
+        try:
+            if os.path.getsize(download_path) != remote.size:
+                return None
+            return [Segment(*values) for values in data["segments"]]
+        except (OSError, KeyError, TypeError) as e:
+            logger.warning(f"Cannot resume from journal {self.path}: {e}")
+            return None
+
+
+def default_cache_dir():
+    """Returns the per-user directory that keeps partial downloads between runs."""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+        return os.path.join(base, "BlenderUpdater", "cache")
+    if sys.platform == "darwin":
+        return os.path.expanduser("~/Library/Caches/BlenderUpdater")
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "blenderupdater")
+
+
+def prune_cache(cache_dir, max_age_days=CACHE_MAX_AGE_DAYS):
+    """Removes partial downloads that have not been touched for `max_age_days`."""
+    cutoff = time.time() - max_age_days * 86400
+    try:
+        entries = list(os.scandir(cache_dir))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                logger.info(f"Removed stale cache file {entry.path}")
+        except OSError as e:
+            logger.warning(f"Failed to remove stale cache file {entry.path}: {e}")
+
+
+class _FileSlice(io.RawIOBase):
+    """At most `length` bytes of an open file, from its current position."""
+
+    def __init__(self, f, length):
+        super().__init__()
+        self._f = f
+        self._remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = min(len(buffer), self._remaining)
+        if count <= 0:
+            return 0
+        count = self._f.readinto(memoryview(buffer)[:count])
+        self._remaining -= count
+        return count
+
+    def close(self):
+        self._f.close()
+        super().close()
+
+
+class LocalFileAdapter(BaseAdapter):
+    """Answers file:// URLs like a web server, so a shared folder can be a mirror.
+
+    Files support HEAD, Range and If-Range requests, with validators made
+    from their mtime, and folders are listed as an HTML page of links.
+    """
+
+    def send(self, request, stream=False, timeout=None, **kwargs):
+        parts = urllib.parse.urlsplit(request.url)
+        path = parts.path
+        if parts.netloc and parts.netloc != "localhost":
+            # file://server/share/... is a UNC path on Windows
+            path = "//" + parts.netloc + path
+        path = urllib.request.url2pathname(path)
+        headers = {}
+        status = 200
+        body = io.BytesIO()
+        try:
+            stat_result = os.stat(path)
+            if os.path.isdir(path):
+                names = sorted(os.listdir(path))
+                links = "".join(
+                    f'<a href="{urllib.parse.quote(name, safe="+")}">{html.escape(name)}</a>\n'
+                    for name in names
+                )
+                content = f"<html><body>\n{links}</body></html>\n".encode()
+                headers["Content-Type"] = "text/html; charset=utf-8"
+                headers["Content-Length"] = str(len(content))
+                body = io.BytesIO(content)
+            else:
+                status, headers, body = self._open_file(request, path, stat_result)
+        except FileNotFoundError:
+            status = 404
+        except PermissionError:
+            status = 403
+        except OSError as e:
+            raise requests.exceptions.ConnectionError(e, request=request) from e
+        if request.method == "HEAD":
+            body.close()
+            body = io.BytesIO()
+
+        response = requests.Response()
+        response.status_code = status
+        response.reason = {200: "OK", 206: "Partial Content"}.get(status, "Error")
+        response.headers = CaseInsensitiveDict(headers)
+        try:
+            # Without a Content-Length of its own urllib3 reads the body to its end
+            response.raw = urllib3.HTTPResponse(
+                body=body, status=status, preload_content=False, decode_content=False
+            )
+        except BaseException:
+            body.close()
+            raise
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def _open_file(self, request, path, stat_result):
+        size = stat_result.st_size
+        last_modified = email.utils.formatdate(stat_result.st_mtime, usegmt=True)
+        etag = f'"{stat_result.st_mtime_ns:x}-{size:x}"'
+        headers = {
+            "Content-Type": "application/octet-stream",
+            "Accept-Ranges": "bytes",
+            "ETag": etag,
+            "Last-Modified": last_modified,
+        }
+        start, end, status = 0, size - 1, 200
+        match = LOCAL_RANGE_REGEX.fullmatch(request.headers.get("Range", ""))
+        if_range = request.headers.get("If-Range")
+        if match and if_range in (None, etag, last_modified):
+            start = int(match.group(1))
+            if match.group(2):
+                end = min(int(match.group(2)), size - 1)
+            if start > end:
+                headers["Content-Range"] = f"bytes */{size}"
+                return 416, headers, io.BytesIO()
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        # Closed with the response body, or right here if that is never built
+        f = open(path, "rb")  # noqa: SIM115
+        try:
+            f.seek(start)
+            return status, headers, _FileSlice(f, end - start + 1)
+        except BaseException:
+            f.close()
+            raise
+
+    def close(self):
+        pass
+
+
+def make_session(connections=DEFAULT_CONNECTIONS):
+    """Returns a session whose connection pool fits `connections` parallel streams."""
+    session = requests.Session()
+    pool_size = max(10, connections)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.mount("file://", LocalFileAdapter())
+    return session
+
+
+def probe(session, url):
+    """Issues a HEAD request and returns the RemoteFile it describes."""
+    response = session.head(url, timeout=DOWNLOAD_TIMEOUT, allow_redirects=True)
+    response.raise_for_status()
+    headers = response.headers
+    return RemoteFile(
+        url,
+        size=int(headers.get("content-length", 0)),
+        accept_ranges=headers.get("accept-ranges", "").lower() == "bytes",
+        etag=headers.get("etag", ""),
+        last_modified=headers.get("last-modified", ""),
+    )
+
+
+def _validator(remote):
+    # Sent as If-Range so a server whose file was replaced since the HEAD
+    # request answers with the full body instead of a mismatching range.
+    if remote.etag and not remote.etag.startswith("W/"):
+        return remote.etag
+    return remote.last_modified
+
+
+def split_segments(size, connections):
+    """Splits `size` bytes into at most `connections` contiguous segments."""
+    count = max(1, min(connections, math.ceil(size / MIN_SEGMENT_SIZE)))
+    step = math.ceil(size / count)
+    return [
+        Segment(start, min(start + step, size) - 1) for start in range(0, size, step)
+    ]
+
+
+class SegmentedDownloader:
+    """Downloads a file over several HTTP Range connections into a preallocated file.
+
+    Falls back to a single stream when the server does not advertise
+    `Accept-Ranges: bytes` or the size of the file is unknown. With `resume`
+    set, progress is journaled next to the file so an interrupted download
+    continues where it stopped, provided the remote file is unchanged. The
+    SHA-256 of the file is computed on the fly and returned in the result;
+    `sink`, if given, receives the file's bytes in order as they are hashed.
+
+    `fallback_urls` are other mirrors of the same file. When the current one
+    fails, the download continues from the next mirror of the same size with
+    the bytes already written and hashed kept; `on_failover(url, error)` is
+    told which mirror failed.
+    """
+
+    def __init__(
+        self,
+        session,
+        url,
+        path,
+        connections=DEFAULT_CONNECTIONS,
+        is_cancelled=None,
+        on_progress=None,
+        resume=False,
+        sink=None,
+        fallback_urls=(),
+        on_failover=None,
+    ):
+        self.session = session
+        self.url = url
+        self.fallback_urls = list(fallback_urls)
+        self.on_failover = on_failover
+        self.path = path
+        self.connections = max(1, min(connections, MAX_CONNECTIONS))
+        self.is_cancelled = is_cancelled or (lambda: False)
+        self.on_progress = on_progress
+        self.journal = DownloadJournal(path) if resume else None
+        self.sink = sink
+        self._lock = threading.Lock()
+        self._abort = threading.Event()
+        self._downloaded = 0
+        self._total = 0
+        self._remote = None
+        self._segments = []
+        self._hasher = None
+        self._if_range = ""
+        self._last_journal_save = 0.0
+
+    def run(self, remote=None):
+        if remote is None:
+            remote = probe(self.session, self.url)
+        self._remote = remote
+        self._total = remote.size
+        start_time = time.monotonic()
+
+        segments = None
+        if self.journal is not None and remote.accept_ranges and remote.size > 0:
+            segments = self.journal.resume_segments(remote, self.path)
+        resumed_from = 0
+        if segments is not None:
+            resumed_from = sum(s.offset - s.start for s in segments)
+            self._downloaded = resumed_from
+            self._if_range = _validator(remote)
+            logger.info(f"Resuming download of {self.url} at {resumed_from} bytes")
+        elif self.journal is not None:
+            self.journal.discard()
+
+        connections = 1
+        use_ranges = remote.accept_ranges and remote.size > 0
+        if use_ranges and (self.connections > 1 or self.journal is not None):
+            fresh = segments is None
+            if fresh:
+                segments = split_segments(remote.size, self.connections)
+            connections = sum(1 for s in segments if s.remaining > 0) or 1
+            try:
+                self._download_segmented(segments, fresh)
+            except RangeNotSupported as e:
+                if self.sink is not None and self._hasher.position > 0:
+                    raise OSError("Server stopped honouring Range requests") from e
+                logger.warning("Server ignored Range request, using a single stream")
+                if self.journal is not None:
+                    self.journal.discard()
+                connections = 1
+                resumed_from = 0
+                self._downloaded = 0
+                self._abort.clear()
+                self._download_single()
+        else:
+            self._download_single()
+
+        if self.journal is not None:
+            self.journal.discard()
+        sha256 = self._hasher.finish(self._downloaded)
+        result = DownloadResult(
+            self._downloaded - resumed_from,
+            time.monotonic() - start_time,
+            connections,
+            resumed_from,
+            sha256,
+            self._hasher.hash_time,
+        )
+        logger.info(
+            f"Downloaded {result.size} bytes in {result.elapsed:.1f}s over "
+            f"{result.connections} connection(s) ({result.throughput:.0f} bytes/s)"
+        )
+        return result
+
+    def _fail_over(self, error, need_ranges):
+        """Switches to the next mirror serving a file of the same size.
+
+        Returns False if there is none left and `error` should be raised.
+        """
+        if self.is_cancelled() or not self.fallback_urls:
+            return False
+        failed_url = self.url
+        if self.on_failover is not None:
+            self.on_failover(failed_url, error)
+        while self.fallback_urls:
+            url = self.fallback_urls.pop(0)
+            try:
+                remote = probe(self.session, url)
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"Mirror {url} is unavailable: {e}")
+                if self.on_failover is not None:
+                    self.on_failover(url, e)
+                continue
+            if remote.size != self._remote.size or (
+                need_ranges and not remote.accept_ranges
+            ):
+                logger.warning(f"Mirror {url} does not serve the same file, skipping")
+                continue
+            logger.warning(
+                f"Download from {failed_url} failed ({error}), continuing from "
+                f"{url} with {self._downloaded} bytes kept"
+            )
+            self.url = url
+            self._remote = remote
+            self._if_range = _validator(remote)
+            self._abort.clear()
+            return True
+        return False
+
+    def _check_cancelled(self):
+        if self._abort.is_set() or self.is_cancelled():
+            raise DownloadCancelled()
+
+    def _advance(self, count):
+        with self._lock:
+            self._downloaded += count
+            downloaded = self._downloaded
+            if self._segments:
+                now = time.monotonic()
+                if now - self._last_journal_save >= JOURNAL_SAVE_INTERVAL:
+                    self._save_journal()
+                    self._last_journal_save = now
+        if self.on_progress is not None:
+            self.on_progress(downloaded, self._total)
+
+    def _download_single(self):
+        self._hasher = StreamingHasher(self.path, sink=self.sink)
+        while True:
+            try:
+                self._stream(self._downloaded)
+                return
+            except FAILOVER_ERRORS as e:
+                # Continuing past the first byte needs a Range request
+                if not self._fail_over(e, need_ranges=self._downloaded > 0):
+                    raise
+
+    def _stream(self, offset):
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        if offset and self._if_range:
+            headers["If-Range"] = self._if_range
+        response = self.session.get(
+            self.url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT
+        )
+        response.raise_for_status()
+        if offset and response.status_code != 206:
+            response.close()
+            raise RangeNotSupported()
+        if not offset:
+            self._total = int(response.headers.get("content-length", 0)) or self._total
+        with response, open(self.path, "r+b" if offset else "wb") as f:
+            if not offset and self._total:
+                preallocate(f, self._total)
+            f.seek(offset)
+            for chunk in iter_body(response):
+                self._check_cancelled()
+                f.write(chunk)
+                self._hasher.update(self._downloaded, chunk)
+                self._advance(len(chunk))
+
+    def _save_journal(self):
+        if self.journal is None:
+            return
+        try:
+            self.journal.save(self._remote, self._segments)
+        except OSError as e:
+            logger.warning(f"Failed to write download journal: {e}")
+
+    def _download_segmented(self, segments, fresh=True):
+        if fresh:
+            with open(self.path, "wb") as f:
+                preallocate(f, self._total)
+        self._segments = segments
+        self._hasher = StreamingHasher(self.path, segments, self.sink)
+
+        try:
+            while True:
+                try:
+                    self._run_segments([s for s in segments if s.remaining > 0])
+                    return
+                except FAILOVER_ERRORS as e:
+                    # Finished segments and partial progress carry over
+                    if not self._fail_over(e, need_ranges=True):
+                        raise
+        finally:
+            # Keep the journal on cancellation or errors so the next run resumes
+            with self._lock:
+                self._save_journal()
+                self._segments = []
+
+    def _run_segments(self, segments):
+        if not segments:
+            return
+        with ThreadPoolExecutor(
+            max_workers=len(segments), thread_name_prefix="segment"
+        ) as executor:
+            futures = [executor.submit(self._fetch_segment, s) for s in segments]
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            errors = [f.exception() for f in done if f.exception() is not None]
+            if errors:
+                # Stop the remaining segments, then report the root cause rather
+                # than the DownloadCancelled the other workers raise in response.
+                self._abort.set()
+                wait(futures)
+                root = next(
+                    (e for e in errors if not isinstance(e, DownloadCancelled)),
+                    errors[0],
+                )
+                raise root
+
+    def _fetch_segment(self, segment):
+        attempts = 0
+        while segment.remaining > 0:
+            self._check_cancelled()
+            if attempts > MAX_SEGMENT_RETRIES:
+                raise DownloadStalled(
+                    f"Segment {segment.start}-{segment.end} stalled at {segment.offset}"
+                )
+            offset_before = segment.offset
+            headers = {"Range": f"bytes={segment.offset}-{segment.end}"}
+            if self._if_range:
+                headers["If-Range"] = self._if_range
+            try:
+                response = self.session.get(
+                    self.url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT
+                )
+                response.raise_for_status()
+                if response.status_code != 206:
+                    response.close()
+                    raise RangeNotSupported()
+                # Unbuffered so the journal never records bytes still held in
+                # a Python-side buffer when the process dies.
+                with response, open(self.path, "r+b", buffering=0) as f:
+                    f.seek(segment.offset)
+                    for chunk in iter_body(response, segment.remaining):
+                        self._check_cancelled()
+                        write_all(f, chunk)
+                        offset = segment.offset
+                        segment.offset += len(chunk)
+                        self._hasher.update(offset, chunk)
+                        self._advance(len(chunk))
+                        if not segment.remaining:
+                            break
+                if segment.offset == offset_before:
+                    attempts += 1
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError,
+            ) as e:
+                attempts += 1
+                if attempts > MAX_SEGMENT_RETRIES:
+                    raise
+                logger.warning(
+                    f"Segment {segment.start}-{segment.end} interrupted at "
+                    f"{segment.offset}, retrying ({attempts}/{MAX_SEGMENT_RETRIES}): {e}"
+                )
@@ -0,0 +1,515 @@
+"""
+Copyright 2016-2019 Tobias Kummer/Overmind Studios.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import io
+import logging
+import os
+import shutil
+import stat
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+from downloader import DownloadCancelled
+from installer import make_writable
+
+COPY_BUFFER_SIZE = 1024 * 1024
+PIPE_BUFFER_SIZE = 32 * 1024 * 1024
+ZIP_BATCH_BYTES = 4 * 1024 * 1024
+ZIP_BATCH_FILES = 64
+DELTA_MEMORY_LIMIT = 64 * 1024 * 1024
+DELTA_TEMP_SUFFIX = ".blenderupdater-tmp"
+TAR_SUFFIXES = (".tar.xz", ".tar.gz", ".tar.bz2", ".tar")
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractStats:
+    """Number of files and bytes an extraction wrote to disk.
+
+    `archive_files` and `archive_bytes` are the regular files the archive
+    listed and their sizes, which the extracted build is verified against.
+    """
+
+    __slots__ = (
+        "archive_bytes",
+        "archive_files",
+        "bytes_written",
+        "elapsed",
+        "files",
+        "skipped",
+    )
+
+    def __init__(self):
+        self.files = 0
+        self.bytes_written = 0
+        self.skipped = 0
+        self.elapsed = 0.0
+        self.archive_files = 0
+        self.archive_bytes = 0
+
+
+class BytePipe(io.RawIOBase):
+    """Bounded in-memory pipe that lets a decompressor read a download as it arrives.
+
+    The producer blocks in `feed` while `capacity` bytes are buffered, so a
+    slow decompressor throttles the download instead of growing memory.
+    """
+
+    def __init__(self, capacity=PIPE_BUFFER_SIZE):
+        super().__init__()
+        self.capacity = capacity
+        self._chunks = deque()
+        self._buffered = 0
+        self._condition = threading.Condition()
+        self._eof = False
+        self._error = None
+        self._reader_closed = False
+
+    def readable(self):
+        return True
+
+    def feed(self, data):
+        with self._condition:
+            while self._buffered >= self.capacity and not self._reader_closed:
+                self._condition.wait()
+            if self._reader_closed:
+                raise BrokenPipeError("Extraction stopped reading the download")
+            self._chunks.append(memoryview(data))
+            self._buffered += len(data)
+            self._condition.notify_all()
+
+    def finish(self, error=None):
+        """Signals the end of the stream, or an error the reader should raise."""
+        with self._condition:
+            self._eof = True
+            self._error = error
+            self._condition.notify_all()
+
+    def close_reader(self):
+        """Called by the reader when it stops, so a blocked producer fails fast."""
+        with self._condition:
+            self._reader_closed = True
+            self._chunks.clear()
+            self._buffered = 0
+            self._condition.notify_all()
+
+    def readinto(self, buffer):
+        with self._condition:
+            while not self._chunks and not self._eof:
+                self._condition.wait()
+            if self._error is not None:
+                raise self._error
+            if not self._chunks:
+                return 0
+            chunk = self._chunks[0]
+            count = min(len(buffer), len(chunk))
+            buffer[:count] = chunk[:count]
+            if count == len(chunk):
+                self._chunks.popleft()
+            else:
+                self._chunks[0] = chunk[count:]
+            self._buffered -= count
+            self._condition.notify_all()
+            return count
+
+
+def _strip_root(name):
+    """Returns `name` relative to the archive's top-level folder, or None for the root.
+
+    Raises ValueError for names that would escape the destination.
+    """
+    name = name.replace("\\", "/")
+    parts = [p for p in name.split("/") if p not in ("", ".")]
+    if name.startswith("/") or ".." in parts:
+        raise ValueError(f"Unsafe path in archive: {name}")
+    if len(parts) < 2:
+        return None
+    return os.path.join(*parts[1:])
+
+
+def _check_link(link_name, relative_path):
+    """Raises ValueError unless the symlink at `relative_path` stays inside.
+
+    The target may only go up with leading ".." parts, and no further than
+    the link's own folder is deep. A ".." after a folder name is refused,
+    as that folder could itself be a link to somewhere else.
+    """
+    parts = [p for p in link_name.replace("\\", "/").split("/") if p not in ("", ".")]
+    climb = 0
+    while climb < len(parts) and parts[climb] == "..":
+        climb += 1
+    depth = len(relative_path.split(os.sep)) - 1
+    if (
+        os.path.isabs(link_name)
+        or link_name.startswith(("/", "\\"))
+        or ".." in parts[climb:]
+        or climb > depth
+    ):
+        raise ValueError(f"Unsafe symlink in archive: {relative_path} -> {link_name}")
+
+
+def _write_member(source, target, mode, mtime):
+    """Writes one archive member to `target` and returns the number of bytes."""
+    with open(target, "wb") as f:
+        shutil.copyfileobj(source, f, COPY_BUFFER_SIZE)
+        size = f.tell()
+    if mode:
+        os.chmod(target, mode)
+    os.utime(target, (mtime, mtime))
+    return size
+
+
+class _Crc32Reader:
+    """Wraps a file object and computes the CRC-32 of everything read from it."""
+
+    def __init__(self, source):
+        self.source = source
+        self.crc = 0
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        self.crc = zlib.crc32(data, self.crc)
+        return data
+
+
+def _zip_batches(members):
+    """Groups (info, relative path) pairs so small files are written in batches."""
+    batch = []
+    batch_bytes = 0
+    for info, relative_path in members:
+        batch.append((info, relative_path))
+        batch_bytes += info.file_size
+        if batch_bytes >= ZIP_BATCH_BYTES or len(batch) >= ZIP_BATCH_FILES:
+            yield batch
+            batch = []
+            batch_bytes = 0
+    if batch:
+        yield batch
+
+
+class ArchiveExtractor:
+    """Streams the members of a Blender archive directly into a directory.
+
+    Blender archives contain a single top-level folder; its contents are
+    written to `dest_dir` without an intermediate copy. Zip members are
+    written by `workers` threads, which hides the per-file latency of
+    archives with tens of thousands of small files.
+
+    With an InstallManifest of `dest_dir`, files whose size and CRC-32 match
+    the installed copy are skipped and everything else is replaced in place.
+    With a ContentStore, file data goes into the store and `dest_dir` gets
+    hardlinks to it, so content shared between builds is stored once.
+    """
+
+    def __init__(
+        self,
+        archive_path,
+        dest_dir,
+        is_cancelled=None,
+        workers=1,
+        manifest=None,
+        store=None,
+    ):
+        self.archive_path = archive_path
+        self.dest_dir = dest_dir
+        self.is_cancelled = is_cancelled or (lambda: False)
+        self.workers = max(1, workers)
+        self.manifest = manifest
+        self.store = store
+        self.stats = ExtractStats()
+        self.top_level = set()
+        self._created_dirs = set()
+        self._symlinks = set()
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._thread_archives = []
+
+    def run(self, fileobj=None):
+        """Extracts the archive, reading from `fileobj` instead of the file if given.
+
+        Only tar archives can be read from a stream; zip needs random access.
+        """
+        started = time.monotonic()
+        name = self.archive_path.lower()
+        if name.endswith(".zip") and fileobj is None:
+            self._extract_zip()
+        elif name.endswith(TAR_SUFFIXES):
+            with tarfile.open(self.archive_path, mode="r|*", fileobj=fileobj) as tar:
+                self.extract_tar_stream(tar)
+        else:
+            raise ValueError(f"Unsupported archive format: {self.archive_path}")
+        self.stats.elapsed = time.monotonic() - started
+        logger.info(
+            f"Extracted {self.stats.files} files ({self.stats.bytes_written} bytes) "
+            f"to {self.dest_dir} in {self.stats.elapsed:.1f}s, "
+            f"{self.stats.skipped} unchanged files skipped"
+        )
+        return self.stats
+
+    def _check_cancelled(self):
+        if self.is_cancelled():
+            raise DownloadCancelled()
+
+    def _makedirs(self, path):
+        if path not in self._created_dirs:
+            os.makedirs(path, exist_ok=True)
+            self._created_dirs.add(path)
+
+    def _target(self, relative_path):
+        target = os.path.join(self.dest_dir, relative_path)
+        self._makedirs(os.path.dirname(target))
+        return target
+
+    def _materialize(self, source, target, size, mode, mtime):
+        """Creates `target` with the member's data, returns the bytes written."""
+        if self.store is None:
+            return _write_member(source, target, mode, mtime)
+        # Linked files share the blob's mtime, so it is left alone
+        key, written = self.store.add(source, size, mode)
+        self.store.materialize(key, target)
+        return written
+
+    def _write_file(self, source, relative_path, size, mode, mtime):
+        target = self._target(relative_path)
+        self.stats.bytes_written += self._materialize(source, target, size, mode, mtime)
+        self.stats.files += 1
+
+    def _write_delta(self, relative_path, size, crc, opener, mode, mtime):
+        """Writes a member unless the installed copy is identical.
+
+        `crc` may be None when it is not known up front, in which case the
+        member is always written. `opener` returns the member's file object
+        and is only called if the member has to be written.
+        """
+        if crc is not None and self.manifest.is_current(relative_path, size, crc):
+            self.manifest.keep(relative_path)
+            with self._stats_lock:
+                self.stats.skipped += 1
+            return
+        target = self._target(relative_path)
+        # Replace rather than overwrite, so a failure never leaves half a file
+        temp_path = target + DELTA_TEMP_SUFFIX
+        with opener() as source:
+            reader = _Crc32Reader(source)
+            written = self._materialize(reader, temp_path, size, mode, mtime)
+        make_writable(target)
+        os.replace(temp_path, target)
+        self.manifest.record_file(relative_path, reader.crc)
+        with self._stats_lock:
+            self.stats.files += 1
+            self.stats.bytes_written += written
+
+    def _check_member(self, relative_path):
+        # Nothing is written through a link the archive created, which
+        # could point anywhere inside dest_dir, or replace the link itself
+        path = relative_path
+        while path and self._symlinks:
+            if path in self._symlinks:
+                raise ValueError(f"Archive member behind a symlink: {relative_path}")
+            path = os.path.dirname(path)
+
+    def _replace_symlink(self, link_name, relative_path):
+        _check_link(link_name, relative_path)
+        self._check_member(relative_path)
+        self._symlinks.add(relative_path)
+        if self.manifest is not None:
+            self.manifest.record_link(relative_path, link_name)
+            if self.manifest.is_current_link(relative_path, link_name):
+                return
+        target = self._target(relative_path)
+        if os.path.lexists(target):
+            make_writable(target)
+            os.remove(target)
+        os.symlink(link_name, target)
+
+    def run_pipe(self, pipe):
+        """Extracts a tar archive from a BytePipe, closing the pipe's read end after."""
+        try:
+            return self.run(fileobj=io.BufferedReader(pipe, COPY_BUFFER_SIZE))
+        finally:
+            pipe.close_reader()
+
+    def extract_tar_stream(self, tar):
+        """Extracts members from a tarfile opened in stream ("r|") mode."""
+        for member in tar:
+            self._check_cancelled()
+            relative_path = _strip_root(member.name)
+            if relative_path is None:
+                continue
+            self.top_level.add(relative_path.split(os.sep, 1)[0])
+            if not member.issym():
+                self._check_member(relative_path)
+            if member.isfile():
+                self.stats.archive_files += 1
+                self.stats.archive_bytes += member.size
+            if member.isdir():
+                self._makedirs(os.path.join(self.dest_dir, relative_path))
+            elif member.isfile() and self.manifest is not None:
+                self._write_tar_delta(tar, member, relative_path)
+            elif member.isfile():
+                source = tar.extractfile(member)
+                self._write_file(
+                    source,
+                    relative_path,
+                    member.size,
+                    member.mode & 0o777,
+                    member.mtime,
+                )
+            elif member.issym():
+                self._replace_symlink(member.linkname, relative_path)
+            elif member.islnk():
+                link_source = _strip_root(member.linkname)
+                if link_source is None:
+                    raise ValueError(f"Unsafe hardlink in archive: {member.name}")
+                self._check_member(link_source)
+                source_path = os.path.join(self.dest_dir, link_source)
+                target = self._target(relative_path)
+                if os.path.lexists(target):
+                    make_writable(target)
+                    os.remove(target)
+                try:
+                    os.link(source_path, target)
+                except OSError:
+                    shutil.copy2(source_path, target)
+                # Hardlink members carry no size of their own
+                self.stats.archive_files += 1
+                self.stats.archive_bytes += os.path.getsize(target)
+                if self.manifest is not None:
+                    crc = self.manifest.crc_of(link_source)
+                    self.manifest.record_file(relative_path, crc)
+                self.stats.files += 1
+            else:
+                logger.debug(f"Skipping special archive member {member.name}")
+
+    def _write_tar_delta(self, tar, member, relative_path):
+        # Tar headers carry no checksum, so small members are read into memory
+        # to compare them before deciding whether to write.
+        source = tar.extractfile(member)
+        crc = None
+        opener = lambda: source
+        if member.size <= DELTA_MEMORY_LIMIT:
+            data = source.read()
+            crc = zlib.crc32(data)
+            opener = lambda: io.BytesIO(data)
+        self._write_delta(
+            relative_path, member.size, crc, opener, member.mode & 0o777, member.mtime
+        )
+
+    def _extract_zip(self):
+        with zipfile.ZipFile(self.archive_path) as archive:
+            members = []
+            directories = set()
+            links = []
+            for info in archive.infolist():
+                relative_path = _strip_root(info.filename)
+                if relative_path is None:
+                    continue
+                self.top_level.add(relative_path.split(os.sep, 1)[0])
+                if info.is_dir():
+                    directories.add(relative_path)
+                    continue
+                directories.add(os.path.dirname(relative_path))
+                unix_mode = info.external_attr >> 16
+                if stat.S_ISLNK(unix_mode):
+                    link_name = archive.read(info).decode("utf-8")
+                    _check_link(link_name, relative_path)
+                    links.append((link_name, relative_path))
+                    continue
+                members.append((info, relative_path))
+                self.stats.archive_files += 1
+                self.stats.archive_bytes += info.file_size
+
+            # Zip members come in any order, so every path is checked against
+            # all of the archive's links before anything is written
+            self._symlinks.update(relative_path for _, relative_path in links)
+            for relative_path in directories:
+                self._check_member(relative_path)
+            for _, relative_path in members:
+                self._check_member(relative_path)
+            self._symlinks.clear()
+
+            # Creating all directories up front lets the writers skip the checks
+            for directory in sorted(directories):
+                self._makedirs(os.path.join(self.dest_dir, directory))
+            for link_name, relative_path in links:
+                self._replace_symlink(link_name, relative_path)
+
+            if self.workers == 1:
+                self._write_zip_batch(archive, members)
+            else:
+                self._write_zip_parallel(members)
+
+    def _write_zip_batch(self, archive, batch):
+        for info, relative_path in batch:
+            self._check_cancelled()
+            mtime = time.mktime(info.date_time + (0, 0, -1))
+            mode = (info.external_attr >> 16) & 0o777
+            if self.manifest is not None:
+                self._write_delta(
+                    relative_path,
+                    info.file_size,
+                    info.CRC,
+                    lambda info=info: archive.open(info),
+                    mode,
+                    mtime,
+                )
+                continue
+            target = os.path.join(self.dest_dir, relative_path)
+            with archive.open(info) as source:
+                size = self._materialize(source, target, info.file_size, mode, mtime)
+            with self._stats_lock:
+                self.stats.files += 1
+                self.stats.bytes_written += size
+
+    def _thread_archive(self):
+        # ZipFile serialises reads on a shared handle, so every writer thread
+        # opens its own to decompress in parallel.
+        archive = getattr(self._local, "archive", None)
+        if archive is None:
+            archive = zipfile.ZipFile(self.archive_path)
+            self._local.archive = archive
+            with self._stats_lock:
+                self._thread_archives.append(archive)
+        return archive
+
+    def _write_zip_batch_threaded(self, batch):
+        self._write_zip_batch(self._thread_archive(), batch)
+
+    def _write_zip_parallel(self, members):
+        self._thread_archives = []
+        try:
+            with ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="extract"
+            ) as executor:
+                futures = [
+                    executor.submit(self._write_zip_batch_threaded, batch)
+                    for batch in _zip_batches(members)
+                ]
+                done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+                errors = [f.exception() for f in done if f.exception() is not None]
+                if errors:
+                    for future in futures:
+                        future.cancel()
+                    raise errors[0]
+        finally:
+            for archive in self._thread_archives:
+                archive.close()
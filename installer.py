@@ -0,0 +1,362 @@
+"""
+Copyright 2016-2019 Tobias Kummer/Overmind Studios.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import json
+import logging
+import os
+import shutil
+import stat
+import threading
+import zlib
+
+INSTALL_MODE_SWAP = "swap"
+INSTALL_MODE_DELTA = "delta"
+# One folder per build next to each other, see managed.py
+INSTALL_MODE_MANAGED = "managed"
+
+STAGING_DIR_NAME = ".blenderupdater-staging"
+PREVIOUS_DIR_NAME = ".blenderupdater-previous"
+INSTALL_RECORD_NAME = ".blenderupdater-install.json"
+ROLLBACK_DIR_NAME = ".blenderupdater-rollback"
+RESERVED_NAMES = {
+    STAGING_DIR_NAME,
+    PREVIOUS_DIR_NAME,
+    ROLLBACK_DIR_NAME,
+    INSTALL_RECORD_NAME,
+}
+# Top-level entry every build has, one of them per platform
+BLENDER_EXECUTABLES = ("blender", "blender.exe", "Blender.app", "blender.app")
+CRC_READ_SIZE = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def make_writable(path):
+    """Clears the read-only flag Windows would refuse to delete or replace."""
+    if os.name == "nt" and os.path.isfile(path) and not os.path.islink(path):
+        os.chmod(path, stat.S_IMODE(os.lstat(path).st_mode) | stat.S_IWRITE)
+
+
+def remove_tree(path, ignore_errors=False):
+    """shutil.rmtree that also removes read-only files, e.g. content store links."""
+
+    def _retry_writable(function, failed_path, _):
+        make_writable(failed_path)
+        function(failed_path)
+
+    try:
+        shutil.rmtree(path, onerror=_retry_writable)
+    except OSError:
+        if not ignore_errors:
+            raise
+
+
+def create_staging_dir(install_path):
+    """Returns an empty staging directory inside `install_path`.
+
+    Staging on the same filesystem as the install lets the new build be
+    moved into place with renames instead of a second full copy.
+    """
+    staging_dir = os.path.join(install_path, STAGING_DIR_NAME)
+    if os.path.lexists(staging_dir):
+        remove_tree(staging_dir)
+    os.makedirs(staging_dir)
+    return staging_dir
+
+
+def load_install_record(install_path):
+    try:
+        with open(os.path.join(install_path, INSTALL_RECORD_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable install record in {install_path}: {e}")
+        return {}
+
+
+def save_install_record(install_path, record):
+    path = os.path.join(install_path, INSTALL_RECORD_NAME)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(record, f)
+    os.replace(temp_path, path)
+
+
+def _count_files(path):
+    """Number and total size of the regular files below `path`."""
+    files = 0
+    size = 0
+    pending = [path]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    files += 1
+                    size += entry.stat(follow_symlinks=False).st_size
+    return files, size
+
+
+def verify_staging(staging_dir, stats):
+    """Raises ValueError unless the staged build matches the archive it came from.
+
+    `stats` are the ExtractStats of the extraction, whose archive_files and
+    archive_bytes count the regular files the archive listed. A build that
+    lost files to a full disk or a failing writer is caught here, before it
+    replaces a working install.
+    """
+    names = os.listdir(staging_dir)
+    if not any(name in names for name in BLENDER_EXECUTABLES):
+        raise ValueError("Extracted build has no Blender executable")
+    files, size = _count_files(staging_dir)
+    if files != stats.archive_files or size != stats.archive_bytes:
+        raise ValueError(
+            f"Extracted build is incomplete: {files} files ({size} bytes) on disk, "
+            f"the archive lists {stats.archive_files} files "
+            f"({stats.archive_bytes} bytes)"
+        )
+    logger.info(f"Verified {files} extracted files ({size} bytes)")
+
+
+def _exchange(source_dir, install_path, aside_dir, new_entries, old_entries):
+    """Moves `old_entries` into `aside_dir` and `new_entries` from `source_dir`.
+
+    Every step is a rename; if one fails (e.g. a file locked by a running
+    Blender) the completed renames are undone and the error re-raised.
+    """
+    moved_out = []
+    moved_in = []
+    try:
+        for name in old_entries:
+            os.replace(os.path.join(install_path, name), os.path.join(aside_dir, name))
+            moved_out.append(name)
+        for name in new_entries:
+            os.replace(os.path.join(source_dir, name), os.path.join(install_path, name))
+            moved_in.append(name)
+    except OSError:
+        logger.error("Failed to move new build into place, restoring previous build")
+        for name in reversed(moved_in):
+            os.replace(os.path.join(install_path, name), os.path.join(source_dir, name))
+        for name in reversed(moved_out):
+            os.replace(os.path.join(aside_dir, name), os.path.join(install_path, name))
+        raise
+
+
+def _installed_entries(install_path, record, new_entries):
+    # Only entries of the recorded build and those about to be replaced are
+    # moved, so unrelated files in install_path are left alone
+    return sorted(
+        name
+        for name in set(record.get("entries", [])) | set(new_entries)
+        if name not in RESERVED_NAMES
+        and os.path.lexists(os.path.join(install_path, name))
+    )
+
+
+def swap_in(staging_dir, install_path):
+    """Moves the staged build into `install_path`, replacing the previous build.
+
+    The replaced build is kept in PREVIOUS_DIR_NAME together with its
+    install record, so `rollback` can restore it with renames. The build
+    kept from the install before is deleted first.
+    """
+    new_entries = sorted(os.listdir(staging_dir))
+    record = load_install_record(install_path)
+    old_entries = _installed_entries(install_path, record, new_entries)
+
+    previous_dir = os.path.join(install_path, PREVIOUS_DIR_NAME)
+    if os.path.lexists(previous_dir):
+        remove_tree(previous_dir)
+    os.makedirs(previous_dir)
+
+    _exchange(staging_dir, install_path, previous_dir, new_entries, old_entries)
+    if old_entries:
+        save_install_record(previous_dir, dict(record, entries=old_entries))
+    else:
+        os.rmdir(previous_dir)
+    save_install_record(install_path, {"entries": new_entries})
+    os.rmdir(staging_dir)
+    logger.info(f"Moved {len(new_entries)} entries into {install_path}")
+
+
+def previous_build(install_path):
+    """Returns the install record of the build `rollback` would restore, or None."""
+    previous_dir = os.path.join(install_path, PREVIOUS_DIR_NAME)
+    if not os.path.isdir(previous_dir):
+        return None
+    return load_install_record(previous_dir) or None
+
+
+def rollback(install_path):
+    """Swaps the previous build back into `install_path`, using renames only.
+
+    The build it replaces becomes the previous one, so a second rollback
+    undoes the first.
+    """
+    previous_dir = os.path.join(install_path, PREVIOUS_DIR_NAME)
+    previous_record = previous_build(install_path)
+    if previous_record is None:
+        raise FileNotFoundError(f"No previous build kept in {install_path}")
+    new_entries = sorted(
+        name for name in os.listdir(previous_dir) if name not in RESERVED_NAMES
+    )
+    record = load_install_record(install_path)
+    old_entries = _installed_entries(install_path, record, new_entries)
+
+    rollback_dir = os.path.join(install_path, ROLLBACK_DIR_NAME)
+    if os.path.lexists(rollback_dir):
+        remove_tree(rollback_dir)
+    os.makedirs(rollback_dir)
+
+    _exchange(previous_dir, install_path, rollback_dir, new_entries, old_entries)
+    save_install_record(rollback_dir, dict(record, entries=old_entries))
+    save_install_record(install_path, previous_record)
+    os.remove(os.path.join(previous_dir, INSTALL_RECORD_NAME))
+    os.rmdir(previous_dir)
+    os.replace(rollback_dir, previous_dir)
+    logger.info(f"Rolled back {install_path} to {previous_record.get('build')}")
+    return previous_record
+
+
+def file_crc32(path):
+    crc = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CRC_READ_SIZE), b""):
+            crc = zlib.crc32(block, crc)
+    return crc
+
+
+class InstallManifest:
+    """Per-file record of an install, used to rewrite only files that changed.
+
+    Maps each path relative to the install folder to [size, mtime_ns, crc32],
+    and each symlink to its target in `links`. The manifest is persisted in the install record, so checking whether a
+    file is current is a dictionary lookup plus a stat() instead of a rehash.
+    CRC-32 is used because zip archives store it for every member, letting
+    unchanged zip members be skipped without decompressing them.
+    """
+
+    def __init__(self, install_path):
+        self.install_path = install_path
+        self.record = load_install_record(install_path)
+        self.old_files = self.record.get("files")
+        self.old_links = self.record.get("links", {})
+        # Stale files are only removed if we wrote the manifest ourselves;
+        # a manifest scanned from disk may list files the user put there.
+        self.persisted = self.old_files is not None
+        if self.old_files is None:
+            self.old_files, self.old_links = self._scan()
+        self.files = {}
+        self.links = {}
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        logger.info(f"No install manifest found, scanning {self.install_path}")
+        files = {}
+        links = {}
+        for root, dirs, names in os.walk(self.install_path):
+            if root == self.install_path:
+                dirs[:] = [d for d in dirs if d not in RESERVED_NAMES]
+                names = [n for n in names if n not in RESERVED_NAMES]
+            # Links to folders are listed with the folders and not followed
+            for name in dirs + names:
+                path = os.path.join(root, name)
+                if os.path.islink(path):
+                    links[os.path.relpath(path, self.install_path)] = os.readlink(path)
+            for name in names:
+                path = os.path.join(root, name)
+                if os.path.islink(path):
+                    continue
+                stat_result = os.stat(path)
+                relative_path = os.path.relpath(path, self.install_path)
+                files[relative_path] = [
+                    stat_result.st_size,
+                    stat_result.st_mtime_ns,
+                    file_crc32(path),
+                ]
+        return files, links
+
+    def is_current(self, relative_path, size, crc):
+        """True if the installed file matches `size` and `crc` and is untouched."""
+        entry = self.old_files.get(relative_path)
+        if entry is None or entry[0] != size or entry[2] != crc:
+            return False
+        try:
+            stat_result = os.stat(os.path.join(self.install_path, relative_path))
+        except OSError:
+            return False
+        return stat_result.st_size == entry[0] and stat_result.st_mtime_ns == entry[1]
+
+    def keep(self, relative_path):
+        with self._lock:
+            self.files[relative_path] = self.old_files[relative_path]
+
+    def record_file(self, relative_path, crc):
+        stat_result = os.stat(os.path.join(self.install_path, relative_path))
+        with self._lock:
+            self.files[relative_path] = [
+                stat_result.st_size,
+                stat_result.st_mtime_ns,
+                crc,
+            ]
+
+    def is_current_link(self, relative_path, link_name):
+        """True if the installed symlink already points to `link_name`."""
+        if self.old_links.get(relative_path) != link_name:
+            return False
+        path = os.path.join(self.install_path, relative_path)
+        try:
+            return os.readlink(path) == link_name
+        except OSError:
+            return False
+
+    def record_link(self, relative_path, link_name):
+        with self._lock:
+            self.links[relative_path] = link_name
+
+    def crc_of(self, relative_path):
+        entry = self.files.get(relative_path)
+        return entry[2] if entry else None
+
+    def remove_stale(self):
+        """Deletes files and symlinks of the previous build the new one lacks."""
+        if not self.persisted:
+            return 0
+        removed = 0
+        old_paths = set(self.old_files) | set(self.old_links)
+        for relative_path in sorted(old_paths - set(self.files) - set(self.links)):
+            path = os.path.join(self.install_path, relative_path)
+            try:
+                make_writable(path)
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                continue
+            # Drop folders the removal left empty, up to the install folder
+            parent = os.path.dirname(path)
+            while parent != self.install_path and not os.listdir(parent):
+                os.rmdir(parent)
+                parent = os.path.dirname(parent)
+        return removed
+
+    def save(self, entries):
+        self.record["entries"] = sorted(entries)
+        self.record["files"] = self.files
+        self.record["links"] = self.links
+        save_install_record(self.install_path, self.record)
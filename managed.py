@@ -0,0 +1,260 @@
+"""
+Copyright 2016-2019 Tobias Kummer/Overmind Studios.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# Side-by-side installs, the layout of the "managed" install mode:
+#
+#   <install_path>/builds/<build>/   one folder per installed build
+#   <install_path>/current           link to the active build
+#   <install_path>/.blenderupdater-builds.json
+#
+# Switching builds replaces the link and nothing else, so going back to a
+# build that is still installed takes no download and no copying.
+
+import json
+import logging
+import os
+import time
+
+from installer import remove_tree
+
+BUILDS_DIR_NAME = "builds"
+CURRENT_LINK_NAME = "current"
+MANAGED_INDEX_NAME = ".blenderupdater-builds.json"
+ARCHIVE_SUFFIXES = (".tar.xz", ".tar.gz", ".tar.bz2", ".zip", ".dmg")
+
+logger = logging.getLogger(__name__)
+
+
+def build_dir_name(filename):
+    """Folder name of a build, its archive name without the extension."""
+    for suffix in ARCHIVE_SUFFIXES:
+        if filename.lower().endswith(suffix):
+            return filename[: -len(suffix)]
+    return filename
+
+
+def directory_size(path):
+    """Apparent size of the files below `path`, not following links."""
+    total = 0
+    pending = [path]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                else:
+                    total += entry.stat(follow_symlinks=False).st_size
+    return total
+
+
+def _make_link(target, link_path):
+    try:
+        os.symlink(target, link_path, target_is_directory=True)
+    except OSError:
+        if os.name != "nt":
+            raise
+        # Symlinks need developer mode on Windows, junctions do not
+        import _winapi
+
+        absolute_target = os.path.join(os.path.dirname(link_path), target)
+        _winapi.CreateJunction(os.path.abspath(absolute_target), link_path)
+
+
+def _remove_link(link_path):
+    # Directory symlinks and junctions are removed like folders on Windows
+    if os.name == "nt":
+        os.rmdir(link_path)
+    else:
+        os.unlink(link_path)
+
+
+def switch_link(link_path, target):
+    """Points `link_path` at `target` by replacing it in a single rename.
+
+    Windows cannot rename over a directory link, so there the old link is
+    removed first and the link is missing for the moment in between.
+    """
+    temp_path = link_path + ".new"
+    if os.path.lexists(temp_path):
+        _remove_link(temp_path)
+    _make_link(target, temp_path)
+    try:
+        os.replace(temp_path, link_path)
+    except OSError:
+        if os.name != "nt" or not os.path.lexists(link_path):
+            raise
+        _remove_link(link_path)
+        os.rename(temp_path, link_path)
+
+
+class PrunePolicy:
+    """Limits on the managed builds kept installed; 0 disables a limit."""
+
+    __slots__ = ("keep", "max_age_days", "max_size")
+
+    def __init__(self, keep=0, max_age_days=0, max_size=0):
+        self.keep = keep
+        self.max_age_days = max_age_days
+        self.max_size = max_size
+
+    def __bool__(self):
+        return bool(self.keep or self.max_age_days or self.max_size)
+
+
+class ManagedInstalls:
+    """Index of the builds installed side by side in `install_path`.
+
+    `builds` maps archive filenames to their folder, size in bytes and when
+    they were installed and last made current. The current build is never
+    pruned or removed.
+    """
+
+    def __init__(self, install_path):
+        self.install_path = install_path
+        self.index_path = os.path.join(install_path, MANAGED_INDEX_NAME)
+        self.builds = {}
+        self.current = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_path) as f:
+                data = json.load(f)
+            self.builds = data["builds"]
+            self.current = data.get("current")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable build index {self.index_path}: {e}")
+
+    def save(self):
+        data = {"current": self.current, "builds": self.builds}
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(temp_path, self.index_path)
+
+    @property
+    def link_path(self):
+        return os.path.join(self.install_path, CURRENT_LINK_NAME)
+
+    @property
+    def total_size(self):
+        return sum(entry["size"] for entry in self.builds.values())
+
+    @property
+    def previous(self):
+        """The build that was current before the current one, or None."""
+        others = [filename for filename in self.builds if filename != self.current]
+        if not others:
+            return None
+        return max(others, key=lambda filename: self.builds[filename]["last_used"])
+
+    def path_of(self, filename):
+        return os.path.join(
+            self.install_path, BUILDS_DIR_NAME, self.builds[filename]["dir"]
+        )
+
+    def __contains__(self, filename):
+        return filename in self.builds and os.path.isdir(self.path_of(filename))
+
+    def add(self, staging_dir, filename):
+        """Moves the extracted build in `staging_dir` into its own folder."""
+        builds_dir = os.path.join(self.install_path, BUILDS_DIR_NAME)
+        os.makedirs(builds_dir, exist_ok=True)
+        name = build_dir_name(filename)
+        target = os.path.join(builds_dir, name)
+        replaced = None
+        if os.path.lexists(target):
+            # A reinstall; the old copy may still be running, so it is only
+            # renamed out of the way before the new one takes its place
+            replaced = os.path.join(builds_dir, f".{name}.replaced-{int(time.time())}")
+            os.replace(target, replaced)
+        os.replace(staging_dir, target)
+        now = time.time()
+        self.builds[filename] = {
+            "dir": name,
+            "size": directory_size(target),
+            "installed": now,
+            "last_used": now,
+        }
+        self.save()
+        if replaced is not None:
+            remove_tree(replaced, ignore_errors=True)
+        logger.info(f"Installed {filename} into {target}")
+
+    def activate(self, filename):
+        """Makes `filename` the current build, a single link replacement."""
+        target = os.path.join(BUILDS_DIR_NAME, self.builds[filename]["dir"])
+        switch_link(self.link_path, target)
+        self.current = filename
+        self.builds[filename]["last_used"] = time.time()
+        self.save()
+        logger.info(f"{CURRENT_LINK_NAME} now points to {target}")
+
+    def remove(self, filename):
+        if filename == self.current:
+            raise ValueError(f"{filename} is the current build")
+        path = self.path_of(filename)
+        if os.path.lexists(path):
+            remove_tree(path)
+        del self.builds[filename]
+        self.save()
+        logger.info(f"Removed {filename}")
+
+    def prune(self, policy, now=None):
+        """Removes builds beyond the limits of `policy`, least recently used first.
+
+        Returns the filenames removed. A build that cannot be removed, e.g.
+        because it is running on Windows, is skipped and kept in the index.
+        """
+        now = time.time() if now is None else now
+        candidates = sorted(
+            (filename for filename in self.builds if filename != self.current),
+            key=lambda filename: self.builds[filename]["last_used"],
+        )
+        doomed = []
+        if policy.keep:
+            doomed += candidates[: max(0, len(self.builds) - policy.keep)]
+        if policy.max_age_days:
+            cutoff = now - policy.max_age_days * 86400
+            doomed += [
+                filename
+                for filename in candidates
+                if self.builds[filename]["last_used"] < cutoff
+            ]
+        if policy.max_size:
+            total = sum(
+                entry["size"]
+                for filename, entry in self.builds.items()
+                if filename not in doomed
+            )
+            for filename in candidates:
+                if total <= policy.max_size:
+                    break
+                if filename not in doomed:
+                    doomed.append(filename)
+                    total -= self.builds[filename]["size"]
+
+        removed = []
+        for filename in dict.fromkeys(doomed):
+            try:
+                self.remove(filename)
+                removed.append(filename)
+            except OSError as e:
+                logger.warning(f"Could not remove {filename}: {e}")
+        return removed
@@ -0,0 +1,253 @@
+"""
+Copyright 2016-2019 Tobias Kummer/Overmind Studios.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from buildindex import BUILD_INDEX_TIMEOUT, fetch_build_index
+from downloader import iter_body
+
+MIRROR_RANKING_FILE_NAME = "mirrors.json"
+# Measurements are reused for this long before the mirrors are probed again,
+# a mirror that failed is retried sooner
+MIRROR_RANKING_TTL = 6 * 3600
+MIRROR_FAILURE_TTL = 10 * 60
+MIRROR_PROBE_TIMEOUT = 5
+# At most this much of a mirror's listing is read to estimate its throughput
+PROBE_READ_SIZE = 512 * 1024
+# Mirrors are ranked by how long they would take to deliver a build this big
+RANKING_DOWNLOAD_SIZE = 300 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_mirror_url(url):
+    url = url.strip()
+    return url if url.endswith("/") else url + "/"
+
+
+def parse_mirrors(text):
+    """Splits a comma or whitespace separated list of mirror URLs."""
+    return [normalize_mirror_url(url) for url in re.split(r"[,\s]+", text) if url]
+
+
+class MirrorStats:
+    """Latest measurement of a mirror, in seconds and bytes per second."""
+
+    __slots__ = ("checked", "failed", "latency", "throughput")
+
+    def __init__(self, latency=None, throughput=None, failed=False, checked=0.0):
+        self.latency = latency
+        self.throughput = throughput
+        self.failed = failed
+        self.checked = checked
+
+    def expected_time(self):
+        """Seconds this mirror would take to deliver a typical build."""
+        if self.failed or self.latency is None:
+            return math.inf
+        if not self.throughput:
+            return self.latency
+        return self.latency + RANKING_DOWNLOAD_SIZE / self.throughput
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{slot: data[slot] for slot in cls.__slots__ if slot in data})
+
+
+def probe_mirror(session, url, timeout=MIRROR_PROBE_TIMEOUT):
+    """Measures the latency and throughput of a mirror by reading its listing."""
+    stats = MirrorStats(checked=time.time())
+    started = time.perf_counter()
+    try:
+        with session.get(url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            first_byte = time.perf_counter()
+            stats.latency = first_byte - started
+            received = sum(len(chunk) for chunk in iter_body(response, PROBE_READ_SIZE))
+            elapsed = time.perf_counter() - first_byte
+            if received and elapsed > 0:
+                stats.throughput = received / elapsed
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Mirror {url} is unavailable: {e}")
+        stats.failed = True
+    return stats
+
+
+class MirrorSet:
+    """Mirrors of the build server, ranked by their last measured speed.
+
+    Mirrors are probed in parallel and the measurements are saved to
+    `ranking_path`, so later runs start with the fastest mirror without
+    probing again until the measurements are MIRROR_RANKING_TTL old.
+    Mirrors that failed go last; mirrors never measured keep their
+    configured order between the two.
+    """
+
+    def __init__(self, urls, ranking_path=None):
+        self.urls = list(dict.fromkeys(normalize_mirror_url(url) for url in urls))
+        self.ranking_path = ranking_path
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        if not self.ranking_path:
+            return
+        try:
+            with open(self.ranking_path) as f:
+                data = json.load(f)
+            self.stats = {
+                url: MirrorStats.from_dict(entry)
+                for url, entry in data["mirrors"].items()
+                if url in self.urls
+            }
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(
+                f"Ignoring unreadable mirror ranking {self.ranking_path}: {e}"
+            )
+
+    def save(self):
+        # The ranking only saves probing, failing to write it is not an error
+        if not self.ranking_path:
+            return
+        with self._lock:
+            data = {
+                "mirrors": {url: stats.to_dict() for url, stats in self.stats.items()}
+            }
+        try:
+            os.makedirs(os.path.dirname(self.ranking_path), exist_ok=True)
+            temp_path = self.ranking_path + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.ranking_path)
+        except OSError as e:
+            logger.warning(f"Failed to write mirror ranking {self.ranking_path}: {e}")
+
+    def ranked(self):
+        """Returns the mirror URLs, fastest first."""
+        order = {url: position for position, url in enumerate(self.urls)}
+
+        def rank(url):
+            stats = self.stats.get(url)
+            if stats is None:
+                return (1, 0.0, order[url])
+            if stats.failed:
+                return (2, 0.0, order[url])
+            return (0, stats.expected_time(), order[url])
+
+        with self._lock:
+            return sorted(self.urls, key=rank)
+
+    def _is_stale(self, url, now, max_age):
+        stats = self.stats.get(url)
+        if stats is None:
+            return True
+        max_age = min(max_age, MIRROR_FAILURE_TTL) if stats.failed else max_age
+        return now - stats.checked > max_age
+
+    def probe(self, session, max_age=MIRROR_RANKING_TTL):
+        """Measures the mirrors whose measurement is older than `max_age`."""
+        now = time.time()
+        with self._lock:
+            stale = [url for url in self.urls if self._is_stale(url, now, max_age)]
+        # A single mirror is used either way
+        if len(self.urls) < 2 or not stale:
+            return self.ranked()
+        with ThreadPoolExecutor(
+            max_workers=len(stale), thread_name_prefix="mirror-probe"
+        ) as executor:
+            results = executor.map(lambda url: probe_mirror(session, url), stale)
+            measured = dict(zip(stale, results))
+        with self._lock:
+            self.stats.update(measured)
+        ranked = self.ranked()
+        logger.info(
+            "Mirror ranking: "
+            + ", ".join(
+                f"{url} ({self.stats[url].expected_time():.1f}s)" for url in ranked
+            )
+        )
+        self.save()
+        return ranked
+
+    def mirror_of(self, url):
+        """Returns the mirror `url` belongs to, or None."""
+        return next((mirror for mirror in self.urls if url.startswith(mirror)), None)
+
+    def mark_failed(self, url):
+        mirror = self.mirror_of(url)
+        if mirror is None:
+            return
+        with self._lock:
+            stats = self.stats.setdefault(mirror, MirrorStats())
+            stats.failed = True
+            stats.checked = time.time()
+        self.save()
+
+    def record_download(self, url, throughput):
+        """Ranks the mirror `url` came from by the throughput of a real download."""
+        mirror = self.mirror_of(url)
+        if mirror is None or throughput <= 0:
+            return
+        with self._lock:
+            stats = self.stats.setdefault(mirror, MirrorStats(latency=0.0))
+            # A mirror last seen failing has no latency, which would keep
+            # ranking it last although it just delivered a build
+            if stats.latency is None:
+                stats.latency = 0.0
+            stats.throughput = throughput
+            stats.failed = False
+            stats.checked = time.time()
+        self.save()
+
+    def urls_for(self, filename):
+        """Returns the URLs of `filename` on every mirror, fastest first."""
+        return [mirror + filename for mirror in self.ranked()]
+
+
+def fetch_mirrored_build_index(
+    session, mirrors, filename_regex, cache=None, timeout=BUILD_INDEX_TIMEOUT
+):
+    """Like fetch_build_index, from the fastest mirror that answers.
+
+    Returns (builds, not_modified, url) with the URL of that mirror.
+    """
+    error = None
+    for url in mirrors.probe(session):
+        try:
+            builds, not_modified = fetch_build_index(
+                session, url, filename_regex, cache=cache, timeout=timeout
+            )
+            return builds, not_modified, url
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"No build list from mirror {url}: {e}")
+            mirrors.mark_failed(url)
+            error = e
+    raise error
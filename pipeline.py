@@ -0,0 +1,436 @@
+"""
+Copyright 2016-2019 Tobias Kummer/Overmind Studios.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import logging
+import os
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+
+from diskplan import plan_install
+from downloader import (
+    DEFAULT_CONNECTIONS,
+    DownloadCancelled,
+    DownloadJournal,
+    ProgressReporter,
+    SegmentedDownloader,
+    fetch_sha256,
+    probe,
+    prune_cache,
+)
+from extractor import TAR_SUFFIXES, ArchiveExtractor, BytePipe
+from installer import (
+    INSTALL_MODE_DELTA,
+    INSTALL_MODE_MANAGED,
+    INSTALL_MODE_SWAP,
+    STAGING_DIR_NAME,
+    InstallManifest,
+    create_staging_dir,
+    load_install_record,
+    previous_build,
+    remove_tree,
+    rollback,
+    save_install_record,
+    swap_in,
+    verify_staging,
+)
+from managed import ManagedInstalls
+from store import ContentStore
+
+# Phases reported through `on_phase`, in the order they start
+PHASE_VERIFY = "verify"
+PHASE_EXTRACT = "extract"
+PHASE_INSTALL = "install"
+PHASE_CLEANUP = "cleanup"
+
+logger = logging.getLogger(__name__)
+
+
+def hbytes(num: float) -> str:
+    if not isinstance(num, (int, float)):
+        return "0 bytes"
+    for unit in [" bytes", " KB", " MB", " GB"]:
+        if num < 1024.0:
+            return f"{num:3.1f}{unit}"
+        num /= 1024.0
+    return f"{num:3.1f} TB"
+
+
+def installed_build(install_path, install_mode=INSTALL_MODE_SWAP):
+    """Returns the filename of the build installed in `install_path`, or None.
+
+    For managed installs this is the current one of the builds installed.
+    """
+    if install_mode == INSTALL_MODE_MANAGED:
+        return ManagedInstalls(install_path).current
+    return load_install_record(install_path).get("build")
+
+
+def rollback_target(install_path, install_mode=INSTALL_MODE_SWAP):
+    """Returns the filename of the build roll_back would restore, or None."""
+    if install_mode == INSTALL_MODE_MANAGED:
+        installs = ManagedInstalls(install_path)
+        previous = installs.previous
+        return previous if previous in installs else None
+    record = previous_build(install_path)
+    return record.get("build", "") if record is not None else None
+
+
+def roll_back(install_path, install_mode=INSTALL_MODE_SWAP):
+    """Restores the build installed before the current one and returns its name.
+
+    Only renames are involved: swap installs exchange the install with the
+    build kept from the last install, managed installs point `current` back
+    at the build used before.
+    """
+    if install_mode == INSTALL_MODE_MANAGED:
+        installs = ManagedInstalls(install_path)
+        previous = installs.previous
+        if previous is None or previous not in installs:
+            raise FileNotFoundError(f"No previous build in {install_path}")
+        installs.activate(previous)
+        return previous
+    return rollback(install_path).get("build", "")
+
+
+def prepare_download_path(url, cache_dir):
+    """Returns where `url` is downloaded to, pruning stale cache entries first.
+
+    Partial downloads are kept in the cache directory so a cancelled or
+    interrupted download can be resumed on the next attempt.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    prune_cache(cache_dir)
+    filename = os.path.basename(urllib.parse.urlparse(url).path)
+    return os.path.join(cache_dir, filename)
+
+
+def clean_up(download_path, install_path, success):
+    """Removes the archive after a successful install and any staging leftovers."""
+    if success and download_path and os.path.exists(download_path):
+        try:
+            os.remove(download_path)
+        except OSError as e:
+            logger.error(f"Failed to remove downloaded archive {download_path}: {e}")
+    staging_dir = os.path.join(install_path, STAGING_DIR_NAME)
+    if os.path.exists(staging_dir):
+        try:
+            remove_tree(staging_dir)
+            logger.info(f"Successfully cleaned up staging directory: {staging_dir}")
+        except OSError as e:
+            logger.error(
+                f"Failed to clean up staging directory {staging_dir}: {e}",
+                exc_info=True,
+            )
+
+
+class InstallPipeline:
+    """Downloads, verifies, extracts and installs one build, without any UI.
+
+    The GUI's DownloadWorker and the command line drive the same pipeline
+    and only differ in how they present the callbacks: `on_status(text)`,
+    `on_phase(phase)` with one of the PHASE_* names, and
+    `on_progress(percent, rate, eta)` a few times per second while
+    downloading. `run` raises DownloadCancelled after `cancel`, and
+    otherwise the error that stopped it.
+
+    Managed installs keep the new build next to the others, make it the
+    current one and then remove builds beyond `prune_policy`, if given.
+
+    With a MirrorSet in `mirrors`, the build is downloaded from the first
+    mirror that has it and the others take over if that one fails. Failures
+    and the achieved throughput update the mirror ranking.
+    """
+
+    def __init__(
+        self,
+        url,
+        download_path,
+        install_path,
+        session,
+        connections=DEFAULT_CONNECTIONS,
+        pipelined=True,
+        extract_workers=1,
+        install_mode=INSTALL_MODE_SWAP,
+        store_path=None,
+        on_status=None,
+        on_phase=None,
+        on_progress=None,
+        mirrors=None,
+        prune_policy=None,
+    ):
+        self.url = url
+        self.download_path = download_path
+        self.install_path = install_path
+        self.session = session
+        self.connections = connections
+        self.pipelined = pipelined
+        self.extract_workers = extract_workers
+        self.install_mode = install_mode
+        self.store_path = store_path
+        self.on_status = on_status or (lambda text: None)
+        self.on_phase = on_phase or (lambda phase: None)
+        self.on_progress = on_progress or (lambda percent, rate, eta: None)
+        self.mirrors = mirrors
+        self.prune_policy = prune_policy
+        self.result = None
+        self._cancelled = False
+        self._stop_extraction = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        # The checksum is fetched alongside the download so verification can
+        # complete as soon as the last byte has been hashed. The second thread
+        # runs the decompressor when extraction is pipelined with the download.
+        self._executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="download-helper"
+        )
+        self._extract_future = None
+        try:
+            self._run()
+        finally:
+            # The staging folder is removed once we report back, so make sure
+            # the decompressor is no longer writing to it.
+            future = self._extract_future
+            if future is not None and not future.done():
+                self._stop_extraction = True
+                wait([future])
+            self._executor.shutdown(wait=False)
+
+    def _extraction_cancelled(self):
+        return self._cancelled or self._stop_extraction
+
+    def _open_store(self):
+        # Builds extracted through the store hardlink files they share with
+        # other installed builds instead of writing another copy.
+        if not self.store_path:
+            return None
+        return ContentStore(self.store_path)
+
+    @property
+    def build_name(self):
+        return os.path.basename(urllib.parse.urlparse(self.url).path)
+
+    def _mirror_failed(self, url, error):
+        if self.mirrors is not None:
+            self.mirrors.mark_failed(url)
+
+    def _probe(self, urls):
+        """Returns the RemoteFile of the first of `urls` that answers, or None."""
+        for url in urls:
+            try:
+                return probe(self.session, url)
+            except requests.exceptions.RequestException as e:
+                if len(urls) > 1:
+                    logger.warning(f"Mirror {url} is unavailable: {e}")
+                self._mirror_failed(url, e)
+        return None
+
+    def _fetch_sha256(self, urls):
+        for url in urls:
+            expected_hash = fetch_sha256(self.session, url)
+            if expected_hash is not None:
+                return expected_hash
+        return None
+
+    def _install_delta(self, result, manifest):
+        """Updates install_path in place, writing only files that changed."""
+        self.on_phase(PHASE_EXTRACT)
+        # Not cancellable: stopping halfway would leave a mix of two builds
+        extractor = ArchiveExtractor(
+            self.download_path,
+            self.install_path,
+            workers=self.extract_workers,
+            manifest=manifest,
+            store=self._open_store(),
+        )
+        self.on_phase(PHASE_INSTALL)
+        self.on_status("Updating changed files...")
+        stats = extractor.run()
+        removed = manifest.remove_stale()
+        manifest.record["build"] = self.build_name
+        manifest.save(extractor.top_level)
+        logger.info(
+            f"Delta install wrote {stats.files} files, skipped {stats.skipped} "
+            f"unchanged files and removed {removed} stale files"
+        )
+        logger.info(
+            f"Bytes written per phase: download {result.size}, extraction 0, "
+            f"install {stats.bytes_written} (changed files only)"
+        )
+
+    def _install_managed(self, staging_dir):
+        """Moves the build into its own folder and makes it the current one."""
+        installs = ManagedInstalls(self.install_path)
+        installs.add(staging_dir, self.build_name)
+        installs.activate(self.build_name)
+        if self.prune_policy:
+            removed = installs.prune(self.prune_policy)
+            if removed:
+                self.on_status(f"Removed {len(removed)} old builds")
+
+    def _run(self):
+        urls = [self.url]
+        if self.mirrors is not None:
+            urls += [
+                url for url in self.mirrors.urls_for(self.build_name) if url != self.url
+            ]
+        expected_hash_future = self._executor.submit(self._fetch_sha256, urls)
+
+        remote = self._probe(urls)
+        # The mirror that answered first serves the download
+        url = remote.url if remote is not None else self.url
+
+        # Delta installs write into install_path directly, so they cannot
+        # start before the download has been verified.
+        delta = self.install_mode == INSTALL_MODE_DELTA
+        manifest = None
+        if delta:
+            self.on_status("Comparing with installed files...")
+            manifest = InstallManifest(self.install_path)
+
+        # Fail before downloading anything if a filesystem would fill up
+        # during the download, extraction or install
+        if remote is not None and remote.size > 0:
+            self.on_status("Checking disk space...")
+            plan_install(
+                self.session,
+                remote,
+                self.download_path,
+                self.install_path,
+                self.install_mode,
+                store_path=self.store_path,
+                manifest=manifest,
+            ).check()
+
+        pipe = None
+        if not delta:
+            staging_dir = create_staging_dir(self.install_path)
+            extractor = ArchiveExtractor(
+                self.download_path,
+                staging_dir,
+                is_cancelled=self._extraction_cancelled,
+                workers=self.extract_workers,
+                store=self._open_store(),
+            )
+            # Tar archives can be decompressed while they download, so
+            # network and CPU work overlap. Nothing reaches install_path
+            # before the checksum has been verified below.
+            tar_archive = self.download_path.lower().endswith(TAR_SUFFIXES)
+            if self.pipelined and tar_archive:
+                pipe = BytePipe()
+                self._extract_future = self._executor.submit(extractor.run_pipe, pipe)
+
+        size = hbytes(remote.size if remote else 0)
+        if pipe is not None:
+            self.on_status(f"Downloading and extracting {size}")
+        else:
+            self.on_status(f"Downloading {size}")
+
+        # Download
+        downloader = SegmentedDownloader(
+            self.session,
+            url,
+            self.download_path,
+            connections=self.connections,
+            is_cancelled=lambda: self._cancelled,
+            on_progress=ProgressReporter(self.on_progress).update,
+            resume=True,
+            sink=pipe.feed if pipe is not None else None,
+            fallback_urls=[fallback for fallback in urls if fallback != url],
+            on_failover=self._mirror_failed,
+        )
+        try:
+            result = downloader.run(remote)
+        except Exception as e:
+            if pipe is not None:
+                pipe.finish(error=DownloadCancelled())
+                extraction_error = self._extract_future.exception()
+                # A broken pipe in the download means extraction failed first
+                if isinstance(e, BrokenPipeError) and extraction_error:
+                    raise extraction_error from e
+            raise
+        if pipe is not None:
+            pipe.finish()
+        self.result = result
+        if self.mirrors is not None:
+            self.mirrors.record_download(downloader.url, result.throughput)
+        if result.resumed_from:
+            logger.info(f"Resumed download, {hbytes(result.resumed_from)} reused")
+        self.on_status(
+            f"Downloaded {hbytes(result.size)} at {hbytes(result.throughput)}/s"
+        )
+
+        # SHA256 verification, the archive was hashed while downloading
+        self.on_phase(PHASE_VERIFY)
+        self.on_status("Verifying download integrity...")
+        expected_hash = expected_hash_future.result()
+        if expected_hash is not None:
+            actual_hash = result.sha256
+            if actual_hash != expected_hash:
+                # A corrupt archive must not be resumed from next time
+                os.remove(self.download_path)
+                DownloadJournal(self.download_path).discard()
+                raise ValueError(
+                    f"SHA256 mismatch: expected {expected_hash}, got {actual_hash}"
+                )
+            logger.info(
+                f"SHA256 verification passed, hashing took {result.hash_time:.1f}s "
+                "during the download instead of a separate pass"
+            )
+            self.on_status(
+                f"Download verified, {result.hash_time:.1f}s of hashing "
+                "overlapped with the download"
+            )
+
+        if delta:
+            self._install_delta(result, manifest)
+            self.on_phase(PHASE_CLEANUP)
+            return
+
+        # Extraction, straight into a staging folder inside install_path
+        self.on_phase(PHASE_EXTRACT)
+        if self._extract_future is not None:
+            self.on_status("Finishing extraction...")
+            stats = self._extract_future.result()
+        else:
+            self.on_status("Extracting to staging folder...")
+            stats = extractor.run()
+        # The installed build is only replaced by a complete one
+        self.on_status("Checking extracted files...")
+        verify_staging(staging_dir, stats)
+
+        # Moving into place, renames only; swap installs keep the replaced
+        # build for rollback
+        self.on_phase(PHASE_INSTALL)
+        if self.install_mode == INSTALL_MODE_MANAGED:
+            self._install_managed(staging_dir)
+        else:
+            swap_in(staging_dir, self.install_path)
+            record = load_install_record(self.install_path)
+            record["build"] = self.build_name
+            save_install_record(self.install_path, record)
+        logger.info(
+            f"Bytes written per phase: download {result.size}, "
+            f"extraction {stats.bytes_written}, install 0 (renamed into place)"
+        )
+
+        # Cleanup is left to the caller, see clean_up()
+        self.on_phase(PHASE_CLEANUP)
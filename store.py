@@ -0,0 +1,199 @@
+"""
+Copyright 2016-2019 Tobias Kummer/Overmind Studios.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import time
+
+from installer import make_writable
+
+STORE_READ_SIZE = 1024 * 1024
+STORE_MEMORY_LIMIT = 64 * 1024 * 1024
+EXECUTABLE_SUFFIX = ".x"
+# Temp files younger than this may belong to an install still writing them
+TEMP_MAX_AGE = 3600
+# Linux FICLONE ioctl, clones a file's extents on btrfs/xfs (reflink)
+FICLONE = 0x40049409
+
+logger = logging.getLogger(__name__)
+
+
+def _reflink(source, target):
+    """Creates `target` as a copy-on-write clone of `source` where supported."""
+    if not sys.platform.startswith("linux"):
+        raise OSError("Reflinks are only supported on Linux")
+    import fcntl
+
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(target)
+            raise
+
+
+class ContentStore:
+    """Content-addressed file store shared by all installed builds.
+
+    Every file is stored once under its SHA-256 and installs are made of
+    hardlinks to the stored blobs, falling back to reflinks and then plain
+    copies when the install is on another filesystem. Blobs are read-only
+    so an install cannot change a file shared with other builds. A blob is
+    unreferenced once its link count drops to one, which is what `gc` uses.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.temp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.temp_dir, exist_ok=True)
+
+    def blob_path(self, key):
+        return os.path.join(self.objects_dir, key[:2], key)
+
+    def add(self, source, size, mode):
+        """Stores the data read from `source`, returns its key and the bytes written.
+
+        Small files are hashed in memory so data already in the store is
+        never written. The executable bit is part of the key because
+        hardlinked files share their permissions.
+        """
+        executable = bool(mode & 0o111)
+        if size <= STORE_MEMORY_LIMIT:
+            data = source.read()
+            key = self._key(hashlib.sha256(data).hexdigest(), executable)
+            path = self.blob_path(key)
+            if os.path.exists(path):
+                return key, 0
+            self._commit(path, executable, data=data)
+            return key, len(data)
+
+        # Large files are streamed to a temp file while hashing
+        digest = hashlib.sha256()
+        written = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.temp_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for block in iter(lambda: source.read(STORE_READ_SIZE), b""):
+                    digest.update(block)
+                    f.write(block)
+                    written += len(block)
+            key = self._key(digest.hexdigest(), executable)
+            path = self.blob_path(key)
+            if os.path.exists(path):
+                os.remove(temp_path)
+            else:
+                self._commit(path, executable, temp_path=temp_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return key, written
+
+    def _key(self, hexdigest, executable):
+        return hexdigest + (EXECUTABLE_SUFFIX if executable else "")
+
+    def _commit(self, path, executable, data=None, temp_path=None):
+        if temp_path is None:
+            fd, temp_path = tempfile.mkstemp(dir=self.temp_dir)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+        os.chmod(temp_path, 0o555 if executable else 0o444)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Another thread may store the same content concurrently; either
+        # copy is fine since both have the same content and mode.
+        os.replace(temp_path, path)
+
+    def materialize(self, key, target):
+        """Creates `target` from a blob, returns True if it shares the blob's data."""
+        path = self.blob_path(key)
+        if os.path.lexists(target):
+            make_writable(target)
+            os.remove(target)
+        try:
+            os.link(path, target)
+            return True
+        except OSError:
+            pass
+        try:
+            _reflink(path, target)
+            os.chmod(target, stat.S_IMODE(os.stat(path).st_mode) | stat.S_IWUSR)
+            return True
+        except OSError:
+            pass
+        shutil.copy2(path, target)
+        os.chmod(target, stat.S_IMODE(os.stat(path).st_mode) | stat.S_IWUSR)
+        return False
+
+    def gc(self, dry_run=False):
+        """Removes blobs no install links to anymore. Returns (count, bytes)."""
+        count = 0
+        freed = 0
+        for root, _, names in os.walk(self.objects_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                stat_result = os.stat(path)
+                if stat_result.st_nlink > 1:
+                    continue
+                count += 1
+                freed += stat_result.st_size
+                if not dry_run:
+                    make_writable(path)
+                    os.remove(path)
+        if not dry_run:
+            cutoff = time.time() - TEMP_MAX_AGE
+            for name in os.listdir(self.temp_dir):
+                path = os.path.join(self.temp_dir, name)
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        os.remove(path)
+                except OSError as e:
+                    logger.warning(f"Could not remove temp file {path}: {e}")
+        logger.info(f"Store garbage collection removed {count} blobs ({freed} bytes)")
+        return count, freed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Maintain the BlenderUpdater content store"
+    )
+    parser.add_argument("store", help="path of the content store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    gc_parser = subparsers.add_parser("gc", help="remove blobs no build uses")
+    gc_parser.add_argument(
+        "--dry-run", action="store_true", help="only report what would be removed"
+    )
+    args = parser.parse_args(argv)
+
+    store = ContentStore(args.store)
+    if args.command == "gc":
+        count, freed = store.gc(dry_run=args.dry_run)
+        action = "Would remove" if args.dry_run else "Removed"
+        print(f"{action} {count} unreferenced blobs, {freed / 1024 / 1024:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,16 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from buildindex import BUILD_FILENAME_REGEX, fetch_build_index
+from downloader import make_session
+
+
+def test_file_listing_keeps_plus_in_build_names(tmp_path):
+    name = "blender-4.2.0-alpha+main.a1b2c3d4e5f6-linux.x86_64-release.tar.xz"
+    (tmp_path / name).write_bytes(b"")
+    builds, _ = fetch_build_index(
+        make_session(), tmp_path.as_uri() + "/", BUILD_FILENAME_REGEX
+    )
+    assert [build.filename for build in builds] == [name]